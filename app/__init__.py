@@ -1,11 +1,17 @@
-from flask import Flask
+from flask import Flask, g
 from flask_login import LoginManager
-from app.extensions import mail, csrf, limiter, db, migrate, ext_celery
+from app.extensions import mail, csrf, limiter, db, migrate, ext_celery, redis_store
 import os
-import logging
-from logging.handlers import RotatingFileHandler
+from app.logging_config import configure_logging
+from app.metrics import init_metrics
+from app.assets import init_assets
+from app.compression import init_compression
+from app.viewcache import init_view_cache
+from app.dbrouting import init_db_routing, replica_allowed, use_replica
+from app.profiling import init_profiling
 from app.cli import check_status, send_test_email, create_admin, create_user, list_users, list_websites, \
-    list_user_websites, create_website
+    list_user_websites, create_website, rebuild_leaderboard, seed_scale, merge_duplicate_websites, compress_assets, \
+    clear_view_cache, webhooks_dead_letters
 from celery.schedules import crontab
 
 
@@ -26,21 +32,39 @@ def create_app(config_class=None):
     # Initialize Flask-Login
     login_manager = LoginManager(app)
     login_manager.login_view = 'auth.login'
+    login_manager.blueprint_login_views = {'api': None}  # API clients get a 401 instead of a redirect
 
     # Register user loader function
     from app.models.user import User
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))  # loads a user from the database based on the user ID.
+        # loads a user from the database based on the user ID; from a replica for reads that need not see fresh writes
+        with use_replica(replica_allowed()):
+            return User.query.get(int(user_id))
+
+    # The application context pushed above (for the CLI and Celery) is reused by every request on this thread instead
+    # of a fresh one, so ``g`` and the scoped DB session would otherwise carry over from one request to the next,
+    # e.g. Flask-Login's cached user and Flask-WTF's CSRF token.
+    @app.teardown_request
+    def reset_request_state(exc):
+        g.__dict__.clear()
+        db.session.remove()
 
     # Initialize extensions
     db.init_app(app)
+    init_db_routing(app, db)
     migrate.init_app(app, db)
     mail.init_app(app)
     csrf.init_app(app)
     login_manager.init_app(app)
     limiter.init_app(app)
     ext_celery.init_app(app)
+    redis_store.init_app(app)
+    init_metrics(app)
+    init_assets(app)
+    init_compression(app)
+    init_view_cache(app)
+    init_profiling(app)
 
     # Schedule periodic task for Celery beat
     if not app.config['TESTING']:
@@ -48,20 +72,16 @@ def create_app(config_class=None):
             'check_website_status': {
                 'task': 'app.main.routes.check_website_status',
                 'schedule': crontab(minute='*/10')  # Run every 10 minute
+            },
+            'restore_leaderboards': {
+                'task': 'app.games.routes.restore_leaderboards',
+                'schedule': crontab(minute=5)  # Hourly; Redis evicts keys under memory pressure (allkeys-lru)
             }
         }
     # Set up logging
     if not app.debug:
-        if not os.path.exists('logs'):
-            os.mkdir('logs')
-
-        file_handler = RotatingFileHandler('logs/FlaskWatchdog.log', maxBytes=10240, backupCount=10)
-        file_handler.setFormatter(
-            logging.Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
-        file_handler.setLevel(logging.INFO)
-        app.logger.addHandler(file_handler)
-        app.logger.setLevel(logging.INFO)
-        app.logger.info('FlaskWatchdog')  # Sets up logging for the Flask application.
+        configure_logging(app)  # JSON records, written to a rotating file by a background queue listener.
+        app.logger.info('FlaskWatchdog')
 
     # Register custom commands
     app.cli.add_command(check_status)
@@ -72,6 +92,12 @@ def create_app(config_class=None):
     app.cli.add_command(list_websites)
     app.cli.add_command(list_user_websites)
     app.cli.add_command(create_website)
+    app.cli.add_command(rebuild_leaderboard)
+    app.cli.add_command(seed_scale)
+    app.cli.add_command(merge_duplicate_websites)
+    app.cli.add_command(compress_assets)
+    app.cli.add_command(clear_view_cache)
+    app.cli.add_command(webhooks_dead_letters)
 
     # Register blueprints
     from app.errors import errors_bp
@@ -86,6 +112,9 @@ def create_app(config_class=None):
     from app.games import games_bp
     app.register_blueprint(games_bp)
 
+    from app.api import api_bp
+    app.register_blueprint(api_bp)
+
     # Add objects to Flask shell context shell context for flask cli
     # Therefore there's no need to import db via from app import db in Flask shell? Those are added to the
     # shell context with shell_context_processor in the create_app function.
@@ -0,0 +1,160 @@
+import hashlib
+import json
+from urllib.parse import urlsplit
+
+from flask import abort, current_app, jsonify, request
+from flask_login import login_required, current_user
+
+from app.api import api_bp
+from app.extensions import db, limiter, redis_store
+from app.main.checks import request_check, FRESH, UNAVAILABLE
+from app.main.health import STATUS_VERSION_KEY, new_status_version
+from app.main.webhooks import UnsafeDestination, check_destination
+from app.models.userwebsite import UserWebsite
+from app.models.webhook import WebhookEndpoint
+from app.models.website import Website
+
+
+def _status_version():
+    """
+    Current status version, or None when Redis cannot be reached. A missing key (never set, or evicted) is seeded
+    with a fresh random version, so ETags handed out before it went missing never match again.
+    """
+    try:
+        with redis_store.pipeline(transaction=False) as pipe:
+            pipe.set(STATUS_VERSION_KEY, new_status_version(), nx=True)
+            pipe.get(STATUS_VERSION_KEY)
+            _, version = pipe.execute()
+        return version.decode()
+    except Exception as e:
+        current_app.logger.warning("Could not read the status version: %s", e)
+        return None
+
+
+def _websites_payload(user_id):
+    rows = db.session.query(Website.id, Website.url, Website.status, Website.last_checked, UserWebsite.last_notified) \
+        .join(UserWebsite, UserWebsite.website_id == Website.id) \
+        .filter(UserWebsite.user_id == user_id) \
+        .order_by(Website.id)
+    return [{
+        'id': website_id,
+        'url': url,
+        'status': 'up' if status else 'down',
+        'last_checked': last_checked.isoformat() if last_checked else None,
+        'last_notified': last_notified.isoformat() if last_notified else None,
+    } for website_id, url, status, last_checked, last_notified in rows]
+
+
+def _etag(*parts):
+    return hashlib.sha1(json.dumps(parts, separators=(',', ':'), default=str).encode()).hexdigest()
+
+
+@api_bp.route('/websites', methods=['GET'])
+@login_required
+@limiter.limit("120 per minute")
+def websites():
+    """
+    Status of the current user's websites as JSON, with conditional GET support.
+
+    The ETag is derived from the status version (renewed after every write to the fields returned here) and the
+    user's subscription ids, so a poller that sends ``If-None-Match`` gets a 304 after one Redis round trip and one
+    index-only query, without the payload being built. When Redis is unavailable the ETag falls
+    back to a hash of the payload, which still saves the transfer.
+    """
+    cache_control = f"private, max-age={current_app.config['API_CACHE_MAX_AGE']}, must-revalidate"
+    version = _status_version()
+    payload = None
+    if version is not None:
+        website_ids = sorted(website_id for website_id, in
+                             db.session.query(UserWebsite.website_id).filter_by(user_id=current_user.id))
+        etag = _etag(version, website_ids)
+    else:
+        payload = _websites_payload(current_user.id)
+        etag = _etag(payload)
+
+    # Weak comparison: the compression middleware weakens the ETag of a compressed response (W/"..."), and the
+    # client echoes that back.
+    if request.if_none_match.contains_weak(etag):
+        return '', 304, {'ETag': f'"{etag}"', 'Cache-Control': cache_control}
+
+    if payload is None:
+        payload = _websites_payload(current_user.id)
+    response = jsonify({'websites': payload})
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+@api_bp.route('/websites/<int:website_id>/check', methods=['POST'])
+@login_required
+@limiter.limit("10 per minute")
+def check_website(website_id):
+    """
+    Probe one of the current user's websites now.
+
+    Answers 200 with the stored status when it is recent enough to reuse, otherwise 202 (``queued``, or
+    ``in_progress`` when another request already triggered the probe); the result arrives on the SSE stream and in
+    this API once stored. 503 when checks cannot be queued.
+    """
+    website = Website.query.join(UserWebsite) \
+        .filter(UserWebsite.user_id == current_user.id, Website.id == website_id).first()
+    if website is None:
+        abort(404)
+    state = request_check(website)
+    body = {
+        'state': state,
+        'status': 'up' if website.status else 'down',
+        'last_checked': website.last_checked.isoformat() if website.last_checked else None,
+    }
+    if state == UNAVAILABLE:
+        return jsonify(body), 503, {'Retry-After': '30'}
+    return jsonify(body), 200 if state == FRESH else 202
+
+
+@api_bp.route('/webhooks', methods=['GET'])
+@login_required
+@limiter.limit("60 per minute")
+def list_webhooks():
+    endpoints = WebhookEndpoint.query.filter_by(user_id=current_user.id).order_by(WebhookEndpoint.id)
+    return jsonify({'webhooks': [endpoint.to_dict() for endpoint in endpoints]})
+
+
+@api_bp.route('/webhooks', methods=['POST'])
+@login_required
+@limiter.limit("10 per minute")
+def create_webhook():
+    """
+    Register a webhook endpoint for the current user's websites. The response carries the signing secret; it is not
+    shown again.
+
+    Every delivery is a POST of ``{"delivery_id": ..., "events": [...]}`` with the headers ``X-Watchdog-Delivery``,
+    ``X-Watchdog-Timestamp`` and ``X-Watchdog-Signature: sha256=<hex>``, the HMAC-SHA256 of
+    ``"<timestamp>.<body>"`` keyed with the secret.
+    """
+    url = ((request.get_json(silent=True) or {}).get('url') or '').strip()
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname or len(url) > 500:
+        return jsonify({'error': 'url must be an absolute http(s) URL'}), 400
+    try:
+        check_destination(url)
+    except UnsafeDestination as e:
+        return jsonify({'error': str(e)}), 400
+    if WebhookEndpoint.query.filter_by(user_id=current_user.id).count() >= current_app.config['WEBHOOK_MAX_PER_USER']:
+        return jsonify({'error': 'Too many webhook endpoints'}), 400
+
+    endpoint = WebhookEndpoint(user_id=current_user.id, url=url)
+    db.session.add(endpoint)
+    db.session.commit()
+    return jsonify(dict(endpoint.to_dict(), secret=endpoint.secret)), 201
+
+
+@api_bp.route('/webhooks/<int:webhook_id>', methods=['DELETE'])
+@login_required
+@limiter.limit("10 per minute")
+def delete_webhook(webhook_id):
+    endpoint = WebhookEndpoint.query.filter_by(id=webhook_id, user_id=current_user.id).first()
+    if endpoint is None:
+        abort(404)
+    db.session.delete(endpoint)
+    db.session.commit()
+    return '', 204
@@ -0,0 +1,95 @@
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+from flask import abort, current_app, request, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+from app.compression import ENCODING_SUFFIXES, accepted_encodings
+
+# Fingerprinted URLs never change content, so browsers and proxies may keep them for a year without revalidating.
+IMMUTABLE = 'public, max-age=31536000, immutable'
+_FINGERPRINTED = re.compile(r'^(?P<stem>.+)\.(?P<digest>[0-9a-f]{12})(?P<ext>\.[A-Za-z0-9]+)$')
+
+
+class AssetFingerprints:
+    """
+    Content hashes of the files under the static folder, computed on first use and cached for the process.
+    In debug mode a file is re-hashed when its modification time changes, so edits show up on reload.
+    """
+
+    def __init__(self):
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def digest(self, filename):
+        path = safe_join(current_app.static_folder, filename)
+        if path is None:
+            raise ValueError(f"Asset outside the static folder: {filename}")
+        cached = self._digests.get(filename)
+        if cached is not None and not current_app.debug:
+            return cached[1]
+        mtime = os.stat(path).st_mtime_ns
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with open(path, 'rb') as asset:
+            digest = hashlib.sha256(asset.read()).hexdigest()[:12]
+        with self._lock:
+            self._digests[filename] = (mtime, digest)
+        return digest
+
+
+fingerprints = AssetFingerprints()
+
+
+def asset_url(filename):
+    """
+    URL of a static file with its content hash in the name, e.g. ``/assets/js/dashboard.3fa2c81b0d9e.js``.
+    Use it in templates instead of ``url_for('static', ...)`` for anything that should be cached long-term.
+    """
+    stem, ext = os.path.splitext(filename)
+    return url_for('asset', filename=f'{stem}.{fingerprints.digest(filename)}{ext}')
+
+
+def serve_asset(filename):
+    match = _FINGERPRINTED.match(filename)
+    if not match:
+        abort(404)
+    original = match.group('stem') + match.group('ext')
+    try:
+        current = fingerprints.digest(original)
+    except (OSError, ValueError):
+        abort(404)
+    response = _send_precompressed(original) or send_from_directory(current_app.static_folder, original)
+    response.vary.add('Accept-Encoding')
+    # A stale hash (a page rendered before a deploy) still gets the file, but must not be cached as immutable.
+    response.headers['Cache-Control'] = IMMUTABLE if match.group('digest') == current else 'no-cache'
+    return response
+
+
+def _send_precompressed(filename):
+    """
+    Send the build-time ``.br``/``.gz`` variant of ``filename`` if the client accepts it and it is up to date.
+    """
+    accepted = accepted_encodings(request.headers.get('Accept-Encoding'))
+    path = safe_join(current_app.static_folder, filename)
+    for encoding, suffix in ENCODING_SUFFIXES:
+        if encoding not in accepted:
+            continue
+        try:
+            if os.stat(path + suffix).st_mtime_ns < os.stat(path).st_mtime_ns:
+                continue
+        except OSError:
+            continue
+        response = send_from_directory(current_app.static_folder, filename + suffix)
+        response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response.content_encoding = encoding
+        return response
+    return None
+
+
+def init_assets(app):
+    app.add_url_rule('/assets/<path:filename>', 'asset', serve_asset)
+    app.add_template_global(asset_url)
@@ -8,10 +8,13 @@ from app.forms import LoginForm, RegisterForm, AdminUserForm, UpdateEmailForm
 from app.auth import auth_bp
 from app.models.userwebsite import UserWebsite
 from app.models.website import Website
+from app.viewcache import cached_view
+from app.dbrouting import read_replica
 
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
 @limiter.limit("100 per minute")
+@cached_view('auth.login', anonymous_only=True)
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('main.dashboard'))
@@ -73,6 +76,7 @@ def logout():
 @auth_bp.route('/admin', methods=['GET', 'POST'])
 @login_required
 @limiter.limit("50 per minute")
+@read_replica
 def admin():
     if not current_user.is_admin:
         abort(403)
@@ -1,18 +1,166 @@
+import json
+import multiprocessing
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+
 import click
-from app.extensions import db
-from app.models.website import Website
+from app.extensions import db, redis_store
+from app.models.website import Website, normalize_url
 from app.models.userwebsite import UserWebsite
 from app.models.user import User
-from app.main.routes import check_website_status, send_email
+from app.games.routes import rebuild_leaderboards
+from app.main.routes import check_website_status, run_sweep, send_email
+from app.main.health import bump_status_version, record_sweep_completed
+from app.compression import precompress
+from app.dbrouting import use_replica
+from app import viewcache
+from app.main import webhooks
+from flask import current_app
 from flask.cli import FlaskGroup
 
 cli = FlaskGroup()
 
 
+class _SweepStats:
+    """
+    Probe counters and latencies of a local sweep, fed from the probe threads (or from the shard processes).
+    """
+
+    def __init__(self, total):
+        self.total = total
+        self.latencies = []
+        self.down = 0
+        self.errors = 0
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    def record(self, status, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+            if status is None:
+                self.errors += 1
+            elif not status:
+                self.down += 1
+
+    def progress_line(self):
+        done = len(self.latencies)
+        rate = done / max(time.monotonic() - self.started, 1e-9)
+        return f"{done}/{self.total} checked  {rate:.1f} sites/s  {self.down} down  {self.errors} errors"
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        samples = sorted(self.latencies)
+        lines = [f"Checked {len(samples)} websites in {elapsed:.1f}s "
+                 f"({len(samples) / max(elapsed, 1e-9):.1f} sites/s), {self.down} down, {self.errors} errors"]
+        if samples:
+            p50, p90, p99 = (samples[min(len(samples) - 1, len(samples) * pct // 100)] * 1000 for pct in (50, 90, 99))
+            lines.append(f"Probe latency p50 {p50:.0f} ms, p90 {p90:.0f} ms, p99 {p99:.0f} ms, "
+                         f"max {samples[-1] * 1000:.0f} ms")
+        return '\n'.join(lines)
+
+
+def _sweep_shard(app, shard, events):
+    # Runs in a forked child: report every probe to the parent, then the shard's outcome when done. The error goes
+    # as text: an exception that cannot be pickled would be dropped by the queue and the parent never told.
+    try:
+        with app.app_context():
+            run_sweep(shard=shard, on_probe=lambda status, seconds: events.put((status, seconds)))
+        events.put({'shard': shard[0], 'error': None})
+    except Exception as e:
+        events.put({'shard': shard[0], 'error': f'{type(e).__name__}: {e}'})
+
+
+def _run_local_sweep(app, processes, stats):
+    if processes <= 1:
+        errors = []
+
+        def sweep():
+            try:
+                with app.app_context():
+                    run_sweep(on_probe=stats.record)
+            except Exception as e:
+                errors.append(e)
+
+        worker = threading.Thread(target=sweep, name='local-sweep', daemon=True)
+        worker.start()
+        while worker.is_alive():
+            yield
+            worker.join(0.5)
+        if errors:
+            raise click.ClickException(f"Sweep failed: {errors[0]}")
+        return
+
+    # Forked children must not share the parent's database connections: close the pool before forking.
+    db.session.remove()
+    db.engine.dispose()
+    context = multiprocessing.get_context('fork')
+    events = context.Queue()
+    children = [context.Process(target=_sweep_shard, args=(app, (index, processes), events), daemon=True)
+                for index in range(processes)]
+    for child in children:
+        child.start()
+    running, exited, failures = set(range(processes)), set(), []
+    while running:
+        try:
+            event = events.get(timeout=0.5)
+        except queue.Empty:
+            # A child killed (OOM, segfault) before reporting its outcome never will. Its outcome is given up on at
+            # the second empty poll after it exited, so one still in the queue's pipe is not missed.
+            for index in sorted(running):
+                if children[index].exitcode is None:
+                    continue
+                if index in exited:
+                    running.discard(index)
+                    failures.append(f"shard {index} exited with code {children[index].exitcode}")
+                exited.add(index)
+            yield
+            continue
+        if isinstance(event, dict):
+            running.discard(event['shard'])
+            if event['error'] is not None:
+                failures.append(event['error'])
+        else:
+            stats.record(*event)
+    for child in children:
+        child.join()
+    if failures:
+        raise click.ClickException(f"{len(failures)} shard(s) failed: {failures[0]}")
+    # Each shard only swept its part: the sweep as a whole completed once all of them did
+    record_sweep_completed()
+
+
 @cli.command('check-status')
-def check_status():
-    check_website_status.apply_async()
-    click.echo('Website status checked')
+@click.option('--local', is_flag=True, help='Run the sweep in this process instead of queueing it on Celery')
+@click.option('--threads', default=None, type=int, help='Concurrent probes per process (default PROBE_CONCURRENCY)')
+@click.option('--processes', default=1, show_default=True, help='Processes sharing the sweep, each with --threads')
+def check_status(local, threads, processes):
+    """Queue a website status sweep, or with --local run one right here and report progress and latency."""
+    if not local:
+        check_website_status.apply_async()
+        click.echo('Website status checked')
+        return
+
+    app = current_app._get_current_object()
+    # In-process means no broker: probe from here even when probe locations are configured.
+    app.config['PROBE_LOCATIONS'] = []
+    if threads:
+        app.config['PROBE_CONCURRENCY'] = threads
+    stats = _SweepStats(db.session.query(Website.id).count())
+    interactive = sys.stderr.isatty()
+    last_printed = time.monotonic()
+    for _ in _run_local_sweep(app, processes, stats):
+        if interactive:
+            click.echo('\r' + stats.progress_line() + '   ', nl=False, err=True)
+        elif time.monotonic() - last_printed >= 10:
+            click.echo(stats.progress_line(), err=True)
+            last_printed = time.monotonic()
+    if interactive:
+        click.echo('\r' + stats.progress_line(), err=True)
+    click.echo(stats.summary())
 
 
 @cli.command('send-test-email')
@@ -40,21 +188,24 @@ def create_admin(email, password):
 
 @cli.command('list-users')
 def list_users():
-    users = User.query.all()
+    with use_replica():
+        users = User.query.all()
     for user in users:
         click.echo(f"User ID: {user.id}, Email: {user.email}, Is Admin: {user.is_admin}")
 
 
 @cli.command('list-websites')
 def list_websites():
-    websites = Website.query.all()
+    with use_replica():
+        websites = Website.query.all()
     for website in websites:
         click.echo(f"Website ID: {website.id}, URL: {website.url}, Status: {website.status}")
 
 
 @cli.command('list-user-websites')
 def list_user_websites():
-    user_websites = UserWebsite.query.all()
+    with use_replica():
+        user_websites = UserWebsite.query.all()
     for user_website in user_websites:
         click.echo(f"User ID: {user_website.user_id}, Website ID: {user_website.website_id}, "
                    f"Last Notified: {user_website.last_notified}, Created At: {user_website.last_notified}")
@@ -79,14 +230,8 @@ def create_user(email, password):
 @cli.command('create-website')
 @click.option('--url', prompt=True, help='The URL of the website to be added')
 def create_website(url):
-    # Ensure the URL has a scheme (http or https)
-    if not (url.startswith("http://") or url.startswith("https://")):
-        url = "http://" + url
-
-    # Parse the URL and extract the domain name
-    from urllib.parse import urlparse
-    parsed_url = urlparse(url)
-    domain_name = parsed_url.netloc
+    # Reduce the URL to the canonical host[:port] form stored in Website.url
+    domain_name = normalize_url(url, fold_www=current_app.config['WEBSITE_FOLD_WWW'])
 
     if not domain_name:
         click.echo("Invalid URL. Please provide a valid URL, e.g. domain name only.")
@@ -125,5 +270,164 @@ def create_website(url):
         click.echo("No users available in the database")
 
 
+@cli.command('rebuild-leaderboard')
+def rebuild_leaderboard():
+    games = rebuild_leaderboards()
+    for game in games:
+        click.echo(f"Leaderboard rebuilt for {game}")
+    if not games:
+        click.echo('No game scores in the database')
+
+
+@cli.command('merge-duplicate-websites')
+@click.option('--fold-www', is_flag=True, help='Also merge www.example.com into example.com')
+@click.option('--dry-run', is_flag=True, help='Only report what would be merged')
+def merge_duplicate_websites(fold_www, dry_run):
+    """Normalise stored website URLs and merge the rows that turn out to be the same website."""
+    fold_www = fold_www or current_app.config['WEBSITE_FOLD_WWW']
+    groups = {}
+    for website_id, url in db.session.query(Website.id, Website.url).order_by(Website.id).yield_per(5000):
+        groups.setdefault(normalize_url(url, fold_www=fold_www), []).append((website_id, url))
+
+    merged = renamed = 0
+    for canonical, rows in groups.items():
+        if not canonical or (len(rows) == 1 and rows[0][1] == canonical):
+            continue
+        # Keep the row that already has the canonical URL, otherwise the oldest one
+        survivor_id = next((website_id for website_id, url in rows if url == canonical), rows[0][0])
+        duplicate_ids = [website_id for website_id, _ in rows if website_id != survivor_id]
+        click.echo(f"{canonical}: keeping #{survivor_id}, merging {', '.join(f'#{i}' for i in duplicate_ids) or '-'}")
+        if dry_run:
+            continue
+
+        subscribed = {link.user_id: link for link in UserWebsite.query.filter_by(website_id=survivor_id)}
+        for link in UserWebsite.query.filter(UserWebsite.website_id.in_(duplicate_ids)).order_by(UserWebsite.id):
+            kept = subscribed.get(link.user_id)
+            if kept is None:
+                link.website_id = survivor_id
+                subscribed[link.user_id] = link
+                continue
+            # The user followed both spellings: keep one link with the latest notification time
+            if link.last_notified and (kept.last_notified is None or link.last_notified > kept.last_notified):
+                kept.last_notified = link.last_notified
+            db.session.delete(link)
+        db.session.flush()
+        Website.query.filter(Website.id.in_(duplicate_ids)).delete(synchronize_session=False)
+        db.session.flush()
+        Website.query.filter_by(id=survivor_id).update({'url': canonical}, synchronize_session=False)
+        db.session.commit()
+        merged += len(duplicate_ids)
+        renamed += 1
+
+    if renamed and not dry_run:
+        bump_status_version()
+    action = 'Would merge' if dry_run else 'Merged'
+    click.echo(f"{action} {merged} duplicate websites into {renamed} canonical ones")
+
+
+@cli.command('compress-assets')
+def compress_assets():
+    """Write gzip and brotli variants of the static assets, served instead of compressing on every request."""
+    written = precompress(current_app.static_folder)
+    click.echo(f"Precompressed {written} files in {current_app.static_folder}")
+
+
+@cli.command('clear-view-cache')
+@click.argument('namespaces', nargs=-1)
+def clear_view_cache(namespaces):
+    """Drop the cached pages of the given views (default: all of them), e.g. after a deploy."""
+    for namespace in namespaces or sorted(viewcache.CACHED_NAMESPACES):
+        viewcache.invalidate(namespace)
+        click.echo(f"View cache cleared for {namespace}")
+
+
+@cli.command('webhooks-dead-letters')
+@click.option('--replay', is_flag=True, help='Queue the dead-lettered batches for delivery again')
+@click.option('--limit', default=1000, show_default=True, help='Batches to show or replay, oldest first')
+def webhooks_dead_letters(replay, limit):
+    """Show the webhook batches that failed for good, or queue them again once the receivers are fixed."""
+    if replay:
+        click.echo(f"Replayed {webhooks.replay_dead_letters(limit)} webhook batches")
+        return
+    letters = [json.loads(data) for data in reversed(redis_store.lrange(webhooks.DEAD_LETTER_KEY, -limit, -1))]
+    for letter in letters:
+        click.echo(f"{letter['failed_at']} endpoint #{letter['endpoint_id']} {len(letter['events'])} events: "
+                   f"{letter['error']}")
+    click.echo(f"{len(letters)} dead-lettered webhook batches")
+
+
+SEED_EMAIL = 'seed-user-{}@example.com'
+SEED_ADMIN_EMAIL = 'seed-admin@example.com'
+SEED_URL = 'seed-site-{}.example.com'
+
+
+def _insert_in_chunks(table, rows, chunk_size=5000):
+    for start in range(0, len(rows), chunk_size):
+        db.session.execute(table.insert(), rows[start:start + chunk_size])
+    db.session.commit()
+
+
+@cli.command('seed-scale')
+@click.option('--users', default=1000, show_default=True, help='Number of regular users to create')
+@click.option('--websites', default=50000, show_default=True, help='Number of websites to create')
+@click.option('--power-users', default=5, show_default=True, help='Users subscribed to --power-user-sites sites')
+@click.option('--power-user-sites', default=5000, show_default=True)
+@click.option('--sites-per-user', default=5, show_default=True,
+              help='Scale of the Pareto-distributed number of sites of a regular user')
+@click.option('--password', default='seed-password', show_default=True, help='Password of every seeded user')
+@click.option('--seed', 'random_seed', default=0, show_default=True, help='Random seed, for reproducible data')
+@click.option('--reset', is_flag=True, help='Delete previously seeded rows first')
+def seed_scale(users, websites, power_users, power_user_sites, sites_per_user, password, random_seed, reset):
+    """Bulk-generate users, websites and links with a production-like skew."""
+    seeded = User.query.filter(User.email.like('seed-%@example.com'))
+    if reset:
+        seed_website_ids = db.session.query(Website.id).filter(Website.url.like('seed-site-%'))
+        UserWebsite.query.filter(UserWebsite.website_id.in_(seed_website_ids)).delete(synchronize_session=False)
+        UserWebsite.query.filter(UserWebsite.user_id.in_(seeded.with_entities(User.id))) \
+            .delete(synchronize_session=False)
+        Website.query.filter(Website.url.like('seed-site-%')).delete(synchronize_session=False)
+        seeded.delete(synchronize_session=False)
+        db.session.commit()
+    elif seeded.first():
+        click.echo('Seed data already present, run with --reset to replace it')
+        return
+
+    rng = random.Random(random_seed)
+    now = datetime.utcnow()
+
+    # Hashing is deliberately slow, so every seeded account shares one hash.
+    admin = User(email=SEED_ADMIN_EMAIL, is_admin=True)
+    admin.set_password(password)
+    db.session.add(admin)
+    db.session.commit()
+    _insert_in_chunks(User.__table__, [
+        {'email': SEED_EMAIL.format(n), 'password_hash': admin.password_hash, 'is_admin': False,
+         '_remaining_notifications': 30}
+        for n in range(users)
+    ])
+    _insert_in_chunks(Website.__table__, [
+        {'url': SEED_URL.format(n), 'status': rng.random() < 0.9} for n in range(websites)
+    ])
+    click.echo(f"Created {users} users and {websites} websites")
+
+    user_ids = [user_id for user_id, in db.session.query(User.id).filter(User.email.like('seed-user-%'))
+                .order_by(User.id)]
+    website_ids = [website_id for website_id, in db.session.query(Website.id)
+                   .filter(Website.url.like('seed-site-%')).order_by(Website.id)]
+
+    links = []
+    for position, user_id in enumerate(user_ids):
+        if position < power_users:
+            chosen = rng.sample(website_ids, min(power_user_sites, len(website_ids)))
+        else:
+            # Pareto-distributed site count per user, and a popularity skew towards the low website indices
+            # so that some sites are shared by many users.
+            count = min(int(sites_per_user * rng.paretovariate(1.5)), len(website_ids))
+            chosen = {website_ids[int(len(website_ids) * rng.random() ** 3)] for _ in range(count)}
+        links.extend({'user_id': user_id, 'website_id': website_id, 'created_at': now} for website_id in chosen)
+    _insert_in_chunks(UserWebsite.__table__, links)
+    click.echo(f"Created {len(links)} user-website links ({power_users} power users)")
+
+
 if __name__ == '__main__':
     cli()
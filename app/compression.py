@@ -0,0 +1,206 @@
+import gzip
+import os
+import zlib
+
+from werkzeug.wsgi import ClosingIterator
+
+try:
+    import brotli
+except ImportError:  # optional: without it, responses and assets are gzip-only
+    brotli = None
+
+COMPRESSIBLE_TYPES = frozenset((
+    'text/html', 'text/css', 'text/plain', 'text/xml', 'text/javascript', 'application/javascript',
+    'application/json', 'application/xml', 'image/svg+xml',
+))
+PRECOMPRESS_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.html')
+# Precompressed variants, in order of preference, with the file suffix each one is stored under.
+ENCODING_SUFFIXES = (('br', '.br'), ('gzip', '.gz'))
+
+
+def accepted_encodings(accept_encoding):
+    """
+    The content codings of an Accept-Encoding header that the client accepts (q > 0), lower-cased.
+    """
+    accepted = set()
+    for item in (accept_encoding or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding and quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def choose_encoding(accept_encoding):
+    accepted = accepted_encodings(accept_encoding)
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+
+class _Compressor:
+    __slots__ = ('encoding', '_compressor')
+
+    def __init__(self, encoding, gzip_level, brotli_quality):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)  # 31: gzip container
+
+    def chunk(self, data):
+        """
+        Compress ``data`` and flush, so the client can decode everything sent so far.
+        """
+        if self.encoding == 'br':
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data=b''):
+        if self.encoding == 'br':
+            return self._compressor.process(data) + self._compressor.finish()
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+def _vary_on_accept_encoding(headers):
+    for index, (name, value) in enumerate(headers):
+        if name.lower() == 'vary':
+            if 'accept-encoding' not in value.lower() and value.strip() != '*':
+                headers[index] = (name, value + ', Accept-Encoding')
+            return
+    headers.append(('Vary', 'Accept-Encoding'))
+
+
+class CompressionMiddleware:
+    """
+    Compress responses whose content type is on an allowlist and whose body is at least ``min_size`` bytes, with
+    brotli when the client accepts it and the ``brotli`` package is installed, gzip otherwise.
+
+    A response with a Content-Length is compressed in one go. A streamed one (no Content-Length) is compressed chunk
+    by chunk with a flush after every chunk, so nothing is held back from the client. Server-Sent Events are not on
+    the allowlist: proxies and browsers handle compressed event streams poorly and the events are tiny. A HEAD
+    request is negotiated like a GET and gets the same Content-Encoding, Vary and ETag headers.
+    """
+    def __init__(self, app, min_size=500, gzip_level=6, brotli_quality=4, mimetypes=COMPRESSIBLE_TYPES):
+        self.app = app
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.mimetypes = mimetypes
+
+    def __call__(self, environ, start_response):
+        encoding = choose_encoding(environ.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None:
+            return self.app(environ, start_response)
+
+        deferred = {}
+
+        def compressing_start_response(status, headers, exc_info=None):
+            if not self._should_compress(status, headers):
+                return start_response(status, headers, exc_info)
+            deferred.update(status=status, headers=list(headers), exc_info=exc_info)
+
+            def write(data):
+                raise RuntimeError("write() is not supported for compressed responses")
+            return write
+
+        app_iter = self.app(environ, compressing_start_response)
+        if not deferred:
+            return app_iter
+
+        headers = deferred['headers']
+        length = next((value for name, value in headers if name.lower() == 'content-length'), None)
+        if length is not None and int(length) < self.min_size:
+            _vary_on_accept_encoding(headers)
+            start_response(deferred['status'], headers, deferred['exc_info'])
+            return app_iter
+
+        headers = [(name, value) for name, value in headers if name.lower() != 'content-length']
+        headers.append(('Content-Encoding', encoding))
+        _vary_on_accept_encoding(headers)
+        # The compressed body is a different representation: only weak comparison may match it.
+        headers = [(name, value if name.lower() != 'etag' or value.startswith('W/') else 'W/' + value)
+                   for name, value in headers]
+
+        if environ.get('REQUEST_METHOD') == 'HEAD':
+            # The headers a GET would get, without the Content-Length: the compressed size is unknown without a body
+            start_response(deferred['status'], headers, deferred['exc_info'])
+            return app_iter
+
+        compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+        if length is not None:
+            try:
+                body = compressor.finish(b''.join(app_iter))
+            finally:
+                if hasattr(app_iter, 'close'):
+                    app_iter.close()
+            headers.append(('Content-Length', str(len(body))))
+            start_response(deferred['status'], headers, deferred['exc_info'])
+            return [body]
+
+        start_response(deferred['status'], headers, deferred['exc_info'])
+        return ClosingIterator(self._stream(app_iter, compressor), getattr(app_iter, 'close', None))
+
+    def _should_compress(self, status, headers):
+        code = int(status.split(' ', 1)[0])
+        if code < 200 or code in (204, 206, 304):
+            return False
+        content_type = ''
+        for name, value in headers:
+            lowered = name.lower()
+            if lowered == 'content-encoding':
+                return False
+            if lowered == 'content-type':
+                content_type = value.split(';', 1)[0].strip().lower()
+        return content_type in self.mimetypes
+
+    @staticmethod
+    def _stream(app_iter, compressor):
+        for data in app_iter:
+            if data:
+                yield compressor.chunk(data)
+        yield compressor.finish()
+
+
+def precompress(directory, brotli_quality=11, gzip_level=9, min_size=256):
+    """
+    Write ``.gz`` (and with brotli installed ``.br``) siblings of the text assets under ``directory`` that are
+    missing or older than their source. Returns the number of files written.
+    """
+    written = 0
+    for root, _, files in os.walk(directory):
+        for filename in files:
+            if not filename.endswith(PRECOMPRESS_EXTENSIONS):
+                continue
+            path = os.path.join(root, filename)
+            if os.path.getsize(path) < min_size:
+                continue
+            with open(path, 'rb') as source:
+                data = source.read()
+            variants = {'.gz': lambda: gzip.compress(data, compresslevel=gzip_level, mtime=0)}
+            if brotli is not None:
+                variants['.br'] = lambda: brotli.compress(data, quality=brotli_quality)
+            for suffix, compress in variants.items():
+                target = path + suffix
+                if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                    continue
+                with open(target, 'wb') as out:
+                    out.write(compress())
+                written += 1
+    return written
+
+
+def init_compression(app):
+    if not app.config['COMPRESS_ENABLED']:
+        return
+    app.wsgi_app = CompressionMiddleware(app.wsgi_app, min_size=app.config['COMPRESS_MIN_SIZE'],
+                                         gzip_level=app.config['COMPRESS_GZIP_LEVEL'],
+                                         brotli_quality=app.config['COMPRESS_BROTLI_QUALITY'])
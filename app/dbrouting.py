@@ -0,0 +1,148 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, request, session
+from flask_login import current_user
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from sqlalchemy.sql import Select
+
+# Replica binds are the SQLALCHEMY_BINDS keys with this prefix (see DATABASE_REPLICA_URIS in config.py).
+REPLICA_BIND_PREFIX = 'replica'
+# Set in the user's session after a request that wrote to the database: until then their reads stay on the primary.
+STICKY_SESSION_KEY = '_db_primary_until'
+# Seconds a replica is behind its primary, per dialect; DB_REPLICA_LAG_QUERY overrides it. With none, the lag is
+# taken to be 0 (e.g. two local SQLite files).
+LAG_QUERIES = {
+    'postgresql': "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                  "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END",
+}
+
+
+class RoutingSession(Session):
+    """
+    Session sending SELECTs to a read replica while replica reads are enabled for it (``use_replica``), and
+    everything else to the primary.
+
+    Reads stay on the primary once the session has written anything (flush, bulk update or delete, raw SQL), so a
+    request always sees its own changes, and when no replica is within DB_REPLICA_MAX_LAG of the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if self._flushing or (clause is not None and not isinstance(clause, Select)):
+            # Raw SQL (text()) may write too; counting it as a write only costs replica reads.
+            self.info['wrote'] = True
+        elif bind is None and clause is not None and self.info.get('replica') and not self.info.get('wrote'):
+            engine = self._replica_engine()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _replica_engine(self):
+        router = current_app.extensions.get('db_routing')
+        if router is None or not router.replicas:
+            return None
+        # One replica per session, so the reads of a request see a single point in time
+        key = self.info.get('replica_key')
+        if key is None or not router.is_fresh(key):
+            fresh = router.fresh_replicas()
+            if not fresh:
+                return None
+            key = self.info['replica_key'] = random.choice(fresh)
+        return self._db.engines[key]
+
+
+class ReplicaRouter:
+    """
+    Knows the replica binds and how far behind the primary each one is. The lag is measured at most every
+    DB_REPLICA_LAG_CHECK_INTERVAL seconds per process; a replica that cannot be reached counts as lagging.
+    """
+
+    def __init__(self, app, db):
+        self.db = db
+        self.replicas = sorted(key for key in app.config['SQLALCHEMY_BINDS'] if key.startswith(REPLICA_BIND_PREFIX))
+        self.max_lag = app.config['DB_REPLICA_MAX_LAG']
+        self.check_interval = app.config['DB_REPLICA_LAG_CHECK_INTERVAL']
+        self.lag_query = app.config['DB_REPLICA_LAG_QUERY']
+        self._lags = {}  # bind key -> (measured at, lag in seconds or None)
+        self._lock = threading.Lock()
+
+    def measure(self, key):
+        engine = self.db.engines[key]
+        query = self.lag_query or LAG_QUERIES.get(engine.dialect.name)
+        if not query:
+            return 0.0
+        with engine.connect() as connection:
+            return float(connection.execute(text(query)).scalar() or 0)
+
+    def lag(self, key):
+        with self._lock:
+            measured_at, lag = self._lags.get(key, (None, None))
+        if measured_at is not None and time.monotonic() - measured_at < self.check_interval:
+            return lag
+        try:
+            lag = self.measure(key)
+        except Exception as e:
+            current_app.logger.warning("Could not measure the lag of read replica %s: %s", key, e)
+            lag = None
+        with self._lock:
+            self._lags[key] = (time.monotonic(), lag)
+        return lag
+
+    def is_fresh(self, key):
+        lag = self.lag(key)
+        return lag is not None and lag <= self.max_lag
+
+    def fresh_replicas(self):
+        return [key for key in self.replicas if self.is_fresh(key)]
+
+
+@contextmanager
+def use_replica(enabled=True):
+    """
+    Within the block, SELECTs of the current DB session may be served by a read replica (see RoutingSession).
+    """
+    info = current_app.extensions['sqlalchemy'].session.info
+    previous = info.get('replica', False)
+    info['replica'] = enabled
+    try:
+        yield
+    finally:
+        info['replica'] = previous
+
+
+def replica_allowed():
+    """
+    Whether the current request may read from a replica: a GET or HEAD from a user who has not written anything
+    in the last DB_REPLICA_MAX_LAG seconds (read-your-writes).
+    """
+    return request.method in ('GET', 'HEAD') and session.get(STICKY_SESSION_KEY, 0) <= time.time()
+
+
+def read_replica(view):
+    """
+    Serve the reads of a view from a replica when ``replica_allowed``. Its writes, and the reads of POSTs, still go
+    to the primary.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with use_replica(replica_allowed()):
+            return view(*args, **kwargs)
+    return wrapper
+
+
+def init_db_routing(app, db):
+    router = ReplicaRouter(app, db)
+    app.extensions['db_routing'] = router
+    if not router.replicas:
+        return
+
+    @app.after_request
+    def stick_to_primary(response):
+        # After a write, this user's reads stay on the primary until every replica in use has caught up with it
+        if db.session.info.get('wrote') and current_user.is_authenticated:
+            session[STICKY_SESSION_KEY] = time.time() + router.max_lag + router.check_interval
+        return response
@@ -5,13 +5,40 @@ from flask_mail import Mail
 from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
 from flask_limiter import Limiter
+import redis
 
+from app.dbrouting import RoutingSession
 from app.make_celery import make_celery
+from app import ratelimit  # noqa: F401 -- registers the hybrid+redis:// limiter storage scheme
 from config import Config
 from flask_celeryext import FlaskCeleryExt
 
+
+class RedisStore:
+    """
+    Shared Redis client configured from ``REDIS_URL``.
+
+    redis-py connects lazily, so creating the client does no I/O; commands are proxied to it.
+    """
+
+    def __init__(self):
+        self.client = None
+
+    def init_app(self, app):
+        self.client = redis.Redis.from_url(app.config['REDIS_URL'],
+                                           socket_timeout=app.config['REDIS_SOCKET_TIMEOUT'],
+                                           socket_connect_timeout=app.config['REDIS_SOCKET_TIMEOUT'])
+        app.extensions['redis'] = self
+
+    def __getattr__(self, name):
+        if self.client is None:
+            raise RuntimeError('RedisStore is not initialised, call init_app() first')
+        return getattr(self.client, name)
+
+
 # Create instances of the extensions
-db = SQLAlchemy()
+# SELECTs in views and commands marked read-only may go to a read replica (app/dbrouting.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 mail = Mail()
 login_manager = LoginManager()
@@ -21,3 +48,4 @@ limiter = Limiter(
     storage_uri=Config.LIMITER_STORAGE_URL
 )
 ext_celery = FlaskCeleryExt(create_celery_app=make_celery)
+redis_store = RedisStore()
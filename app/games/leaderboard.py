@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from app.extensions import redis_store
+
+# One sorted set per game (member = user id, score = best score) plus a hash of display names, so that a
+# leaderboard page is served from Redis alone.
+SCORES_KEY = 'leaderboard:{game}'
+NAMES_KEY = 'leaderboard:{game}:names'
+
+# (game, page, per_page) -> (expires at, page), least recently used first
+_page_cache = OrderedDict()
+_page_cache_lock = threading.Lock()
+
+
+def display_name(email):
+    """
+    Mask an e-mail address for public display: ``john.doe@example.com`` -> ``jo***@example.com``.
+    """
+    local, _, domain = email.partition('@')
+    return f"{local[:2]}***@{domain}" if domain else f"{local[:2]}***"
+
+
+def submit(game, user_id, email, score):
+    """
+    Record ``score`` in the game's sorted set. ZADD GT only ever raises a member's score, so resubmitting is a
+    no-op; both the update and the rank lookup are O(log n).
+
+    Returns the user's 0-based rank.
+    """
+    with redis_store.pipeline(transaction=False) as pipe:
+        pipe.zadd(SCORES_KEY.format(game=game), {user_id: score}, gt=True)
+        pipe.hset(NAMES_KEY.format(game=game), user_id, display_name(email))
+        pipe.zrevrank(SCORES_KEY.format(game=game), user_id)
+        _, _, rank = pipe.execute()
+    return rank
+
+
+def rank_of(game, user_id):
+    """
+    Return the user's 0-based rank or None if the user has no score.
+    """
+    return redis_store.zrevrank(SCORES_KEY.format(game=game), user_id)
+
+
+def top(game, page=1, per_page=10):
+    """
+    Return one page of the leaderboard as a list of dicts.
+
+    Pages are cached in process for ``LEADERBOARD_CACHE_TTL`` seconds, so polling clients cost one Redis round trip
+    per page and TTL. The cache holds at most ``LEADERBOARD_CACHE_MAX_PAGES`` pages, and empty pages (past the end
+    of the leaderboard) are not cached, so clients asking for arbitrary pages cannot grow it.
+    """
+    cache_key = (game, page, per_page)
+    with _page_cache_lock:
+        cached = _page_cache.get(cache_key)
+        if cached is not None and cached[0] > time.monotonic():
+            _page_cache.move_to_end(cache_key)
+            return cached[1]
+
+    start = (page - 1) * per_page
+    entries = redis_store.zrevrange(SCORES_KEY.format(game=game), start, start + per_page - 1, withscores=True)
+    names = redis_store.hmget(NAMES_KEY.format(game=game), [member for member, _ in entries]) if entries else []
+    leaderboard = [
+        {
+            'rank': start + position + 1,
+            'player': name.decode() if name else 'anonymous',
+            'score': int(score),
+        }
+        for position, ((member, score), name) in enumerate(zip(entries, names))
+    ]
+
+    if leaderboard:
+        _cache_page(cache_key, leaderboard)
+    return leaderboard
+
+
+def _cache_page(cache_key, leaderboard):
+    now = time.monotonic()
+    with _page_cache_lock:
+        _page_cache[cache_key] = (now + current_app.config['LEADERBOARD_CACHE_TTL'], leaderboard)
+        _page_cache.move_to_end(cache_key)
+        for key in [key for key, (expires_at, _) in _page_cache.items() if expires_at <= now]:
+            del _page_cache[key]
+        while len(_page_cache) > current_app.config['LEADERBOARD_CACHE_MAX_PAGES']:
+            _page_cache.popitem(last=False)
+
+
+def rebuild(game, rows):
+    """
+    Replace the game's sorted set with ``rows`` of ``(user_id, email, score)``, e.g. after Redis lost its data.
+    """
+    scores_key, names_key = SCORES_KEY.format(game=game), NAMES_KEY.format(game=game)
+    with redis_store.pipeline() as pipe:
+        pipe.delete(scores_key, names_key)
+        for user_id, email, score in rows:
+            pipe.zadd(scores_key, {user_id: score})
+            pipe.hset(names_key, user_id, display_name(email))
+        pipe.execute()
+    with _page_cache_lock:
+        _page_cache.clear()
@@ -1,37 +1,47 @@
-from flask import render_template, jsonify, request
+from celery import shared_task
+from flask import render_template, jsonify, request, current_app, session
 from flask_login import login_required, current_user
 from app.games import games_bp
-from app.extensions import db, limiter
-from datetime import datetime
+from app.games import leaderboard as leaderboard_store
+from app.extensions import db, limiter, redis_store
+from app.models.gamescore import GameScore
+from app.models.user import User
+from app.viewcache import cached_view
+
+DINO_RUNNER = 'dino-runner'
+
+
+GAMES = (
+    {
+        'id': 'dino-runner',
+        'name': 'Dino Runner',
+        'description': 'Classic dinosaur running game with obstacles. Press Space to jump!',
+        'difficulty': 'Easy',
+        'icon': '🦖'
+    },
+    {
+        'id': 'coming-soon',
+        'name': 'More Games',
+        'description': 'More exciting games coming soon!',
+        'difficulty': 'TBA',
+        'icon': '🎮'
+    },
+)
 
 
 @games_bp.route('/')
 @limiter.limit("100 per minute")
+@cached_view('games.index')
 def index():
     """
     Games landing page showing available games.
     """
-    games = [
-        {
-            'id': 'dino-runner',
-            'name': 'Dino Runner',
-            'description': 'Classic dinosaur running game with obstacles. Press Space to jump!',
-            'difficulty': 'Easy',
-            'icon': '🦖'
-        },
-        {
-            'id': 'coming-soon',
-            'name': 'More Games',
-            'description': 'More exciting games coming soon!',
-            'difficulty': 'TBA',
-            'icon': '🎮'
-        }
-    ]
-    return render_template('games/index.html', games=games)
+    return render_template('games/index.html', games=GAMES)
 
 
 @games_bp.route('/dino-runner')
 @limiter.limit("100 per minute")
+@cached_view('games.dino_runner', anonymous_only=True)  # logged-in players see their own high score
 def dino_runner():
     """
     Enhanced dinosaur runner game with scoring and difficulty progression.
@@ -39,7 +49,7 @@ def dino_runner():
     # Get user's high score if authenticated
     high_score = 0
     if current_user.is_authenticated:
-        high_score = current_user.game_high_score if hasattr(current_user, 'game_high_score') else 0
+        high_score = GameScore.best_for(current_user.id, DINO_RUNNER)
 
     return render_template('games/dino_runner.html', high_score=high_score)
 
@@ -50,57 +60,91 @@ def dino_runner():
 def save_score():
     """
     API endpoint to save user's game score.
+
+    The best score is persisted in the game_score table and mirrored into the Redis leaderboard. Both writes only
+    ever raise the stored value, so retried submissions are harmless.
     """
     try:
         data = request.get_json()
-        score = data.get('score', 0)
-
-        # Update user's high score if this is better
-        if not hasattr(current_user, 'game_high_score'):
-            # Add column if it doesn't exist (will be handled by migration)
-            pass
-
-        if hasattr(current_user, 'game_high_score'):
-            if score > (current_user.game_high_score or 0):
-                current_user.game_high_score = score
-                db.session.commit()
-                return jsonify({
-                    'success': True,
-                    'message': 'New high score!',
-                    'high_score': score
-                }), 200
-
-        return jsonify({
-            'success': True,
-            'message': 'Score recorded',
-            'high_score': current_user.game_high_score if hasattr(current_user, 'game_high_score') else 0
-        }), 200
-
-    except Exception as e:
+        score = int(data.get('score', 0))
+        if score < 0:
+            raise ValueError('score must not be negative')
+    except (AttributeError, TypeError, ValueError) as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 400
 
+    previous_best = GameScore.best_for(current_user.id, DINO_RUNNER)
+    high_score = GameScore.record(current_user.id, DINO_RUNNER, score)
+
+    rank = None
+    try:
+        rank = leaderboard_store.submit(DINO_RUNNER, current_user.id, current_user.email, high_score)
+    except Exception as e:
+        # The database is the source of truth; `flask rebuild-leaderboard` restores Redis from it.
+        current_app.logger.warning("Could not update leaderboard for user %s: %s", current_user.id, e)
+
+    return jsonify({
+        'success': True,
+        'message': 'New high score!' if high_score > previous_best else 'Score recorded',
+        'high_score': high_score,
+        'rank': rank + 1 if rank is not None else None
+    }), 200
+
 
 @games_bp.route('/api/leaderboard')
 @limiter.limit("30 per minute")
 def leaderboard():
     """
     API endpoint to get top scores leaderboard.
+
+    Served from the Redis sorted set only, ``?page=`` and ``?per_page=`` (max 100) select the slice. The caller's
+    rank is looked up by the user id in the session: ``current_user`` would load the user from the database.
     """
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 10, type=int), 1), 100)
     try:
-        # This will be implemented when game_high_score column is added to User model
-        # For now, return empty leaderboard
-        leaderboard_data = []
-
-        return jsonify({
-            'success': True,
-            'leaderboard': leaderboard_data
-        }), 200
-
+        leaderboard_data = leaderboard_store.top(DINO_RUNNER, page, per_page)
+        rank = None
+        user_id = session.get('_user_id')
+        if user_id is not None:
+            rank = leaderboard_store.rank_of(DINO_RUNNER, int(user_id))
     except Exception as e:
+        current_app.logger.error("Leaderboard unavailable: %s", e)
         return jsonify({
             'success': False,
-            'error': str(e)
-        }), 400
+            'error': 'Leaderboard temporarily unavailable'
+        }), 503
+
+    return jsonify({
+        'success': True,
+        'page': page,
+        'leaderboard': leaderboard_data,
+        'your_rank': rank + 1 if rank is not None else None
+    }), 200
+
+
+def rebuild_leaderboards(only_missing=False):
+    """
+    Rebuild the Redis leaderboard of every game from the game_score table and return the games rebuilt.
+    With ``only_missing`` a game is only rebuilt if its sorted set is gone, e.g. evicted by Redis under memory pressure.
+    """
+    rebuilt = []
+    for game, in db.session.query(GameScore.game).distinct():
+        if only_missing and redis_store.exists(leaderboard_store.SCORES_KEY.format(game=game)):
+            continue
+        rows = db.session.query(GameScore.user_id, User.email, GameScore.score) \
+            .join(User, User.id == GameScore.user_id).filter(GameScore.game == game)
+        leaderboard_store.rebuild(game, rows)
+        rebuilt.append(game)
+    return rebuilt
+
+
+@shared_task(ignore_result=True, acks_late=True)
+def restore_leaderboards():
+    """
+    Celery task (maintenance queue) restoring leaderboards that Redis lost. Idempotent, so safe to redeliver.
+    """
+    for game in rebuild_leaderboards(only_missing=True):
+        current_app.logger.warning("Leaderboard of %s was missing from Redis and has been rebuilt", game)
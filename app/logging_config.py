@@ -0,0 +1,176 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask.logging import default_handler
+
+# Attributes every LogRecord carries. Anything else on a record came in through ``extra=`` and is emitted as a
+# structured field of the JSON document.
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+# The listener that currently owns the log file, if any. Kept at module level so that repeated create_app() calls
+# (tests, CLI) replace the previous setup instead of stacking handlers and background threads.
+_listener = None
+_queue_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Render a log record as a single-line JSON document.
+    """
+
+    def format(self, record):
+        payload = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'func': record.funcName,
+            'line': record.lineno,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload['exc_info'] = record.exc_text
+        return json.dumps(payload, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of the records below WARNING for selected loggers.
+
+    Args:
+        rates (dict): Logger name -> fraction of records to keep (0.0 - 1.0). A rate applies to the named logger
+            and all of its children; warnings and errors are never sampled out.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = dict(rates or {})
+
+    def _rate_for(self, name):
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate_for(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class StructuredQueueHandler(QueueHandler):
+    """
+    QueueHandler that hands the listener an already-rendered message but leaves formatting of the final document
+    to the listener thread.
+    """
+
+    def prepare(self, record):
+        # Interpolate the %-args here: they may reference mutable objects that change before the listener runs.
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _parse_sample_rates(value):
+    """
+    Parse ``"app.probe=0.1,app.sweep=0.5"`` into ``{'app.probe': 0.1, 'app.sweep': 0.5}``.
+    """
+    if isinstance(value, dict):
+        return value
+    rates = {}
+    for item in (value or '').split(','):
+        name, _, rate = item.partition('=')
+        if name.strip() and rate.strip():
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+def _start_listener(*handlers):
+    global _listener
+    _listener = QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def _restart_listener_in_child():
+    # Threads do not survive fork(): Celery prefork children and preloaded Gunicorn workers need their own listener,
+    # otherwise records pile up in the inherited queue and never reach the file.
+    if _listener is not None:
+        handlers = _listener.handlers
+        _queue_handler.queue = queue.SimpleQueue()
+        _start_listener(*handlers)
+
+
+def stop_logging():
+    """
+    Flush queued records and stop the background listener.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+    if _queue_handler is not None:
+        logging.getLogger('app').removeHandler(_queue_handler)
+        _queue_handler = None
+
+
+def configure_logging(app):
+    """
+    Route the application logger through a queue to a rotating JSON log file.
+
+    The logging call only enqueues the record; a QueueListener thread does the formatting and the disk I/O, so
+    request and probe threads never block on the file system.
+    """
+    global _queue_handler
+    stop_logging()
+
+    log_dir = app.config['LOG_DIR']
+    if not os.path.exists(log_dir):
+        os.mkdir(log_dir)
+
+    file_handler = RotatingFileHandler(os.path.join(log_dir, 'FlaskWatchdog.log'),
+                                       maxBytes=app.config['LOG_MAX_BYTES'],
+                                       backupCount=app.config['LOG_BACKUP_COUNT'])
+    file_handler.setFormatter(JsonFormatter())
+    file_handler.setLevel(logging.INFO)
+
+    _queue_handler = StructuredQueueHandler(queue.SimpleQueue())
+    # Sample on the producer side so dropped records are never formatted or enqueued.
+    _queue_handler.addFilter(SamplingFilter(_parse_sample_rates(app.config['LOG_SAMPLE_RATES'])))
+    _queue_handler.setLevel(logging.INFO)
+
+    handlers = [file_handler]
+    if app.config['LOG_TO_STDERR']:
+        stream_handler = logging.StreamHandler(sys.stderr)
+        stream_handler.setFormatter(JsonFormatter())
+        handlers.append(stream_handler)
+    _start_listener(*handlers)
+
+    # Flask's own stderr handler writes synchronously from the calling thread; the listener takes over its job.
+    app.logger.removeHandler(default_handler)
+    app.logger.addHandler(_queue_handler)
+    app.logger.setLevel(logging.INFO)
+
+
+atexit.register(stop_logging)
+os.register_at_fork(after_in_child=_restart_listener_in_child)
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app.extensions import redis_store
+
+# Held while a "check now" probe of the website is queued or running; concurrent requests join it.
+CHECK_INFLIGHT_KEY = 'watchdog:check:inflight:{website_id}'
+
+QUEUED, IN_PROGRESS, FRESH, UNAVAILABLE = 'queued', 'in_progress', 'fresh', 'unavailable'
+
+
+def request_check(website):
+    """
+    Ask for an immediate probe of ``website`` and return what happened:
+
+    ``fresh``        it was checked less than ``CHECK_NOW_REUSE`` seconds ago; that result stands
+    ``in_progress``  a probe requested by someone else is queued or running; this request joins it
+    ``queued``       this request enqueued the probe
+    ``unavailable``  Redis (the broker, too) cannot be reached
+
+    However many subscribers press the button, a website is probed at most once per ``CHECK_NOW_REUSE`` seconds:
+    the first request takes the single-flight key with SET NX and enqueues the probe, the others see the key, and
+    once the probe has stored its result everybody gets that result until it is older than the reuse window.
+    """
+    reuse = timedelta(seconds=current_app.config['CHECK_NOW_REUSE'])
+    if website.last_checked and datetime.utcnow() - website.last_checked < reuse:
+        return FRESH
+
+    key = CHECK_INFLIGHT_KEY.format(website_id=website.id)
+    try:
+        # The TTL only matters if the task is lost; normally the task deletes the key when it is done.
+        if not redis_store.set(key, 1, nx=True, ex=current_app.config['CHECK_NOW_LOCK_TTL']):
+            return IN_PROGRESS
+    except Exception as e:
+        current_app.logger.warning("Could not request a check of %s: %s", website.url, e)
+        return UNAVAILABLE
+
+    from app.main.routes import check_website
+    try:
+        check_website.delay(website.id)
+    except Exception as e:
+        current_app.logger.warning("Could not enqueue a check of %s: %s", website.url, e)
+        release_check(website.id)
+        return UNAVAILABLE
+    return QUEUED
+
+
+def release_check(website_id):
+    try:
+        redis_store.delete(CHECK_INFLIGHT_KEY.format(website_id=website_id))
+    except Exception as e:
+        current_app.logger.warning("Could not release the check of website %s: %s", website_id, e)
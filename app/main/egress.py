@@ -0,0 +1,162 @@
+import ipaddress
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Second-level labels under which registries hand out names (example.co.uk, example.com.au). A full public suffix
+# list is not worth a dependency here: a miss only means two sites share or split a bucket they should not.
+_SECOND_LEVEL_LABELS = frozenset(('ac', 'co', 'com', 'edu', 'gov', 'net', 'org', 'ltd', 'plc', 'ne', 'or'))
+
+
+def registrable_domain(host):
+    """
+    Best-effort registrable domain of ``host``: ``www.shop.example.co.uk`` -> ``example.co.uk``.
+    """
+    host = host.rstrip('.').lower()
+    try:
+        ipaddress.ip_address(host)
+        return host
+    except ValueError:
+        pass
+    labels = host.split('.')
+    if len(labels) >= 3 and labels[-2] in _SECOND_LEVEL_LABELS and len(labels[-1]) == 2:
+        return '.'.join(labels[-3:])
+    return '.'.join(labels[-2:])
+
+
+class TokenBucket:
+    """
+    Classic token bucket: ``rate`` tokens per second, holding at most ``burst``.
+    """
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now):
+        """
+        Add the tokens earned since the last call. Returns 0 if a token is available, otherwise the seconds until
+        one will be.
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class EgressLimiter:
+    """
+    Throttle outbound probes per resolved IP address, per registrable domain and globally.
+
+    Shared hosting puts many monitored domains behind one IP, and one customer often monitors many subdomains of
+    one domain; a probe must get a token from the bucket of its IP, of its domain and from the global bucket before
+    it is sent, so a concurrent sweep spreads its requests instead of bursting into one host and collecting 429s
+    (which would be reported as downs). Buckets live in process memory: with several worker processes the
+    effective per-host rate is the configured one times the number of processes.
+
+    Resolved addresses are cached for ``resolve_ttl`` seconds; a host that does not resolve is limited by domain
+    only (its probe will fail anyway).
+    """
+
+    def __init__(self, host_rate=2.0, host_burst=4, global_rate=50.0, resolve_ttl=300.0):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._addresses = {}
+        self._last_prune = time.monotonic()
+        self.configure(host_rate, host_burst, global_rate, resolve_ttl)
+
+    def configure(self, host_rate, host_burst, global_rate, resolve_ttl=300.0):
+        settings = (host_rate, host_burst, global_rate, resolve_ttl)
+        if settings == getattr(self, '_settings', None):
+            return
+        with self._lock:
+            self._settings = settings
+            self.host_rate = host_rate
+            self.host_burst = host_burst
+            self.global_rate = global_rate
+            self.resolve_ttl = resolve_ttl
+            self._buckets.clear()
+
+    def keys_for(self, url):
+        """
+        The buckets a probe of ``url`` draws from.
+        """
+        if '://' not in url:
+            url = 'https://' + url
+        parts = urlsplit(url)
+        host = parts.hostname or ''
+        keys = ['global']
+        if self.host_rate <= 0:
+            return keys
+        keys.append('domain:' + registrable_domain(host))
+        address = self._resolve(host, parts.port or (443 if parts.scheme == 'https' else 80))
+        if address:
+            keys.append('ip:' + address)
+        return keys
+
+    def _resolve(self, host, port):
+        now = time.monotonic()
+        # The cache is shared by the probe threads and pruned under the lock; the lookup itself is done outside it
+        with self._lock:
+            cached = self._addresses.get(host)
+        if cached and cached[1] > now:
+            return cached[0]
+        try:
+            address = socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)[0][4][0]
+        except (OSError, UnicodeError):
+            address = None
+        with self._lock:
+            self._addresses[host] = (address, now + self.resolve_ttl)
+        return address
+
+    def _bucket(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if key == 'global':
+                bucket = TokenBucket(self.global_rate, max(self.global_rate, 1), now)
+            else:
+                bucket = TokenBucket(self.host_rate, self.host_burst, now)
+            self._buckets[key] = bucket
+        return bucket
+
+    def acquire(self, url, deadline=None):
+        """
+        Block until a probe of ``url`` may be sent. Returns the seconds waited, or None if that would pass
+        ``deadline`` (a Unix timestamp).
+        """
+        keys = self.keys_for(url)
+        waited = 0.0
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                self._prune(now)
+                buckets = [self._bucket(key, now) for key in keys]
+                buckets = [bucket for bucket in buckets if bucket.rate > 0]  # a rate of 0 disables that limit
+                wait = max([bucket.refill(now) for bucket in buckets], default=0.0)
+                if not wait:
+                    # All or nothing: a token is only taken once every bucket has one.
+                    for bucket in buckets:
+                        bucket.tokens -= 1
+            if not wait:
+                return waited
+            if deadline is not None and time.time() + wait > deadline:
+                return None
+            time.sleep(wait)
+            waited += wait
+
+    def _prune(self, now):
+        # Buckets that have refilled completely carry no state; drop them so memory follows the active hosts.
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        for key in [key for key, bucket in self._buckets.items()
+                    if bucket.tokens + (now - bucket.updated) * bucket.rate >= bucket.burst]:
+            del self._buckets[key]
+        for host in [host for host, (_, expires) in self._addresses.items() if expires <= now]:
+            del self._addresses[host]
+
+
+egress = EgressLimiter()
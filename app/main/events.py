@@ -0,0 +1,151 @@
+import json
+import os
+import queue
+import threading
+import time
+
+from flask import current_app
+
+from app.extensions import redis_store
+from app.main.health import STATUS_VERSION_KEY, new_status_version
+
+# Status transitions published by the sweep; every web process relays the ones a connected user is subscribed to.
+STATUS_CHANNEL = 'watchdog:status-changes'
+
+
+def publish_status_change(website_id, url, status, checked_at):
+    """
+    Announce a status transition on the Redis channel. Failures are logged, never raised: live updates are a
+    convenience and must not fail the sweep.
+    """
+    message = json.dumps({
+        'website_id': website_id,
+        'url': url,
+        'status': status,
+        'checked_at': checked_at.isoformat() if checked_at else None,
+    })
+    try:
+        with redis_store.pipeline(transaction=False) as pipe:
+            pipe.set(STATUS_VERSION_KEY, new_status_version())
+            pipe.publish(STATUS_CHANNEL, message)
+            pipe.execute()
+    except Exception as e:
+        current_app.logger.warning("Could not publish status change for %s: %s", url, e)
+
+
+class StreamLimitReached(Exception):
+    pass
+
+
+class _Subscriber:
+    __slots__ = ('website_ids', 'queue')
+
+    def __init__(self, website_ids, size):
+        self.website_ids = website_ids
+        self.queue = queue.Queue(maxsize=size)
+
+
+class StatusBroadcaster:
+    """
+    Fan status changes out to the SSE streams of this process.
+
+    A single background thread holds the one Redis pub/sub connection of the process and copies each message
+    into the queue of every stream subscribed to that website, so N open streams cost one Redis connection instead
+    of N. A stream whose queue overflows receives ``None`` and is closed; the browser reconnects and reloads.
+    """
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._pid = None
+        self.redis = None
+
+    def subscribe(self, website_ids, max_streams, queue_size=100):
+        self._ensure_listener()
+        with self._lock:
+            if len(self._subscribers) >= max_streams:
+                raise StreamLimitReached()
+            subscriber = _Subscriber(frozenset(website_ids), queue_size)
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def _ensure_listener(self):
+        # Threads do not survive fork(), so each Gunicorn worker starts its own listener on first use.
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._subscribers = set()
+                    self.redis = redis_store.client
+                    threading.Thread(target=self._listen, name='sse-broadcaster', daemon=True).start()
+
+    def _listen(self):
+        backoff = 1
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(STATUS_CHANNEL)
+                backoff = 1
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        self._dispatch(message['data'])
+            except Exception:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+    def _dispatch(self, data):
+        try:
+            event = json.loads(data)
+        except ValueError:
+            return
+        with self._lock:
+            subscribers = [subscriber for subscriber in self._subscribers
+                           if event.get('website_id') in subscriber.website_ids]
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(event)
+            except queue.Full:
+                self._close_overflowed(subscriber)
+
+    def _close_overflowed(self, subscriber):
+        self.unsubscribe(subscriber)
+        while True:
+            try:
+                subscriber.queue.get_nowait()
+            except queue.Empty:
+                break
+        subscriber.queue.put_nowait(None)
+
+
+broadcaster = StatusBroadcaster()
+
+
+def stream_events(subscriber, max_duration, heartbeat):
+    """
+    Yield Server-Sent Events for ``subscriber`` until ``max_duration`` seconds have passed.
+
+    Streams are deliberately finite: the browser's EventSource reconnects on its own (after the advertised
+    ``retry``), which bounds how long a worker thread is held and picks up subscription changes.
+    """
+    deadline = time.monotonic() + max_duration
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                event = subscriber.queue.get(timeout=min(heartbeat, remaining))
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            if event is None:
+                return
+            yield f"event: status\ndata: {json.dumps(event)}\n\n"
+    finally:
+        broadcaster.unsubscribe(subscriber)
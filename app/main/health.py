@@ -0,0 +1,128 @@
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from flask import current_app
+
+from app.extensions import db, redis_store
+
+# Written by the sweep when it finishes; read by the deep health check.
+SWEEP_COMPLETED_KEY = 'watchdog:sweep:last_completed'
+# Given a new value whenever data served by the JSON API changes (status, check and notification times, URLs); the
+# API derives its ETags from it.
+STATUS_VERSION_KEY = 'watchdog:status:version'
+
+_cache = {'expires': 0.0, 'report': None}
+_cache_lock = threading.Lock()
+
+
+def new_status_version():
+    """
+    A value for STATUS_VERSION_KEY that was never used before. Random rather than a counter: Redis may evict the key
+    (allkeys-lru), and a counter starting over would hand out versions, and so ETags, that clients still hold for
+    older data.
+    """
+    return uuid.uuid4().hex
+
+
+def bump_status_version():
+    """
+    Invalidate the JSON API's ETags, after committing a change to data it serves. Failures are logged, never
+    raised.
+    """
+    try:
+        redis_store.set(STATUS_VERSION_KEY, new_status_version())
+    except Exception as e:
+        current_app.logger.warning("Could not bump the status version: %s", e)
+
+
+def record_sweep_completed():
+    """
+    Store the completion time of a sweep. Failures are logged, never raised: health bookkeeping must not fail a
+    sweep that did its job.
+    """
+    try:
+        with redis_store.pipeline(transaction=False) as pipe:
+            pipe.set(SWEEP_COMPLETED_KEY, time.time())
+            pipe.set(STATUS_VERSION_KEY, new_status_version())
+            pipe.execute()
+    except Exception as e:
+        current_app.logger.warning("Could not record sweep completion: %s", e)
+
+
+def _check_database():
+    started = time.perf_counter()
+    db.session.execute(db.text('SELECT 1'))
+    report = {'status': 'ok', 'latency_ms': round((time.perf_counter() - started) * 1000, 2)}
+    pool = db.engine.pool
+    for stat in ('size', 'checkedin', 'checkedout', 'overflow'):
+        if hasattr(pool, stat):
+            report.setdefault('pool', {})[stat] = getattr(pool, stat)()
+    return report
+
+
+def _check_redis():
+    started = time.perf_counter()
+    with redis_store.pipeline(transaction=False) as pipe:
+        pipe.ping()
+        pipe.get(SWEEP_COMPLETED_KEY)
+        for queue in current_app.config['METRICS_BROKER_QUEUES']:
+            pipe.llen(queue)
+        _, last_sweep, *depths = pipe.execute()
+    redis_report = {'status': 'ok', 'latency_ms': round((time.perf_counter() - started) * 1000, 2)}
+    broker_report = {'status': 'ok',
+                     'queue_depth': dict(zip(current_app.config['METRICS_BROKER_QUEUES'], depths))}
+
+    max_age = current_app.config['HEALTH_SWEEP_MAX_AGE']
+    if last_sweep is None:
+        sweep_report = {'status': 'unknown', 'last_completed_age_s': None}
+    else:
+        age = round(time.time() - float(last_sweep), 1)
+        sweep_report = {'status': 'ok' if age <= max_age else 'stale', 'last_completed_age_s': age}
+    return redis_report, broker_report, sweep_report
+
+
+def _build_report():
+    components = {}
+    try:
+        components['database'] = _check_database()
+    except Exception as e:
+        current_app.logger.error("Health check failed: %s", e)
+        db.session.rollback()
+        components['database'] = {'status': 'error', 'error': 'Database connection failed'}
+
+    try:
+        components['redis'], components['broker'], components['sweep'] = _check_redis()
+    except Exception as e:
+        current_app.logger.error("Redis health check failed: %s", e)
+        components['redis'] = {'status': 'error', 'error': 'Redis connection failed'}
+
+    if components['database']['status'] != 'ok':
+        status = 'unhealthy'
+    elif any(component['status'] != 'ok' for component in components.values()):
+        status = 'degraded'
+    else:
+        status = 'healthy'
+    return {
+        'status': status,
+        'timestamp': datetime.utcnow().isoformat(),
+        'service': 'FlaskWatchdog',
+        'components': components,
+    }
+
+
+def deep_health():
+    """
+    Return the component report, served from a per-process cache for ``HEALTH_CACHE_TTL`` seconds so that frequent
+    probes cost one round of checks per TTL instead of one per request.
+    """
+    now = time.monotonic()
+    if _cache['report'] is not None and now < _cache['expires']:
+        return _cache['report']
+    with _cache_lock:
+        # Another thread may have refreshed the report while we were waiting for the lock.
+        if _cache['report'] is None or time.monotonic() >= _cache['expires']:
+            _cache['report'] = _build_report()
+            _cache['expires'] = time.monotonic() + current_app.config['HEALTH_CACHE_TTL']
+        return _cache['report']
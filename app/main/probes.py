@@ -0,0 +1,170 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from celery import shared_task
+from flask import current_app
+
+from app.main.egress import egress
+from app.models.website import normalize_url
+from app.metrics import ERRORS, PROBE_DURATION, PROBE_THROTTLE_WAIT, PROBES, SPLIT_VOTES
+
+# Per-site chatter goes through its own logger so it can be sampled (see LOG_SAMPLE_RATES) without losing the
+# sweep-level and error records logged on current_app.logger.
+probe_logger = logging.getLogger('app.probe')
+
+
+def check_url_status(url, timeout=10):
+    """
+    Check website status and return True if it's online, False otherwise
+    """
+    if not url.startswith('http'):
+        url = 'https://' + url
+    headers = {'User-Agent': 'Custom user agent'}
+    session = requests.Session()
+    session.headers.update(headers)
+    started = time.perf_counter()
+    try:
+        response = session.get(url, timeout=timeout)
+        probe_logger.info("Status code for %s is %s", url, response.status_code)
+        PROBES.labels('up' if response.status_code == 200 else 'down').inc()
+        return response.status_code == 200
+    except requests.exceptions.RequestException as e:
+        probe_logger.warning("Request failed for website %s: %s", url, e)
+        PROBES.labels('error').inc()
+        return False
+    finally:
+        PROBE_DURATION.observe(time.perf_counter() - started)
+
+
+def probe_urls(urls, timeout, deadline=None, on_probe=None):
+    """
+    Probe ``urls`` and return their statuses in the same order.
+
+    Up to ``PROBE_CONCURRENCY`` probes run at once, each waiting for the egress limiter (per IP, per domain and
+    global token buckets) before it is sent. A URL gets ``None`` (no opinion) when its probe fails unexpectedly or
+    when ``deadline`` (a Unix timestamp) passes before its turn came. ``on_probe(status, seconds)`` is called
+    after each probe that was sent.
+    """
+    config = current_app.config
+    egress.configure(config['PROBE_HOST_RATE'], config['PROBE_HOST_BURST'], config['PROBE_GLOBAL_RATE'])
+    logger = current_app.logger
+
+    def probe(url):
+        if deadline is not None and time.time() >= deadline:
+            return None
+        try:
+            waited = egress.acquire(url, deadline)
+            if waited is None:
+                return None
+            PROBE_THROTTLE_WAIT.observe(waited)
+        except Exception as e:
+            logger.error("Error waiting to probe website %s: %s", url, e)
+            ERRORS.labels('probe').inc()
+            return None
+        started = time.perf_counter()
+        try:
+            status = check_url_status(url, timeout=timeout)
+        except Exception as e:
+            logger.error("Error checking website %s: %s", url, e)
+            ERRORS.labels('probe').inc()
+            status = None
+        if on_probe is not None:
+            on_probe(status, time.perf_counter() - started)
+        return status
+
+    concurrency = min(config['PROBE_CONCURRENCY'], len(urls))
+    if concurrency <= 1:
+        return [probe(url) for url in urls]
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='probe') as executor:
+        return list(executor.map(probe, urls))
+
+
+def probe_queue(location):
+    return f'probe.{location}'
+
+
+@shared_task(acks_late=True)
+def probe_location(urls, timeout, deadline):
+    """
+    Probe a batch of URLs from one probe location.
+
+    Each location is a Celery queue (``probe.<location>``) consumed by workers running in that network location,
+    e.g. ``celery -A celery_app.celery worker -Q probe.eu-west``. URLs not reached before ``deadline`` come back as
+    ``None`` so the aggregator never waits for a slow location beyond its budget. Probing is idempotent, so the
+    task is acknowledged late and redelivered if its worker dies.
+    """
+    return probe_urls(urls, timeout, deadline)
+
+
+def quorum_vote(votes, quorum):
+    """
+    True or False once ``quorum`` locations agree on it, None while neither side has a quorum.
+    """
+    up = sum(1 for vote in votes if vote is True)
+    down = sum(1 for vote in votes if vote is False)
+    if up >= quorum:
+        return True
+    if down >= quorum:
+        return False
+    return None
+
+
+def collect_statuses(urls, on_probe=None):
+    """
+    Decide the status of every URL of a sweep batch, in order; ``None`` means undecided.
+
+    Without ``PROBE_LOCATIONS`` the URLs are probed right here with ``PROBE_TIMEOUT``, as before. With locations
+    configured the batch is sent to every location at once, each probing with the short ``PROBE_LOCATION_TIMEOUT``
+    within a shared ``PROBE_LOCATION_BUDGET``, and a status needs ``PROBE_QUORUM`` matching votes (a majority by
+    default). One location's network trouble can then no longer flip a site, which is what lets the timeouts be
+    aggressive. A location that misses the budget simply does not vote.
+    """
+    # Rows stored before URLs were normalised can name the same target; probe each target once and fan the result
+    # out to all of them.
+    keys = [normalize_url(url) or url for url in urls]
+    targets = {}
+    for key, url in zip(keys, urls):
+        targets.setdefault(key, url)
+    statuses = dict(zip(targets, _decide_statuses(list(targets.values()), on_probe)))
+    return [statuses[key] for key in keys]
+
+
+def _decide_statuses(urls, on_probe):
+    config = current_app.config
+    locations = config['PROBE_LOCATIONS']
+    if not locations:
+        return probe_urls(urls, config['PROBE_TIMEOUT'], on_probe=on_probe)
+
+    quorum = config['PROBE_QUORUM'] or len(locations) // 2 + 1
+    timeout = config['PROBE_LOCATION_TIMEOUT']
+    deadline = time.time() + config['PROBE_LOCATION_BUDGET']
+    # A location past its budget is ignored anyway; the hard limit frees its worker for the next batch.
+    time_limit = config['PROBE_LOCATION_BUDGET'] + timeout + 30
+    pending = {location: probe_location.apply_async((urls, timeout, deadline), queue=probe_queue(location),
+                                                    expires=deadline, time_limit=time_limit)
+               for location in locations}
+
+    votes = [[] for _ in urls]
+    for location, result in pending.items():
+        try:
+            # The last probe may start just before the deadline, so allow it one more timeout to finish.
+            location_votes = result.get(timeout=max(deadline + timeout - time.time(), 0.1),
+                                        disable_sync_subtasks=False)
+        except Exception as e:
+            current_app.logger.warning("Probe location %s did not answer within its budget: %s", location, e)
+            ERRORS.labels('probe_location').inc()
+            continue
+        for url_votes, vote in zip(votes, location_votes):
+            url_votes.append(vote)
+
+    statuses = []
+    for url, url_votes in zip(urls, votes):
+        status = quorum_vote(url_votes, quorum)
+        if True in url_votes and False in url_votes:
+            SPLIT_VOTES.inc()
+            probe_logger.info("Probe locations disagree on %s: %s", url, url_votes,
+                              extra={'votes': url_votes, 'status': status})
+        statuses.append(status)
+    return statuses
@@ -1,24 +1,40 @@
 from flask_mail import Message
-import requests
+import logging
 from datetime import datetime
 import os
-from urllib.parse import urlparse
+import time
+from app.models.user import User
 from app.models.userwebsite import UserWebsite
-from app.models.website import Website
-from flask import render_template, redirect, url_for, flash, abort, jsonify
+from app.models.website import Website, normalize_url
+from flask import render_template, redirect, url_for, flash, abort, jsonify, Response, request
 from flask_login import login_required, current_user
 from app.extensions import limiter, db, mail
+from app.dbrouting import read_replica
 from app.forms import WebsiteForm
 from app.main import main_bp
+from app.main.health import bump_status_version, deep_health, record_sweep_completed
+from app.main.probes import check_url_status, collect_statuses  # noqa: F401 -- check_url_status kept importable here
+from app.main.targets import ProbeTarget, SweepCheckpoint, iter_probe_targets
+from app.main.checks import release_check, request_check, FRESH, IN_PROGRESS, QUEUED
+from app.main.webhooks import enqueue_webhooks, status_event
+from app.main.events import broadcaster, publish_status_change, stream_events, StreamLimitReached
+from app.metrics import SWEEP_DURATION, DB_COMMIT_DURATION, STATUS_TRANSITIONS, EMAILS, ERRORS, render_metrics
 from celery import shared_task
+from sqlalchemy.orm import joinedload
 from flask import current_app
 from werkzeug.local import LocalProxy
 
-@shared_task
+probe_logger = logging.getLogger('app.probe')
+
+
+@shared_task(ignore_result=True)
 def check_website_status():
     """
     Celery task to check website status for all monitored websites.
     Updates database with current status and sends notifications on status changes.
+
+    Routed to the ``probe`` queue. Fire and forget: nobody reads its result, so none is stored. Not acks_late: a
+    sweep redelivered after a worker crash would overlap the next scheduled one, which covers the same sites anyway.
     """
     # Access the current Flask application object in a more convenient way. Useful when dealing with contexts like
     # multithreading or when the application object is not directly available.
@@ -26,80 +42,174 @@ def check_website_status():
 
     # Use the app context
     with app_proxy.app_context():
-        try:
-            current_app.logger.info(f"Checking website status at {datetime.utcnow()}")
-            websites = Website.query.all()
+        run_sweep()
+
 
-            for website in websites:
+def run_sweep(shard=None, on_probe=None):
+    """
+    Probe the monitored websites, store their status and notify subscribers of changes.
+
+    ``shard`` is an optional ``(index, count)`` pair restricting the sweep to the websites with
+    ``id % count == index``, so several processes can share one sweep. ``on_probe(status, seconds)`` is called after
+    every local probe (from the probe threads), which is how ``flask check-status --local`` reports progress.
+
+    Progress is checkpointed in Redis after every batch (see SweepCheckpoint): a sweep interrupted by a restart or
+    the time limit is resumed by the next one, and successive sweeps start at rotating points of the id order.
+    """
+    try:
+        batch_size = current_app.config['SWEEP_BATCH_SIZE']
+        checkpoint = SweepCheckpoint.load(shard)
+        if checkpoint.resumed:
+            current_app.logger.info("Resuming website status sweep after website %d", checkpoint.cursor)
+        else:
+            current_app.logger.info("Checking website status")
+        sweep_started = time.perf_counter()
+
+        for batch in iter_probe_targets(batch_size, shard=shard, checkpoint=checkpoint):
+            # last_checked of the sites whose status did not change, written in one statement per batch
+            checked = []
+            changes = []
+            statuses = collect_statuses([target.url for target in batch], on_probe=on_probe)
+            for target, status in zip(batch, statuses):
+                if status is None:
+                    # Probe failed or no quorum: keep the current status and check time
+                    continue
                 try:
-                    current_app.logger.info(f"Checking website status for {website.url} at {datetime.utcnow()}")
-                    status = check_url_status(website.url)
-                    current_app.logger.info(f"Website status for {website.url} at {datetime.utcnow()} is {status}")
-
-                    # Update the last checked field in the website model
-                    website.last_checked = datetime.utcnow()
-
-                    # Check if the website status has changed
-                    if status != website.status:
-                        website.status = status
-
-                        # Get the users subscribed to this website
-                        users = [user_website.user for user_website in website.website_users]
-
-                        # For each user, update the last notified field in the UserWebsite model
-                        for user in users:
-                            try:
-                                # Find the user_website relationship
-                                user_website = next(
-                                    (user_website for user_website in website.website_users if user_website.user_id == user.id),
-                                    None)
-
-                                # If there is no previous record for this user-website pair, create a new one
-                                if not user_website:
-                                    user_website = UserWebsite(user_id=user.id, website_id=website.id)
-                                    db.session.add(user_website)
-
-                                # Update the fields in the UserWebsite model
-                                if user.has_remaining_notifications():
-                                    send_email(website.url, status, user.email)
-                                    user.decrement_notifications()
-                                    user_website.last_notified = datetime.utcnow()
-                            except Exception as e:
-                                current_app.logger.error(f"Error notifying user {user.email} for website {website.url}: {str(e)}")
-                                db.session.rollback()
-                                continue
-
-                    # Commit all changes for this website at once
-                    db.session.commit()
+                    probe_logger.info("Website status for %s is %s", target.url, status,
+                                      extra={'website_id': target.id, 'status': status})
+                    checked_at = datetime.utcnow()
+
+                    if status == target.status:
+                        checked.append({'id': target.id, 'last_checked': checked_at})
+                        continue
+
+                    changes.append(record_status_change(target, status, checked_at))
 
                 except Exception as e:
-                    current_app.logger.error(f"Error checking website {website.url}: {str(e)}")
+                    current_app.logger.error("Error updating website %s: %s", target.url, e)
+                    ERRORS.labels('update').inc()
                     db.session.rollback()
                     continue
 
+            try:
+                if checked:
+                    db.session.bulk_update_mappings(Website, checked)
+                    with DB_COMMIT_DURATION.time():
+                        db.session.commit()
+                    # The API serves last_checked: its ETags must change with it
+                    bump_status_version()
+            except Exception as e:
+                current_app.logger.error("Error saving check times for %d websites: %s", len(checked), e)
+                ERRORS.labels('commit').inc()
+                db.session.rollback()
+            # One webhook batch per endpoint for the whole sweep batch
+            enqueue_webhooks(changes)
+            # Drop the users and subscriptions loaded for notifications so the session stays empty between batches
+            db.session.expunge_all()
+
+        checkpoint.finish(batch_size)
+        SWEEP_DURATION.observe(time.perf_counter() - sweep_started)
+        if shard is None:
+            record_sweep_completed()
+
+    except Exception as e:
+        current_app.logger.error("Fatal error in website status sweep: %s", e)
+        ERRORS.labels('sweep').inc()
+        db.session.rollback()
+        raise
+
+
+def record_status_change(target, status, checked_at):
+    """
+    Store a new status of ``target``, notify its subscribers and announce the change to the open dashboards.
+    Returns the change as a webhook event, for the caller to queue with ``enqueue_webhooks``.
+    """
+    STATUS_TRANSITIONS.labels('up' if status else 'down').inc()
+    Website.query.filter_by(id=target.id) \
+        .update({'status': status, 'last_checked': checked_at}, synchronize_session=False)
+    recipients = reserve_recipients(target)
+
+    # Commit the status change with the quota reservations before any e-mail goes out: the website and user rows
+    # must not stay locked across SMTP round trips
+    with DB_COMMIT_DURATION.time():
+        db.session.commit()
+    notify_subscribers(target, status, recipients)
+
+    publish_status_change(target.id, target.url, status, checked_at)
+    return status_event(target.id, target.url, status, checked_at)
+
+
+@shared_task(ignore_result=True, acks_late=True)
+def check_website(website_id):
+    """
+    Celery task probing a single website right away, requested with "check now" (see app/main/checks.py).
+    """
+    app_proxy = LocalProxy(lambda: current_app._get_current_object())
+    with app_proxy.app_context():
+        try:
+            row = db.session.query(Website.id, Website.url, Website.status).filter_by(id=website_id).first()
+            if row is None:
+                return  # deleted since the check was requested
+            target = ProbeTarget(*row)
+            status = collect_statuses([target.url])[0]
+            if status is None:
+                return
+            checked_at = datetime.utcnow()
+            if status == target.status:
+                Website.query.filter_by(id=target.id) \
+                    .update({'last_checked': checked_at}, synchronize_session=False)
+                db.session.commit()
+                # Unchanged, but the dashboards of the users waiting for it should show the new check time
+                publish_status_change(target.id, target.url, status, checked_at)
+            else:
+                enqueue_webhooks([record_status_change(target, status, checked_at)])
         except Exception as e:
-            current_app.logger.error(f"Fatal error in check_website_status task: {str(e)}")
+            current_app.logger.error("Error checking website %s: %s", website_id, e)
+            ERRORS.labels('check').inc()
             db.session.rollback()
-            raise
+        finally:
+            release_check(website_id)
 
 
-def check_url_status(url, timeout=10):
+def reserve_recipients(target):
     """
-    Check website status and return True if it's online, False otherwise
+    Take one notification from the quota of each subscriber of ``target`` and return ``(subscription id, user id,
+    email)`` of those who had one left. The reservations belong to the caller's transaction, which must be
+    committed before ``notify_subscribers`` sends anything.
     """
-    if not url.startswith('http'):
-        url = 'https://' + url
-    headers = {'User-Agent': 'Custom user agent'}
-    session = requests.Session()
-    session.headers.update(headers)
-    try:
-        current_app.logger.info(f"Requesting website status for {url} at {datetime.utcnow()}")
-        response = session.get(url, timeout=timeout)
-        current_app.logger.info(f"Status code for {url} is {response.status_code} at {datetime.utcnow()}")
-        return response.status_code == 200
-    except requests.exceptions.RequestException as e:
-        current_app.logger.error(f'Request failed for website {url}: {str(e)}')
-        return False
+    subscriptions = db.session.query(UserWebsite.id, UserWebsite.user_id, User.email) \
+        .join(User, UserWebsite.user_id == User.id) \
+        .filter(UserWebsite.website_id == target.id) \
+        .all()
+    # The quota check and the decrement are one atomic statement, so concurrent sweeps cannot both spend the last
+    # notification
+    return [subscription for subscription in subscriptions if User.reserve_notifications(subscription[1])]
+
+
+def notify_subscribers(target, status, recipients):
+    """
+    E-mail the ``recipients`` reserved by ``reserve_recipients`` about the new status of ``target``, outside any
+    transaction. A failed e-mail is logged, its notification handed back in a short transaction of its own, and
+    does not stop the others. The sent ones get their last_notified time in one statement at the end.
+    """
+    notified = []
+    for subscription_id, user_id, email in recipients:
+        try:
+            send_email(target.url, status, email)
+            notified.append(subscription_id)
+        except Exception as e:
+            current_app.logger.error("Error notifying user %s for website %s: %s", email, target.url, e)
+            ERRORS.labels('notify').inc()
+            try:
+                User.release_notifications(user_id)
+                db.session.commit()
+            except Exception as e:
+                current_app.logger.error("Could not hand back the notification of user %s: %s", email, e)
+                db.session.rollback()
+    if notified:
+        UserWebsite.query.filter(UserWebsite.id.in_(notified)) \
+            .update({'last_notified': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
 
 
 def send_email(website, status, user):
@@ -112,21 +222,19 @@ def send_email(website, status, user):
         user (str): User email address
     """
     try:
-        current_app.logger.info(
-            f"Preparing e-mail for {website} with status {status} for user {user} at {datetime.utcnow()}")
-
+        checked_at = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')
         subject = f"FlaskWatchdog Alert: {website} is {'back online' if status else 'offline'}"
 
         # Create text and HTML body
         text_body = f"The website {website} is {'back online' if status else 'currently down'}.\n\n" \
-                    f"Status checked at: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}"
+                    f"Status checked at: {checked_at}"
 
         html_body = f"""
         <html>
           <body>
             <h2>FlaskWatchdog Alert</h2>
             <p>The website <strong>{website}</strong> is <strong>{'back online' if status else 'currently down'}</strong>.</p>
-            <p><small>Status checked at: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}</small></p>
+            <p><small>Status checked at: {checked_at}</small></p>
           </body>
         </html>
         """
@@ -136,48 +244,80 @@ def send_email(website, status, user):
         msg.html = html_body
 
         mail.send(msg)
-        current_app.logger.info(f"Sent e-mail for {website} with status {status} for user {user} at {datetime.utcnow()}")
+        EMAILS.labels('sent').inc()
+        current_app.logger.info("Sent e-mail for %s with status %s for user %s", website, status, user)
 
     except Exception as e:
-        current_app.logger.error(f"Failed to send email for {website} to {user}: {str(e)}")
+        current_app.logger.error("Failed to send email for %s to %s: %s", website, user, e)
+        EMAILS.labels('failed').inc()
         raise
 
 
 @main_bp.route('/health', methods=['GET'])
+@limiter.exempt
 def health_check():
     """
     Health check endpoint for Docker and monitoring tools.
-    Returns 200 OK if the application is running and database is accessible.
-    """
-    try:
-        # Check database connectivity
-        db.session.execute(db.text('SELECT 1'))
 
+    The default liveness answer does no I/O at all. ``/health?deep=1`` also checks the database, Redis, the broker
+    queues and the age of the last completed sweep; that report is cached for ``HEALTH_CACHE_TTL`` seconds and
+    returns 503 only when the database is unreachable.
+    """
+    if request.args.get('deep', '').lower() not in ('1', 'true', 'yes'):
         return jsonify({
-            'status': 'healthy',
+            'status': 'alive',
             'timestamp': datetime.utcnow().isoformat(),
-            'service': 'FlaskWatchdog',
-            'database': 'connected'
+            'service': 'FlaskWatchdog'
         }), 200
-    except Exception as e:
-        current_app.logger.error(f"Health check failed: {str(e)}")
-        return jsonify({
-            'status': 'unhealthy',
-            'timestamp': datetime.utcnow().isoformat(),
-            'service': 'FlaskWatchdog',
-            'error': 'Database connection failed'
-        }), 503
+
+    report = deep_health()
+    return jsonify(report), 503 if report['status'] == 'unhealthy' else 200
+
+
+@main_bp.route('/metrics', methods=['GET'])
+@limiter.exempt
+def metrics():
+    """
+    Prometheus scrape endpoint, aggregated across Gunicorn and Celery processes in multiprocess mode.
+    """
+    payload, content_type = render_metrics()
+    return Response(payload, content_type=content_type)
+
+
+@main_bp.route('/stream', methods=['GET'])
+@login_required
+@limiter.limit("30 per minute")
+def stream():
+    """
+    Server-Sent Events stream of status changes for the current user's websites.
+
+    The subscription set is read once; the stream itself never touches the database and ends after
+    ``SSE_MAX_DURATION`` seconds, after which the browser reconnects.
+    """
+    website_ids = [website_id for website_id, in
+                   db.session.query(UserWebsite.website_id).filter_by(user_id=current_user.id)]
+    try:
+        subscriber = broadcaster.subscribe(website_ids, current_app.config['SSE_MAX_STREAMS'])
+    except StreamLimitReached:
+        return jsonify({'error': 'Too many open streams, retry later'}), 503, {'Retry-After': '10'}
+
+    response = Response(stream_events(subscriber, current_app.config['SSE_MAX_DURATION'],
+                                      current_app.config['SSE_HEARTBEAT']),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # stop reverse proxies from buffering the stream
+    return response
 
 
 @main_bp.route('/', methods=['GET', 'POST'])
 @login_required
 @limiter.limit("100 per minute")
+@read_replica
 def dashboard():
     form = WebsiteForm()
     if form.validate_on_submit():
         # check if website already exists in db
-        url = urlparse(form.url.data)
-        domain_name = url.netloc
+        domain_name = normalize_url(form.url.data, fold_www=current_app.config['WEBSITE_FOLD_WWW'])
         website_to_check = Website.query.filter_by(url=domain_name).first()
 
         if website_to_check:
@@ -187,6 +327,7 @@ def dashboard():
                 user_website = UserWebsite(user_id=current_user.id, website_id=website_to_check.id)
                 db.session.add(user_website)
                 db.session.commit()
+            request_check(website_to_check)
             flash('Website added successfully.')
             return redirect(url_for('main.dashboard'))
         else:
@@ -198,12 +339,37 @@ def dashboard():
             user_website = UserWebsite(user_id=current_user.id, website_id=website.id)
             db.session.add(user_website)
             db.session.commit()
+            # Check it now rather than show "Offline" until the next sweep
+            request_check(website)
 
             flash('Website added successfully.')
             return redirect(url_for('main.dashboard'))
 
-    websites = [user_website.website for user_website in current_user.user_websites]
-    return render_template('dashboard.html', form=form, websites=websites)
+    # One query for the subscriptions and their websites, rather than one per website
+    subscriptions = UserWebsite.query.filter_by(user_id=current_user.id) \
+        .options(joinedload(UserWebsite.website)) \
+        .order_by(UserWebsite.id) \
+        .all()
+    return render_template('dashboard.html', form=form, subscriptions=subscriptions)
+
+
+@main_bp.route('/check/<int:id>', methods=['POST'])
+@login_required
+@limiter.limit("10 per minute")
+def check_now(id):
+    """
+    "Check now" button of the dashboard; the dashboard script posts to the JSON API instead and this is the fallback.
+    """
+    website = Website.query.join(UserWebsite).filter(UserWebsite.user_id == current_user.id, Website.id == id).first()
+    if website is None:
+        abort(404)
+    state = request_check(website)
+    flash({
+        QUEUED: f'Checking {website.url} now.',
+        IN_PROGRESS: f'{website.url} is already being checked.',
+        FRESH: f'{website.url} was checked moments ago, its status is current.',
+    }.get(state, 'Checks are unavailable right now, please try again later.'))
+    return redirect(url_for('main.dashboard'))
 
 
 @main_bp.route('/delete/<int:id>', methods=['POST'])
@@ -0,0 +1,135 @@
+import json
+
+from flask import current_app
+
+from app.extensions import db, redis_store
+from app.models.website import Website
+
+# Progress of the current lap of the sweep (one key per shard): where the lap started and the last website id whose
+# batch was processed. A sweep cut short (deploy, OOM kill, time limit) leaves it behind and the next one resumes.
+SWEEP_CHECKPOINT_KEY = 'watchdog:sweep:checkpoint'
+
+
+class ProbeTarget:
+    """
+    What a probe needs to know about a website. Plain values only: no ORM state, no identity map entry.
+    """
+    __slots__ = ('id', 'url', 'status')
+
+    def __init__(self, id, url, status):
+        self.id = id
+        self.url = url
+        self.status = status
+
+    def __repr__(self):
+        return f"<ProbeTarget {self.id} {self.url}>"
+
+
+def _target_query(shard):
+    query = db.session.query(Website.id, Website.url, Website.status)
+    if shard is not None:
+        index, count = shard
+        query = query.filter(Website.id % count == index)
+    return query
+
+
+class SweepCheckpoint:
+    """
+    Cursor of a sweep lap, kept in Redis so that a restarted sweep carries on where the previous one stopped.
+
+    A lap visits the websites in id order from just after ``start`` to the end, then wraps around to the ids up to
+    ``start``. ``cursor`` is the last id whose batch was processed (``wrapped`` tells which half it is in). When a
+    lap completes, the next one starts a batch further along the ring, so the order rotates from run to run and no
+    website is always the last one checked.
+
+    Redis failures are logged once and never raised: without a checkpoint the sweep simply starts from the
+    beginning, as it did before checkpoints existed.
+    """
+
+    def __init__(self, shard=None, start=0, cursor=0, wrapped=False):
+        self.shard = shard
+        self.start = start
+        self.cursor = cursor
+        self.wrapped = wrapped
+        self.key = SWEEP_CHECKPOINT_KEY if shard is None else f'{SWEEP_CHECKPOINT_KEY}:{shard[0]}of{shard[1]}'
+        self._enabled = True
+
+    @property
+    def resumed(self):
+        return self.wrapped or self.cursor != self.start
+
+    @classmethod
+    def load(cls, shard=None):
+        checkpoint = cls(shard)
+        try:
+            data = redis_store.get(checkpoint.key)
+        except Exception as e:
+            current_app.logger.warning("Could not read the sweep checkpoint, starting from the beginning: %s", e)
+            checkpoint._enabled = False
+            return checkpoint
+        if data is not None:
+            state = json.loads(data)
+            checkpoint.start, checkpoint.cursor, checkpoint.wrapped = state['start'], state['cursor'], state['wrapped']
+        return checkpoint
+
+    def _save(self):
+        if not self._enabled:
+            return
+        try:
+            redis_store.set(self.key, json.dumps({'start': self.start, 'cursor': self.cursor, 'wrapped': self.wrapped}),
+                            ex=current_app.config['SWEEP_CHECKPOINT_TTL'])
+        except Exception as e:
+            current_app.logger.warning("Could not save the sweep checkpoint: %s", e)
+            self._enabled = False
+
+    def advance(self, last_id, wrapped):
+        self.cursor, self.wrapped = last_id, wrapped
+        self._save()
+
+    def finish(self, batch_size):
+        """
+        Close the lap and set up the next one, starting ``batch_size`` websites after this lap's start.
+        """
+        self.start = _target_query(self.shard).with_entities(Website.id) \
+            .filter(Website.id > self.start) \
+            .order_by(Website.id) \
+            .offset(batch_size - 1) \
+            .limit(1) \
+            .scalar() or 0
+        self.cursor, self.wrapped = self.start, False
+        self._save()
+
+
+def iter_probe_targets(batch_size, shard=None, checkpoint=None):
+    """
+    Yield the monitored websites as lists of at most ``batch_size`` ProbeTarget records, in id order. With
+    ``shard=(index, count)`` only the websites with ``id % count == index`` are read.
+
+    Batches are read with keyset pagination (``WHERE id > last_seen ORDER BY id LIMIT n``) rather than OFFSET, so
+    every page is an index range scan and rows inserted or deleted during the sweep do not shift later pages.
+    Only one batch is held in memory at a time, however large the catalogue is.
+
+    With a SweepCheckpoint, the lap starts from its cursor and wraps around (see SweepCheckpoint), and the
+    checkpoint is advanced past each batch once the caller asks for the next one, i.e. once the batch is processed.
+    """
+    query = _target_query(shard)
+    last_id, wrapped = (checkpoint.cursor, checkpoint.wrapped) if checkpoint else (0, False)
+    stop = checkpoint.start if checkpoint else 0
+    while True:
+        page = query.filter(Website.id > last_id)
+        if wrapped:
+            page = page.filter(Website.id <= stop)
+        rows = page \
+            .order_by(Website.id) \
+            .limit(batch_size) \
+            .all()
+        if not rows:
+            if wrapped or not stop:
+                return
+            # Reached the end of the ids; the lap goes on from the first website up to where it started
+            last_id, wrapped = 0, True
+            continue
+        yield [ProbeTarget(*row) for row in rows]
+        last_id = rows[-1][0]
+        if checkpoint:
+            checkpoint.advance(last_id, wrapped)
@@ -0,0 +1,304 @@
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import requests
+from celery import shared_task
+from flask import current_app
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from app.extensions import db, redis_store
+from app.metrics import ERRORS, WEBHOOKS
+from app.models.userwebsite import UserWebsite
+from app.models.webhook import WebhookEndpoint
+
+# Batches that exhausted their retries or were refused by the receiver, newest first, for inspection and replay
+# with `flask webhooks-dead-letters --replay`.
+DEAD_LETTER_KEY = 'watchdog:webhooks:dead'
+SIGNATURE_HEADER = 'X-Watchdog-Signature'
+TIMESTAMP_HEADER = 'X-Watchdog-Timestamp'
+DELIVERY_HEADER = 'X-Watchdog-Delivery'
+
+
+class DeliveryFailed(Exception):
+    """
+    The receiver did not accept the batch. ``retry`` says whether trying again can help; ``retry_after`` is the
+    delay the receiver asked for, if any.
+    """
+
+    def __init__(self, message, retry=True, retry_after=None):
+        super().__init__(message)
+        self.retry = retry
+        self.retry_after = retry_after
+
+
+class UnsafeDestination(ValueError):
+    """
+    The webhook URL points into our own network (or cannot be resolved).
+    """
+
+
+def check_destination(url):
+    """
+    Resolve the host of ``url`` and raise UnsafeDestination unless every address it resolves to is public:
+    loopback, link-local (cloud metadata), private, shared and reserved ranges are refused, so a webhook cannot
+    make the notify workers post into the internal network (Redis, the database, 169.254.169.254, ...).
+    Loopback is let through with WEBHOOK_ALLOW_LOOPBACK, for local receivers in development and tests.
+
+    Checked when an endpoint is registered and again before every delivery, to refuse early. This alone does not
+    stop DNS rebinding, since the HTTP client resolves the host again: deliveries also check the address they
+    actually connected to (see _CheckedPeer).
+    """
+    parts = urlsplit(url)
+    try:
+        infos = socket.getaddrinfo(parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80),
+                                   proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError) as e:
+        raise UnsafeDestination(f'{parts.hostname} cannot be resolved: {e}')
+    for info in infos:
+        check_address(parts.hostname, info[4][0])
+
+
+def check_address(host, address):
+    """
+    Raise UnsafeDestination unless ``address``, one of the IP addresses of ``host``, is public (see
+    check_destination).
+    """
+    address = ipaddress.ip_address(address.split('%')[0])
+    if getattr(address, 'ipv4_mapped', None):
+        address = address.ipv4_mapped
+    if address.is_loopback and current_app.config['WEBHOOK_ALLOW_LOOPBACK']:
+        return
+    if not address.is_global or address.is_multicast:
+        raise UnsafeDestination(f'{host} resolves to the non-public address {address}')
+
+
+def sign(secret, timestamp, body):
+    """
+    HMAC-SHA256 of ``"<timestamp>.<body>"`` with the endpoint's secret, hex encoded. Receivers recompute it to
+    authenticate the request and reject old timestamps to stop replays.
+    """
+    message = f'{timestamp}.'.encode() + body
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+class _CheckedPeer:
+    """
+    Connection mixin closing every new socket whose peer is not a public address, after the connect and before a
+    byte (or a TLS handshake) is sent: whatever the host resolved to at connect time is what gets checked.
+    """
+
+    def _new_conn(self):
+        sock = super()._new_conn()
+        try:
+            check_address(self.host, sock.getpeername()[0])
+        except UnsafeDestination:
+            sock.close()
+            raise
+        return sock
+
+
+class _CheckedHTTPConnection(_CheckedPeer, HTTPConnection):
+    pass
+
+
+class _CheckedHTTPSConnection(_CheckedPeer, HTTPSConnection):
+    pass
+
+
+class _CheckedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _CheckedHTTPConnection
+
+
+class _CheckedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _CheckedHTTPSConnection
+
+
+class _CheckedAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _CheckedHTTPConnectionPool,
+                                                   'https': _CheckedHTTPSConnectionPool}
+
+
+class _SessionPool:
+    """
+    One pooled HTTP session per worker process: connections to a receiver are kept alive and reused across the
+    batches a worker delivers, instead of a TCP and TLS handshake per request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._session = None
+
+    def get(self):
+        # Sockets must not be shared with a forked child; each Celery pool process builds its own session.
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    session = requests.Session()
+                    # No proxies from the environment: the peer address checked must be the receiver's
+                    session.trust_env = False
+                    adapter = _CheckedAdapter(pool_connections=current_app.config['WEBHOOK_POOL_SIZE'],
+                                              pool_maxsize=current_app.config['WEBHOOK_POOL_SIZE'], max_retries=0)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    session.headers['User-Agent'] = 'FlaskWatchdog-Webhooks/1.0'
+                    self._session, self._pid = session, os.getpid()
+        return self._session
+
+
+sessions = _SessionPool()
+
+
+def status_event(website_id, url, status, checked_at):
+    return {
+        'website_id': website_id,
+        'url': url,
+        'status': 'up' if status else 'down',
+        'checked_at': checked_at.isoformat() if checked_at else None,
+    }
+
+
+def enqueue_webhooks(events):
+    """
+    Queue delivery of ``events`` (see ``status_event``) to the webhook endpoints of the subscribers of each website,
+    one task per endpoint with up to ``WEBHOOK_BATCH_SIZE`` events.
+
+    Only queues: the HTTP requests are made by the notify workers, so a slow or dead receiver never holds up the
+    sweep. Failures to queue are logged, never raised.
+    """
+    if not events:
+        return
+    try:
+        rows = db.session.query(WebhookEndpoint.id, UserWebsite.website_id) \
+            .join(UserWebsite, UserWebsite.user_id == WebhookEndpoint.user_id) \
+            .filter(WebhookEndpoint.active.is_(True),
+                    UserWebsite.website_id.in_({event['website_id'] for event in events}))
+        endpoints = {}
+        for endpoint_id, website_id in rows:
+            endpoints.setdefault(endpoint_id, set()).add(website_id)
+
+        batch_size = current_app.config['WEBHOOK_BATCH_SIZE']
+        for endpoint_id, website_ids in endpoints.items():
+            endpoint_events = [event for event in events if event['website_id'] in website_ids]
+            for start in range(0, len(endpoint_events), batch_size):
+                deliver_webhook.delay(endpoint_id, str(uuid.uuid4()), endpoint_events[start:start + batch_size])
+    except Exception as e:
+        current_app.logger.error("Could not queue webhooks for %d status changes: %s", len(events), e)
+        ERRORS.labels('webhook_enqueue').inc()
+
+
+def post_batch(endpoint, delivery_id, events):
+    """
+    POST one signed batch to ``endpoint``; raises DeliveryFailed unless the receiver answers 2xx.
+    """
+    try:
+        check_destination(endpoint.url)
+    except UnsafeDestination as e:
+        raise DeliveryFailed(str(e), retry=False)
+    body = json.dumps({'delivery_id': delivery_id, 'events': events}, separators=(',', ':')).encode()
+    timestamp = str(int(time.time()))
+    headers = {
+        'Content-Type': 'application/json',
+        DELIVERY_HEADER: delivery_id,
+        TIMESTAMP_HEADER: timestamp,
+        SIGNATURE_HEADER: 'sha256=' + sign(endpoint.secret, timestamp, body),
+    }
+    config = current_app.config
+    try:
+        response = sessions.get().post(endpoint.url, data=body, headers=headers, allow_redirects=False,
+                                       timeout=(config['WEBHOOK_CONNECT_TIMEOUT'], config['WEBHOOK_TIMEOUT']))
+    except UnsafeDestination as e:
+        raise DeliveryFailed(str(e), retry=False)
+    except requests.exceptions.RequestException as e:
+        raise DeliveryFailed(f'{type(e).__name__}: {e}')
+    if 200 <= response.status_code < 300:
+        return
+    retry_after = response.headers.get('Retry-After')
+    raise DeliveryFailed(f'HTTP {response.status_code}',
+                         # Other 4xx mean the receiver will refuse the same request again
+                         retry=response.status_code >= 500 or response.status_code in (408, 429),
+                         retry_after=int(retry_after) if retry_after and retry_after.isdigit() else None)
+
+
+def retry_delay(retries):
+    """
+    Exponential backoff with jitter: about WEBHOOK_RETRY_BACKOFF * 2^retries seconds, capped.
+    """
+    config = current_app.config
+    delay = min(config['WEBHOOK_RETRY_BACKOFF'] * 2 ** retries, config['WEBHOOK_RETRY_BACKOFF_MAX'])
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def dead_letter(endpoint_id, delivery_id, events, error):
+    try:
+        with redis_store.pipeline(transaction=False) as pipe:
+            pipe.lpush(DEAD_LETTER_KEY, json.dumps({
+                'endpoint_id': endpoint_id,
+                'delivery_id': delivery_id,
+                'events': events,
+                'error': error,
+                'failed_at': datetime.utcnow().isoformat(),
+            }))
+            pipe.ltrim(DEAD_LETTER_KEY, 0, current_app.config['WEBHOOK_DEAD_LETTER_MAX'] - 1)
+            pipe.execute()
+    except Exception as e:
+        current_app.logger.error("Could not dead-letter webhook delivery %s: %s", delivery_id, e)
+
+
+@shared_task(bind=True, ignore_result=True, acks_late=True, max_retries=None)
+def deliver_webhook(self, endpoint_id, delivery_id, events):
+    """
+    Celery task (notify queue) delivering one batch of status events to a webhook endpoint.
+
+    Retried with exponential backoff (or after the receiver's Retry-After) up to ``WEBHOOK_MAX_RETRIES`` times,
+    then moved to the dead-letter list. A retry keeps the delivery id, so receivers can drop duplicates.
+    """
+    endpoint = db.session.get(WebhookEndpoint, endpoint_id)
+    if endpoint is None or not endpoint.active:
+        return  # deleted or disabled since the batch was queued
+    try:
+        post_batch(endpoint, delivery_id, events)
+    except DeliveryFailed as e:
+        retries = self.request.retries
+        if e.retry and retries < current_app.config['WEBHOOK_MAX_RETRIES']:
+            WEBHOOKS.labels('retried').inc()
+            current_app.logger.warning("Webhook delivery %s to %s failed (%s), retry %d", delivery_id, endpoint.url,
+                                       e, retries + 1)
+            # The receiver's Retry-After is honoured up to the same cap as our own backoff (see config.py)
+            countdown = min(e.retry_after, current_app.config['WEBHOOK_RETRY_BACKOFF_MAX']) if e.retry_after \
+                else retry_delay(retries)
+            raise self.retry(countdown=countdown, exc=e)
+        WEBHOOKS.labels('dead').inc()
+        current_app.logger.error("Webhook delivery %s to %s failed for good: %s", delivery_id, endpoint.url, e)
+        dead_letter(endpoint_id, delivery_id, events, str(e))
+        return
+    WEBHOOKS.labels('delivered').inc()
+
+
+def replay_dead_letters(limit):
+    """
+    Queue up to ``limit`` dead-lettered batches again, oldest first, and return how many were queued.
+    """
+    replayed = 0
+    while replayed < limit:
+        data = redis_store.rpop(DEAD_LETTER_KEY)
+        if data is None:
+            break
+        letter = json.loads(data)
+        deliver_webhook.delay(letter['endpoint_id'], letter['delivery_id'], letter['events'])
+        replayed += 1
+    return replayed
@@ -0,0 +1,149 @@
+import glob
+import os
+import time
+
+from celery.signals import worker_init, worker_process_shutdown, worker_ready
+from flask import g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess, start_http_server)
+from prometheus_client.core import GaugeMetricFamily
+
+from app.extensions import redis_store
+
+# Metric objects are module-level singletons: prometheus_client keeps one registry per process and, when
+# PROMETHEUS_MULTIPROC_DIR is set, writes every sample to a per-process mmap file in that directory. The /metrics
+# view then aggregates the files of the Gunicorn workers, and a Celery worker with CELERY_METRICS_PORT set serves
+# those of its pool processes. Every service needs a directory of its own, emptied when it starts: files left by
+# another service or a previous run would be aggregated too.
+if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    # The metrics below without labels open their sample file right away
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+SWEEP_DURATION = Histogram(
+    'watchdog_sweep_duration_seconds', 'Wall time of a full website status sweep',
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200))
+PROBE_DURATION = Histogram(
+    'watchdog_probe_duration_seconds', 'Latency of a single website probe',
+    buckets=(.05, .1, .25, .5, 1, 2.5, 5, 10, 30))
+PROBE_THROTTLE_WAIT = Histogram(
+    'watchdog_probe_throttle_seconds', 'Time a probe waited for the per-host and global egress limits',
+    buckets=(0, .01, .05, .1, .5, 1, 5, 30))
+PROBES = Counter('watchdog_probes_total', 'Website probes performed', ['result'])
+SPLIT_VOTES = Counter('watchdog_probe_split_votes_total', 'Sites on which the probe locations disagreed')
+DB_COMMIT_DURATION = Histogram(
+    'watchdog_db_commit_duration_seconds', 'Time spent committing sweep results',
+    buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1))
+STATUS_TRANSITIONS = Counter('watchdog_status_transitions_total', 'Website status changes', ['to'])
+EMAILS = Counter('watchdog_emails_total', 'Notification e-mails', ['result'])
+WEBHOOKS = Counter('watchdog_webhook_batches_total', 'Webhook batch deliveries', ['result'])
+ERRORS = Counter('watchdog_errors_total', 'Errors by stage', ['stage'])
+REQUEST_DURATION = Histogram(
+    'watchdog_http_request_duration_seconds', 'HTTP request latency per endpoint',
+    ['endpoint', 'method', 'status'])
+
+
+class BrokerQueueCollector:
+    """
+    Report the length of the Celery broker queues at scrape time.
+    """
+
+    def __init__(self):
+        self.queues = ()
+
+    def collect(self):
+        if not self.queues:
+            return
+        depth = GaugeMetricFamily('watchdog_broker_queue_depth', 'Messages waiting in the broker queue',
+                                  labels=['queue'])
+        try:
+            with redis_store.pipeline(transaction=False) as pipe:
+                for queue in self.queues:
+                    pipe.llen(queue)
+                lengths = pipe.execute()
+        except Exception:
+            # Redis being down must not break the scrape; the absence of the series is the signal.
+            return
+        for queue, length in zip(self.queues, lengths):
+            depth.add_metric([queue], length)
+        yield depth
+
+
+broker_collector = BrokerQueueCollector()
+if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    REGISTRY.register(broker_collector)
+
+
+def _registry():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # Aggregate the sample files of every process instead of reporting this worker only.
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(broker_collector)
+        return registry
+    return REGISTRY
+
+
+def render_metrics():
+    """
+    Return the exposition payload and its content type.
+    """
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+
+def clear_multiprocess_dir():
+    """
+    Delete the sample files of earlier runs from PROMETHEUS_MULTIPROC_DIR (creating it if needed), before any
+    process of this service records a sample.
+    """
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        os.makedirs(path, exist_ok=True)
+        for filename in glob.glob(os.path.join(path, '*.db')):
+            os.remove(filename)
+
+
+def _start_timer():
+    g._metrics_start = time.perf_counter()
+
+
+def _observe_request(response):
+    start = g.pop('_metrics_start', None)
+    if start is not None:
+        REQUEST_DURATION.labels(request.endpoint or 'unmatched', request.method,
+                                response.status_code).observe(time.perf_counter() - start)
+    return response
+
+
+def mark_process_dead(pid):
+    """
+    Drop the live gauges of an exited worker process (multiprocess mode only).
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
+
+
+@worker_init.connect
+def _celery_worker_init(**kwargs):
+    # In the main worker process, before the pool processes are started
+    clear_multiprocess_dir()
+
+
+@worker_ready.connect
+def _celery_worker_ready(**kwargs):
+    port = os.environ.get('CELERY_METRICS_PORT')
+    if port:
+        start_http_server(int(port), registry=_registry())
+
+
+@worker_process_shutdown.connect
+def _celery_process_shutdown(pid=None, **kwargs):
+    mark_process_dead(pid or os.getpid())
+
+
+def init_metrics(app):
+    """
+    Time every request per blueprint endpoint.
+    """
+    broker_collector.queues = tuple(app.config['METRICS_BROKER_QUEUES'])
+    app.before_request(_start_timer)
+    app.after_request(_observe_request)
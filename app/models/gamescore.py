@@ -0,0 +1,54 @@
+from datetime import datetime
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.extensions import db
+
+
+class GameScore(db.Model):
+    """Model for a user's best score in a game, one row per (user, game)."""
+    __tablename__ = "game_score"
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), index=True, nullable=False)
+    game = db.Column(db.String(50), nullable=False)
+    score = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    user = db.relationship('User', back_populates='game_scores')
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'game'),
+    )
+
+    @classmethod
+    def best_for(cls, user_id, game):
+        """Return the user's best score for ``game`` or 0."""
+        score = db.session.query(cls.score).filter_by(user_id=user_id, game=game).scalar()
+        return score or 0
+
+    @classmethod
+    def record(cls, user_id, game, score):
+        """
+        Store ``score`` if it beats the user's best and return the best score afterwards.
+
+        A single INSERT ... ON CONFLICT DO UPDATE ... WHERE score < excluded.score: replaying the same submission, or
+        racing submissions from several tabs, can never lower the stored value, so the write is idempotent.
+        """
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            insert = (postgresql if dialect == 'postgresql' else sqlite).insert
+            stmt = insert(cls).values(user_id=user_id, game=game, score=score, updated_at=datetime.utcnow())
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[cls.user_id, cls.game],
+                set_={'score': stmt.excluded.score, 'updated_at': stmt.excluded.updated_at},
+                where=cls.score < stmt.excluded.score,
+            )
+            db.session.execute(stmt)
+        else:
+            row = cls.query.filter_by(user_id=user_id, game=game).with_for_update().first()
+            if row is None:
+                db.session.add(cls(user_id=user_id, game=game, score=score))
+            elif score > row.score:
+                row.score = score
+        db.session.commit()
+        return cls.best_for(user_id, game)
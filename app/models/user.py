@@ -15,6 +15,8 @@ class User(UserMixin, db.Model):
     last_login = db.Column(db.DateTime, nullable=True)
 
     user_websites = db.relationship('UserWebsite', back_populates='user')
+    game_scores = db.relationship('GameScore', back_populates='user', passive_deletes=True)
+    webhook_endpoints = db.relationship('WebhookEndpoint', back_populates='user', passive_deletes=True)
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -44,4 +46,39 @@ class User(UserMixin, db.Model):
         return self._remaining_notifications > 0
 
     def decrement_notifications(self):
-        self._remaining_notifications -= 1
+        """
+        Consume one notification of this user's quota. Returns False when the quota is exhausted.
+        """
+        consumed = User.reserve_notifications(self.id)
+        db.session.expire(self, ['_remaining_notifications'])  # reloaded on next access
+        return consumed
+
+    @classmethod
+    def reserve_notifications(cls, user_id, count=1):
+        """
+        Atomically take ``count`` notifications from a user's quota, all or nothing.
+
+        This is a single conditional ``UPDATE ... SET n = n - count WHERE id = :id AND n >= count``: the database
+        applies concurrent reservations one after the other on the row, so parallel sweep workers can never
+        overspend a quota. The UPDATE locks the user row until the caller's transaction ends: commit before doing
+        anything slow, such as sending the e-mail (see ``record_status_change``). Returns True if the
+        notifications were reserved. Use ``release_notifications`` to hand back what ends up unused, e.g. when
+        a digest turns out shorter than planned or the e-mail cannot be sent.
+        """
+        if count <= 0:
+            return True
+        reserved = db.session.query(cls) \
+            .filter(cls.id == user_id, cls._remaining_notifications >= count) \
+            .update({cls._remaining_notifications: cls._remaining_notifications - count}, synchronize_session=False)
+        return reserved == 1
+
+    @classmethod
+    def release_notifications(cls, user_id, count=1):
+        """
+        Return ``count`` previously reserved notifications to a user's quota.
+        """
+        if count > 0:
+            db.session.query(cls) \
+                .filter(cls.id == user_id) \
+                .update({cls._remaining_notifications: cls._remaining_notifications + count},
+                        synchronize_session=False)
@@ -0,0 +1,26 @@
+import secrets
+from datetime import datetime
+
+from app.extensions import db
+
+
+class WebhookEndpoint(db.Model):
+    """Model for a user's HTTP endpoint receiving status changes of the user's websites."""
+    __tablename__ = "webhook_endpoint"
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), index=True, nullable=False)
+    url = db.Column(db.String(500), nullable=False)
+    # Shared secret of the HMAC signature; shown to the user once, when the endpoint is created.
+    secret = db.Column(db.String(64), nullable=False, default=lambda: secrets.token_hex(32))
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
+
+    user = db.relationship('User', back_populates='webhook_endpoints')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'url': self.url,
+            'active': self.active,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+        }
@@ -1,5 +1,41 @@
+from urllib.parse import urlsplit
+
 from app.extensions import db
 
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(value, fold_www=False):
+    """
+    Canonical form of a monitored URL as stored in ``Website.url``: the lower-case, IDNA-encoded host, plus the
+    port when it is not the scheme's default. ``Example.COM``, ``https://example.com:443/path`` and
+    ``http://exämple.com`` become ``example.com`` and ``xn--exmple-cua.com``; with ``fold_www`` a leading ``www.``
+    is dropped as well. Returns an empty string when there is no host.
+    """
+    value = value.strip()
+    if '://' not in value:
+        value = 'https://' + value
+    parts = urlsplit(value)
+    host = (parts.hostname or '').rstrip('.')
+    if not host:
+        return ''
+    try:
+        host = host.encode('idna').decode('ascii')
+    except UnicodeError:
+        pass
+    host = host.lower()
+    if fold_www and host.startswith('www.') and host.count('.') > 1:
+        host = host[len('www.'):]
+    if ':' in host:
+        host = f'[{host}]'  # IPv6 literal
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port and port != DEFAULT_PORTS.get(parts.scheme.lower()):
+        host = f'{host}:{port}'
+    return host
+
 
 # Define website model
 class Website(db.Model):
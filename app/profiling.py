@@ -0,0 +1,205 @@
+import cProfile
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from celery.signals import task_postrun, task_prerun
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+profile_logger = logging.getLogger('app.profile')
+
+# Statistics of the request or Celery task running in this thread, if it is being profiled
+_current = ContextVar('query_stats', default=None)
+_listening = False
+_listening_lock = threading.Lock()
+# Profiled Celery tasks in progress, by task id
+_tasks = {}
+
+
+class QueryStats:
+    """
+    SQL statements executed by one request, task or ``capture_queries`` block: how many, how long they took in
+    total, and how often each distinct statement ran. The same statement text run many times with different
+    parameters is the signature of an N+1 (a query per row of an earlier result).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+
+    def repeated(self, threshold):
+        """
+        The statements run at least ``threshold`` times, most frequent first.
+        """
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+    def __repr__(self):
+        return f"<QueryStats {self.count} statements in {self.seconds * 1000:.1f}ms>"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault('_profile_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = conn.info.get('_profile_started')
+    if stats is not None and started:
+        stats.record(statement, time.perf_counter() - started.pop())
+
+
+def install_listeners():
+    """
+    Time the statements of every engine (the primary and the replicas alike). Idempotent; until it is called, or
+    while nothing is being profiled, SQL execution is untouched or pays one context variable lookup.
+    """
+    global _listening
+    with _listening_lock:
+        if not _listening:
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            _listening = True
+
+
+@contextmanager
+def capture_queries():
+    """
+    Count the SQL statements run in this thread inside the block::
+
+        with capture_queries() as stats:
+            client.get('/')
+        assert stats.count <= 5
+
+    Blocks nest: an inner block does not hide its statements from the request or task around it.
+    """
+    install_listeners()
+    outer = _current.get()
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+        if outer is not None:
+            outer.count += stats.count
+            outer.seconds += stats.seconds
+            outer.statements.update(stats.statements)
+
+
+def _shorten(statement, length=200):
+    statement = re.sub(r'\s+', ' ', statement).strip()
+    return statement if len(statement) <= length else statement[:length] + '...'
+
+
+def report(kind, name, stats, seconds, config, profile=None):
+    """
+    Log the statistics of a finished request or task: at INFO when it was slow, at WARNING when a statement ran
+    PROFILE_REPEATED_THRESHOLD times or more. Slow units also get their cProfile dump written, if one was taken.
+    """
+    repeated = stats.repeated(config['PROFILE_REPEATED_THRESHOLD'])
+    slow = seconds * 1000 >= config['PROFILE_SLOW_MS']
+    if not slow and not repeated:
+        return
+    extra = {'profile_kind': kind, 'profile_name': name, 'duration_ms': round(seconds * 1000, 1),
+             'queries': stats.count, 'db_ms': round(stats.seconds * 1000, 1)}
+    if profile is not None and slow:
+        filename = f"{kind}-{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof"
+        path = os.path.join(config['PROFILE_CPROFILE_DIR'], re.sub(r'[^\w.-]', '_', filename))
+        profile.dump_stats(path)
+        extra['cprofile'] = path
+    if repeated:
+        extra['repeated'] = {_shorten(statement): count for statement, count in repeated}
+        profile_logger.warning("Possible N+1 in %s %s: %d statements, %d of them repeated", kind, name,
+                               stats.count, sum(count for _, count in repeated), extra=extra)
+    else:
+        profile_logger.info("Slow %s %s: %.0fms, %d statements in %.0fms", kind, name, seconds * 1000,
+                            stats.count, stats.seconds * 1000, extra=extra)
+
+
+class _Unit:
+    """
+    One profiled request or task: its statistics, the capture_queries block collecting them and the optional
+    cProfile run.
+    """
+
+    def __init__(self, with_cprofile):
+        self.started = time.perf_counter()
+        self.block = capture_queries()
+        self.stats = self.block.__enter__()
+        self.profile = None
+        if with_cprofile:
+            self.profile = cProfile.Profile()
+            try:
+                self.profile.enable()
+            except ValueError:
+                self.profile = None  # another profiler is active in this thread
+
+    def finish(self):
+        if self.profile is not None:
+            self.profile.disable()
+        self.block.__exit__(None, None, None)
+        return time.perf_counter() - self.started
+
+
+def init_profiling(app):
+    """
+    With PROFILE_SQL set, count and time the SQL statements of every request and Celery task, log the slow ones
+    and those repeating a statement (N+1), and tell the browser with a Server-Timing header. PROFILE_CPROFILE_DIR
+    adds a cProfile run to every request and task, dumped there for the slow ones.
+    """
+    if not app.config['PROFILE_SQL']:
+        return
+    install_listeners()
+    config = app.config
+    with_cprofile = bool(config['PROFILE_CPROFILE_DIR'])
+    if with_cprofile:
+        os.makedirs(config['PROFILE_CPROFILE_DIR'], exist_ok=True)
+
+    @app.before_request
+    def start_profiling():
+        g._profile = _Unit(with_cprofile)
+
+    @app.after_request
+    def add_server_timing(response):
+        unit = g.get('_profile')
+        if unit is not None:
+            response.headers.add('Server-Timing', f'db;dur={unit.stats.seconds * 1000:.1f};'
+                                                  f'desc="{unit.stats.count} queries"')
+        return response
+
+    @app.teardown_request
+    def finish_profiling(exc):
+        unit = g.pop('_profile', None)
+        if unit is not None:
+            seconds = unit.finish()
+            report('request', f'{request.method} {request.endpoint or request.path}', unit.stats, seconds, config,
+                   unit.profile)
+
+
+# Connected once for the process rather than per app by init_profiling: tasks run in the app context pushed by
+# create_app, whose config decides whether they are profiled.
+@task_prerun.connect
+def _start_task_profiling(task_id=None, **kwargs):
+    if has_app_context() and current_app.config.get('PROFILE_SQL'):
+        _tasks[task_id] = _Unit(bool(current_app.config['PROFILE_CPROFILE_DIR']))
+
+
+@task_postrun.connect
+def _finish_task_profiling(task_id=None, task=None, **kwargs):
+    unit = _tasks.pop(task_id, None)
+    if unit is not None:
+        report('task', task.name, unit.stats, unit.finish(), current_app.config, unit.profile)
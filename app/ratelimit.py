@@ -0,0 +1,194 @@
+import os
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+import redis
+from limits.storage import Storage
+
+
+class _Window:
+    """
+    Local view of one fixed rate limit window.
+
+    ``synced`` is the last count seen in Redis (our own hits included once pushed), ``pending`` the hits of this
+    process that Redis has not seen yet.
+    """
+    __slots__ = ('expires_at', 'expiry', 'synced', 'pending')
+
+    def __init__(self, expiry, now):
+        self.expiry = expiry
+        self.expires_at = now + expiry
+        self.synced = 0
+        self.pending = 0
+
+    @property
+    def count(self):
+        return self.synced + self.pending
+
+
+class HybridRedisStorage(Storage):
+    """
+    Rate limit storage that counts in process memory and reconciles with Redis in the background.
+
+    Every ``incr`` is answered from the local window, so a request never waits on Redis. A daemon thread pushes the
+    pending hits of all dirty keys to Redis in one pipeline every ``sync_interval`` seconds (or as soon as a key has
+    ``max_pending`` unsynced hits) and pulls back the global counts. The error budget is therefore bounded: a key can
+    over-admit by at most ``max_pending`` hits per process per sync round. When Redis is unreachable the storage
+    keeps enforcing the limits locally (fail open) and retries after ``retry_interval`` seconds.
+
+    Used with ``hybrid+redis://host:port/db?sync_interval=0.25&max_pending=10``; the remaining URL is handed to
+    redis-py as is.
+    """
+
+    STORAGE_SCHEME = ['hybrid+redis', 'hybrid+rediss']
+    KEY_PREFIX = 'hybrid-limits:'
+
+    def __init__(self, uri, wrap_exceptions=False, sync_interval=0.25, max_pending=10, retry_interval=5.0,
+                 **options):
+        parsed = urlparse(uri)
+        params = dict(parse_qsl(parsed.query))
+        self.sync_interval = float(params.pop('sync_interval', sync_interval))
+        self.max_pending = int(params.pop('max_pending', max_pending))
+        self.retry_interval = float(params.pop('retry_interval', retry_interval))
+        redis_uri = urlunparse(parsed._replace(scheme=parsed.scheme.replace('hybrid+', ''), query=urlencode(params)))
+        self.redis = redis.Redis.from_url(redis_uri, socket_timeout=1, socket_connect_timeout=1, **options)
+
+        self._windows = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._redis_down_until = 0.0
+        self._thread = None
+        self._pid = None
+        super().__init__(uri, wrap_exceptions=wrap_exceptions)
+
+    @property
+    def base_exceptions(self):
+        return redis.RedisError
+
+    # -- local path, called on every request -------------------------------------------------------------------
+
+    def _window(self, key, now):
+        window = self._windows.get(key)
+        if window is not None and window.expires_at <= now:
+            window = None
+        return window
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        # limits < 4 passes elastic_expiry (positionally declared in its Storage.incr); later versions drop it.
+        self._ensure_syncer()
+        now = time.time()
+        with self._lock:
+            window = self._window(key, now)
+            if window is None:
+                window = self._windows[key] = _Window(expiry, now)
+            elif elastic_expiry:
+                window.expires_at = now + expiry
+            window.pending += amount
+            count = window.count
+            if window.pending >= self.max_pending:
+                self._wakeup.set()
+        return count
+
+    def get(self, key):
+        with self._lock:
+            window = self._window(key, time.time())
+            return window.count if window else 0
+
+    def get_expiry(self, key):
+        with self._lock:
+            window = self._window(key, time.time())
+            return window.expires_at if window else time.time()
+
+    def check(self):
+        # Local enforcement keeps working without Redis, so the storage itself is always usable.
+        return True
+
+    def clear(self, key):
+        with self._lock:
+            self._windows.pop(key, None)
+        try:
+            self.redis.delete(self.KEY_PREFIX + key)
+        except redis.RedisError:
+            pass
+
+    def reset(self):
+        with self._lock:
+            cleared = len(self._windows)
+            self._windows.clear()
+        try:
+            keys = list(self.redis.scan_iter(match=self.KEY_PREFIX + '*', count=1000))
+            if keys:
+                self.redis.delete(*keys)
+        except redis.RedisError:
+            pass
+        return cleared
+
+    # -- background reconciliation -----------------------------------------------------------------------------
+
+    def _ensure_syncer(self):
+        # The thread does not survive fork(), so Gunicorn/Celery children start their own on first use.
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._thread = threading.Thread(target=self._run, name='ratelimit-sync', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.sync_interval)
+            self._wakeup.clear()
+            try:
+                self.sync()
+            except Exception:
+                # Never let the syncer die: local enforcement continues and the next round retries.
+                pass
+
+    def sync(self):
+        """
+        Push pending hits to Redis in a single pipeline and adopt the global counts and window expiries.
+
+        Returns the number of keys reconciled (0 while Redis is considered down).
+        """
+        now = time.time()
+        if now < self._redis_down_until:
+            return 0
+
+        with self._lock:
+            for key in [key for key, window in self._windows.items() if window.expires_at <= now]:
+                del self._windows[key]
+            batch = [(key, window.pending, window.expiry) for key, window in self._windows.items() if window.pending]
+            for key, pending, _ in batch:
+                self._windows[key].pending -= pending
+        if not batch:
+            return 0
+
+        try:
+            with self.redis.pipeline(transaction=False) as pipe:
+                for key, pending, expiry in batch:
+                    # Create the key with the window TTL only if it does not exist yet, then add our hits.
+                    pipe.set(self.KEY_PREFIX + key, 0, ex=expiry, nx=True)
+                    pipe.incrby(self.KEY_PREFIX + key, pending)
+                    pipe.pttl(self.KEY_PREFIX + key)
+                results = pipe.execute()
+        except redis.RedisError:
+            self._redis_down_until = time.time() + self.retry_interval
+            with self._lock:
+                # Put the hits back so they are pushed once Redis is reachable again.
+                for key, pending, _ in batch:
+                    if key in self._windows:
+                        self._windows[key].pending += pending
+            return 0
+
+        with self._lock:
+            for index, (key, _, _) in enumerate(batch):
+                window = self._windows.get(key)
+                if window is None:
+                    continue
+                count, ttl_ms = results[index * 3 + 1], results[index * 3 + 2]
+                window.synced = count
+                if ttl_ms and ttl_ms > 0:
+                    # Align with the shared window so every process resets at the same moment.
+                    window.expires_at = time.time() + ttl_ms / 1000.0
+        return len(batch)
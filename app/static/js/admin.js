@@ -0,0 +1,19 @@
+// Filter the admin tables as the user types in their search boxes
+function filterTableRows(rowsSelector, value) {
+    document.querySelectorAll(rowsSelector).forEach(function (row) {
+        row.style.display = row.textContent.toLowerCase().indexOf(value) > -1 ? '' : 'none';
+    });
+}
+
+[
+    ['userSearch', '#usersTable tbody tr'],
+    ['websiteSearch', '#websitesTable tbody tr'],
+    ['userWebsiteSearch', '#userWebsitesTable tbody tr'],
+].forEach(function ([inputId, rowsSelector]) {
+    const input = document.getElementById(inputId);
+    if (input) {
+        input.addEventListener('keyup', function () {
+            filterTableRows(rowsSelector, input.value.toLowerCase());
+        });
+    }
+});
@@ -0,0 +1,119 @@
+document.addEventListener("DOMContentLoaded", function () {
+
+    // Dino game
+    const dinoGame = document.getElementById('dino-game');
+    const dino = document.querySelector('.dino');
+    let isJumping = false;
+    let gameStarted = false; // Add this line to track if the game has started
+
+    document.addEventListener('keydown', function (event) {
+        if (!gameStarted && event.code === 'Space') {
+            gameStarted = true; // Set gameStarted to true when spacebar is pressed for the first time
+            startGame();
+        } else if (gameStarted && event.code === 'Space' && !isJumping) {
+            jump();
+        }
+    });
+
+    function startGame() {
+        setInterval(createObstacle, 2000); // Move this line inside startGame function
+    }
+
+    function jump() {
+        isJumping = true;
+        let position = 0;
+        let timerId = setInterval(function () {
+            if (position >= 80) {
+                clearInterval(timerId);
+                let downTimerId = setInterval(function () {
+                    if (position <= 0) {
+                        clearInterval(downTimerId);
+                        isJumping = false;
+                    }
+                    position -= 4;
+                    dino.style.bottom = position + 'px';
+                }, 20);
+            }
+            position += 4;
+            dino.style.bottom = position + 'px';
+        }, 20);
+    }
+
+    function createObstacle() {
+        const obstacle = document.createElement('div');
+        obstacle.classList.add('obstacle');
+        dinoGame.appendChild(obstacle);
+
+
+        // Change the initial position of the obstacle
+        let obstaclePosition = -30;
+        obstacle.style.left = ''; // Remove the "left" style
+        obstacle.style.right = obstaclePosition + 'px'; // Set the "right" style instead
+
+        let obstacleTimerId = setInterval(function () {
+            if (obstaclePosition >= dinoGame.clientWidth) {
+                clearInterval(obstacleTimerId);
+                dinoGame.removeChild(obstacle);
+            } else if (
+                obstaclePosition > dinoGame.clientWidth - 90 &&
+                obstaclePosition < dinoGame.clientWidth - 30 &&
+                dino.style.bottom.slice(0, -2) < 30
+            ) {
+                clearInterval(obstacleTimerId);
+                alert('Game Over!');
+                location.reload();
+            } else {
+                obstaclePosition += 4;
+                obstacle.style.right = obstaclePosition + 'px';
+            }
+        }, 20);
+    }
+
+});
+
+// Live status updates pushed by the sweep (Server-Sent Events)
+const websiteList = document.getElementById('website-list');
+if (window.EventSource && websiteList) {
+    const statusStream = new EventSource(websiteList.dataset.streamUrl);
+    statusStream.addEventListener('status', function (event) {
+        const change = JSON.parse(event.data);
+        const row = document.querySelector('tr[data-website-id="' + change.website_id + '"]');
+        if (!row) {
+            return;
+        }
+        row.querySelector('.website-status').innerHTML = change.status
+            ? '<span class="label label-success">Online</span>'
+            : '<span class="label label-danger">Offline</span>';
+        if (change.checked_at) {
+            row.querySelector('.website-last-checked').textContent =
+                change.checked_at.slice(0, 16).replace('T', ' ');
+        }
+    });
+}
+
+// "Check now": ask the API for an immediate probe; the result arrives on the status stream above
+document.querySelectorAll('.check-now-form').forEach(function (form) {
+    form.addEventListener('submit', function (event) {
+        event.preventDefault();
+        const button = form.querySelector('button');
+        button.disabled = true;
+        fetch(form.dataset.apiUrl, {
+            method: 'POST',
+            body: new FormData(form),
+            headers: {'Accept': 'application/json'},
+            credentials: 'same-origin'
+        }).then(function (response) {
+            return response.json();
+        }).then(function (result) {
+            button.textContent = result.state === 'fresh' ? 'Up to date'
+                : result.state === 'unavailable' ? 'Try later' : 'Checking...';
+        }).catch(function () {
+            button.textContent = 'Try later';
+        }).finally(function () {
+            setTimeout(function () {
+                button.disabled = false;
+                button.textContent = 'Check now';
+            }, 10000);
+        });
+    });
+});
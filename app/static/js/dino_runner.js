@@ -0,0 +1,321 @@
+// Game variables
+let gameStarted = false;
+let gamePaused = false;
+let gameOver = false;
+let score = 0;
+const gameSettings = document.getElementById('dino-game').dataset;
+let highScore = parseInt(gameSettings.highScore, 10) || 0;
+let level = 1;
+let obstacleSpeed = 4;
+let obstacleInterval = 2000;
+let isJumping = false;
+let obstacleTimer = null;
+let clouds = [];
+
+// DOM elements
+const dinoGame = document.getElementById('dino-game');
+const dino = document.getElementById('dino');
+const scoreDisplay = document.getElementById('score-display');
+const highScoreDisplay = document.getElementById('high-score-display');
+const levelDisplay = document.getElementById('level-display');
+const startButton = document.getElementById('start-button');
+const pauseButton = document.getElementById('pause-button');
+const restartButton = document.getElementById('restart-button');
+const gameOverModal = document.getElementById('game-over-modal');
+const finalScoreDisplay = document.getElementById('final-score');
+const pausedOverlay = document.getElementById('paused-overlay');
+
+// Initialize game
+document.addEventListener('DOMContentLoaded', function() {
+    createClouds();
+
+    // Keyboard controls
+    document.addEventListener('keydown', function(event) {
+        if (event.code === 'Space' && gameStarted && !gamePaused && !gameOver && !isJumping) {
+            event.preventDefault();
+            jump();
+        } else if (event.code === 'KeyP' && gameStarted && !gameOver) {
+            event.preventDefault();
+            togglePause();
+        }
+    });
+
+    // Mobile tap to jump
+    dinoGame.addEventListener('touchstart', function(event) {
+        if (gameStarted && !gamePaused && !gameOver && !isJumping) {
+            event.preventDefault();
+            jump();
+        }
+    });
+});
+
+function startGame() {
+    if (gameOver) {
+        resetGame();
+    }
+
+    gameStarted = true;
+    gamePaused = false;
+    gameOver = false;
+    score = 0;
+    level = 1;
+    obstacleSpeed = 4;
+    obstacleInterval = 2000;
+
+    updateDisplay();
+    startButton.disabled = true;
+    pauseButton.disabled = false;
+    pauseButton.textContent = 'Pause';
+
+    spawnObstacles();
+    startScoring();
+}
+
+function togglePause() {
+    if (!gameStarted || gameOver) return;
+
+    gamePaused = !gamePaused;
+
+    if (gamePaused) {
+        pauseButton.textContent = 'Resume';
+        pausedOverlay.style.display = 'flex';
+    } else {
+        pauseButton.textContent = 'Pause';
+        pausedOverlay.style.display = 'none';
+    }
+}
+
+function resetGame() {
+    gameStarted = false;
+    gamePaused = false;
+    gameOver = false;
+    score = 0;
+    level = 1;
+    obstacleSpeed = 4;
+    obstacleInterval = 2000;
+
+    // Clear all obstacles
+    const obstacles = document.querySelectorAll('.obstacle');
+    obstacles.forEach(obstacle => obstacle.remove());
+
+    // Reset button states
+    startButton.disabled = false;
+    pauseButton.disabled = true;
+    pauseButton.textContent = 'Pause';
+
+    // Hide modals
+    gameOverModal.style.display = 'none';
+    pausedOverlay.style.display = 'none';
+
+    // Clear timers
+    if (obstacleTimer) {
+        clearInterval(obstacleTimer);
+    }
+
+    updateDisplay();
+}
+
+function jump() {
+    if (isJumping) return;
+
+    isJumping = true;
+    let position = 0;
+    const maxHeight = 120;
+    const jumpSpeed = 5;
+
+    let upTimer = setInterval(function() {
+        if (position >= maxHeight) {
+            clearInterval(upTimer);
+
+            let downTimer = setInterval(function() {
+                if (position <= 0) {
+                    clearInterval(downTimer);
+                    isJumping = false;
+                }
+                position -= jumpSpeed;
+                dino.style.bottom = (50 + position) + 'px';
+            }, 20);
+        }
+        position += jumpSpeed;
+        dino.style.bottom = (50 + position) + 'px';
+    }, 20);
+}
+
+function spawnObstacles() {
+    if (!gameStarted || gameOver) return;
+
+    obstacleTimer = setInterval(function() {
+        if (!gamePaused && !gameOver) {
+            createObstacle();
+        }
+    }, obstacleInterval);
+}
+
+function createObstacle() {
+    const obstacle = document.createElement('div');
+    obstacle.classList.add('obstacle');
+    dinoGame.appendChild(obstacle);
+
+    let obstaclePosition = -40;
+    obstacle.style.right = obstaclePosition + 'px';
+
+    let moveTimer = setInterval(function() {
+        if (gamePaused) return;
+
+        if (gameOver) {
+            clearInterval(moveTimer);
+            return;
+        }
+
+        obstaclePosition += obstacleSpeed;
+        obstacle.style.right = obstaclePosition + 'px';
+
+        // Check collision
+        const dinoRect = dino.getBoundingClientRect();
+        const obstacleRect = obstacle.getBoundingClientRect();
+
+        if (obstacleRect.right > dinoRect.left &&
+            obstacleRect.left < dinoRect.right &&
+            obstacleRect.bottom > dinoRect.top &&
+            obstacleRect.top < dinoRect.bottom) {
+            clearInterval(moveTimer);
+            endGame();
+            return;
+        }
+
+        // Remove obstacle when off screen
+        if (obstaclePosition > dinoGame.clientWidth + 40) {
+            clearInterval(moveTimer);
+            dinoGame.removeChild(obstacle);
+        }
+    }, 20);
+}
+
+function startScoring() {
+    const scoringTimer = setInterval(function() {
+        if (gameOver) {
+            clearInterval(scoringTimer);
+            return;
+        }
+
+        if (!gamePaused && gameStarted) {
+            score += 1;
+
+            // Level up every 100 points
+            if (score % 100 === 0) {
+                levelUp();
+            }
+
+            updateDisplay();
+        }
+    }, 100);
+}
+
+function levelUp() {
+    level += 1;
+    obstacleSpeed = Math.min(obstacleSpeed + 0.5, 10); // Max speed 10
+    obstacleInterval = Math.max(obstacleInterval - 100, 800); // Min interval 800ms
+
+    // Restart obstacle spawning with new interval
+    clearInterval(obstacleTimer);
+    spawnObstacles();
+}
+
+function updateDisplay() {
+    scoreDisplay.textContent = score;
+    levelDisplay.textContent = level;
+    highScoreDisplay.textContent = highScore;
+}
+
+function endGame() {
+    gameOver = true;
+    gameStarted = false;
+
+    clearInterval(obstacleTimer);
+
+    finalScoreDisplay.textContent = score;
+
+    // Check for new high score
+    let isNewHighScore = false;
+    if (score > highScore) {
+        highScore = score;
+        isNewHighScore = true;
+        highScoreDisplay.textContent = highScore;
+
+        // Save high score to server if authenticated
+        if (gameSettings.authenticated === 'true') {
+            saveHighScore(score);
+        } else {
+            // Save to localStorage for guests
+            localStorage.setItem('dinoHighScore', score);
+        }
+    }
+
+    // Show game over modal
+    if (isNewHighScore) {
+        document.getElementById('new-high-score-badge').style.display = 'block';
+    } else {
+        document.getElementById('new-high-score-badge').style.display = 'none';
+    }
+
+    gameOverModal.style.display = 'flex';
+
+    // Enable restart button
+    startButton.disabled = false;
+    pauseButton.disabled = true;
+}
+
+function saveHighScore(score) {
+    fetch(gameSettings.saveUrl, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': gameSettings.csrfToken
+        },
+        body: JSON.stringify({ score: score })
+    })
+    .then(response => response.json())
+    .then(data => {
+        console.log('High score saved:', data);
+    })
+    .catch(error => {
+        console.error('Error saving high score:', error);
+    });
+}
+
+function createClouds() {
+    for (let i = 0; i < 5; i++) {
+        const cloud = document.createElement('div');
+        cloud.classList.add('cloud');
+        cloud.textContent = '☁️';
+        cloud.style.top = (Math.random() * 150) + 'px';
+        cloud.style.left = (Math.random() * 100) + '%';
+        dinoGame.appendChild(cloud);
+
+        // Animate clouds
+        animateCloud(cloud);
+    }
+}
+
+function animateCloud(cloud) {
+    let position = parseFloat(cloud.style.left);
+
+    setInterval(function() {
+        if (!gamePaused) {
+            position -= 0.1;
+            if (position < -10) {
+                position = 110;
+            }
+            cloud.style.left = position + '%';
+        }
+    }, 50);
+}
+
+function closeGameOverModal() {
+    gameOverModal.style.display = 'none';
+}
+
+// Button event listeners
+startButton.addEventListener('click', startGame);
+pauseButton.addEventListener('click', togglePause);
+restartButton.addEventListener('click', resetGame);
@@ -0,0 +1,185 @@
+import functools
+import json
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from flask import current_app, g, request, session
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
+
+from app.extensions import redis_store
+from app.metrics import ERRORS
+
+# Stands in for the per-session CSRF token in cached pages; every hit gets its own token written into the hole.
+CSRF_HOLE = '\x00csrf-token\x00'
+# Headers tied to the request that rendered the page, never replayed from the cache.
+_UNCACHED_HEADERS = frozenset(('set-cookie', 'content-length', 'date'))
+# Namespaces of the decorated views, for `flask clear-view-cache`.
+CACHED_NAMESPACES = set()
+
+
+class LRUBackend:
+    """
+    Pages in process memory, least recently used evicted first. Each worker process keeps its own copy, so an
+    invalidation only reaches the process that performs it; use the Redis backend when that matters.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, namespace, page, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, page)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, namespace):
+        prefix = f'{namespace}:'
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+
+class RedisBackend:
+    """
+    Pages in Redis, shared by every web process. The keys of a namespace are tracked in a set so that it can be
+    invalidated without a SCAN. Redis errors are logged, counted and treated as misses: the page is rendered instead.
+    """
+    PREFIX = 'viewcache:'
+
+    def get(self, key):
+        try:
+            data = redis_store.get(self.PREFIX + key)
+        except Exception as e:
+            current_app.logger.warning("View cache read failed for %s: %s", key, e)
+            ERRORS.labels('view_cache').inc()
+            return None
+        return json.loads(data) if data is not None else None
+
+    def set(self, key, namespace, page, ttl):
+        index = f'{self.PREFIX}keys:{namespace}'
+        try:
+            with redis_store.pipeline(transaction=False) as pipe:
+                pipe.set(self.PREFIX + key, json.dumps(page), ex=ttl)
+                pipe.sadd(index, self.PREFIX + key)
+                pipe.expire(index, ttl)
+                pipe.execute()
+        except Exception as e:
+            current_app.logger.warning("View cache write failed for %s: %s", key, e)
+            ERRORS.labels('view_cache').inc()
+
+    def invalidate(self, namespace):
+        index = f'{self.PREFIX}keys:{namespace}'
+        try:
+            keys = list(redis_store.smembers(index))
+            redis_store.delete(index, *keys)
+        except Exception as e:
+            current_app.logger.warning("View cache invalidation failed for %s: %s", namespace, e)
+            ERRORS.labels('view_cache').inc()
+
+
+class NullBackend:
+    def get(self, key):
+        return None
+
+    def set(self, key, namespace, page, ttl):
+        pass
+
+    def invalidate(self, namespace):
+        pass
+
+
+def _backend():
+    return current_app.extensions['view_cache']
+
+
+def _auth_state():
+    return 'user' if current_user.is_authenticated else 'anon'
+
+
+def cached_view(namespace, ttl=None, anonymous_only=False, query_args=()):
+    """
+    Serve a GET view from the view cache, rendering it only on a miss.
+
+    The key varies on the namespace (by convention the endpoint name), the auth state ("anon" or "user", for the
+    navbar), the path and the ``query_args`` the view reads, so use it only on views that render the same page for
+    every visitor of the same auth state. A request with any other query argument bypasses the cache, so that
+    made-up query strings cannot fill it. ``anonymous_only`` caches the page for anonymous visitors only, for views
+    that show per-user data to logged-in users.
+
+    The CSRF token of the rendering request is cut out of the stored page and every hit gets its own, so cached
+    forms still submit. A request with pending flash messages bypasses the cache, because base.html renders them.
+    """
+    CACHED_NAMESPACES.add(namespace)
+    allowed = frozenset(query_args)
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or session.get('_flashes') or \
+                    (anonymous_only and current_user.is_authenticated) or not request.args.keys() <= allowed:
+                return view(*args, **kwargs)
+            key = f'{namespace}:{_auth_state()}:{request.path}?{urlencode(sorted(request.args.items(multi=True)))}'
+            page = _backend().get(key)
+            if page is not None:
+                return _replay(page)
+
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                page = _capture(response)
+                _backend().set(key, namespace, page, ttl or current_app.config['VIEW_CACHE_TTL'])
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
+
+
+def _capture(response):
+    body = response.get_data(as_text=True)
+    token = g.get(current_app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token'))
+    if token:
+        body = body.replace(token, CSRF_HOLE)
+    headers = [(name, value) for name, value in response.headers.items() if name.lower() not in _UNCACHED_HEADERS]
+    return response.status_code, headers, body
+
+
+def _replay(page):
+    status, headers, body = page
+    if CSRF_HOLE in body:
+        body = body.replace(CSRF_HOLE, generate_csrf())
+    response = current_app.response_class(body, status=status, headers=headers)
+    response.vary.add('Cookie')
+    return response
+
+
+def invalidate(namespace):
+    """
+    Drop every cached page of ``namespace``.
+    """
+    _backend().invalidate(namespace)
+
+
+def init_view_cache(app):
+    backend = app.config['VIEW_CACHE_TYPE']
+    if backend == 'redis':
+        app.extensions['view_cache'] = RedisBackend()
+    elif backend == 'lru':
+        app.extensions['view_cache'] = LRUBackend(app.config['VIEW_CACHE_MAX_ENTRIES'])
+    else:
+        app.extensions['view_cache'] = NullBackend()
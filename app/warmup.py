@@ -0,0 +1,59 @@
+import os
+import time
+
+from sqlalchemy.orm import configure_mappers
+
+from app.assets import fingerprints
+from app.compression import ENCODING_SUFFIXES
+from app.extensions import db, redis_store
+
+
+def warm_up(app):
+    """
+    Do the one-off work a fresh process would otherwise do on its first requests: compile every Jinja template,
+    configure the ORM mappers, build the URL matcher and hash the static assets.
+
+    With Gunicorn's ``preload_app`` this runs once in the master, before the workers are forked, so every worker
+    starts with the results in memory pages it shares with the master. Returns the seconds spent.
+    """
+    started = time.perf_counter()
+    with app.app_context():
+        configure_mappers()
+        app.url_map.update()
+        for name in app.jinja_env.list_templates(filter_func=lambda name: name.endswith('.html')):
+            app.jinja_env.get_template(name)
+        static_folder = app.static_folder
+        for root, _, files in os.walk(static_folder):
+            for filename in files:
+                if not filename.endswith(tuple(suffix for _, suffix in ENCODING_SUFFIXES)):
+                    fingerprints.digest(os.path.relpath(os.path.join(root, filename), static_folder))
+    return time.perf_counter() - started
+
+
+def reset_connections(app):
+    """
+    Drop the database and Redis connections inherited from the parent process, without closing them: the parent
+    (or a sibling) may still be using the sockets. The child opens its own on first use.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    redis_store.connection_pool.reset()
+
+
+def prime_connections(app):
+    """
+    Open a database connection per engine and one to Redis, so the first request of a worker does not pay for the
+    handshakes. Failures are logged, never raised: a worker must start even if a backend is down.
+    """
+    with app.app_context():
+        for key, engine in db.engines.items():
+            try:
+                with engine.connect() as connection:
+                    connection.execute(db.text('SELECT 1'))
+            except Exception as e:
+                app.logger.warning("Could not open a connection to database %s: %s", key or 'primary', e)
+        try:
+            redis_store.ping()
+        except Exception as e:
+            app.logger.warning("Could not open a connection to Redis: %s", e)
@@ -0,0 +1,130 @@
+"""
+Measure bytes on the wire and CPU per request of response compression.
+
+Seeds a scratch SQLite database with an admin and ``--websites`` websites, logs in and fetches the admin page (a
+large HTML table) and the websites API ``--requests`` times for every setting:
+
+    identity    compression disabled
+    gzip-N      gzip at level N (COMPRESS_GZIP_LEVEL)
+    br-N        brotli at quality N (COMPRESS_BROTLI_QUALITY)
+
+and reports the response size and the process CPU time per request. The static assets are compared as served
+uncompressed and as precompressed at build time (``flask compress-assets``), which costs no CPU per request.
+
+Usage:
+
+    python -m benchmarks.compression_bench --websites 2000 --requests 50
+"""
+import argparse
+import gzip
+import os
+import tempfile
+import time
+
+from app.compression import brotli
+
+SETTINGS = [('identity', None, None), ('gzip-1', 'gzip', 1), ('gzip-6', 'gzip', 6), ('br-4', 'br', 4)]
+if brotli is None:
+    SETTINGS = [setting for setting in SETTINGS if setting[1] != 'br']
+
+
+def build_app(workdir, encoding, level):
+    from app import create_app
+    from config import TestingConfig
+
+    bench_config = type('BenchConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'WTF_CSRF_ENABLED': False,
+        'RATELIMIT_ENABLED': False,
+        'REDIS_URL': 'redis://127.0.0.1:1/0',  # fail fast: the status version falls back to hashing the payload
+        'COMPRESS_ENABLED': encoding is not None,
+        'COMPRESS_GZIP_LEVEL': level or 6,
+        'COMPRESS_BROTLI_QUALITY': level or 4,
+        'LOG_DIR': os.path.join(workdir, 'logs'),
+        'LOG_TO_STDERR': False,
+        'SECRET_KEY': 'bench',
+    })
+    return create_app(bench_config)[0]
+
+
+def seed(db, websites):
+    from app.models.user import User
+    from app.models.userwebsite import UserWebsite
+    from app.models.website import Website
+
+    db.drop_all()
+    db.create_all()
+    admin = User(email='admin@example.com', is_admin=True)
+    admin.set_password('password')
+    db.session.add(admin)
+    db.session.flush()
+    db.session.execute(Website.__table__.insert(), [
+        {'url': f'site-{n}.example.com', 'status': n % 7 != 0} for n in range(websites)
+    ])
+    db.session.execute(UserWebsite.__table__.insert(), [
+        {'user_id': admin.id, 'website_id': website_id} for website_id, in db.session.query(Website.id)
+    ])
+    db.session.commit()
+
+
+def measure(client, path, encoding, count):
+    headers = {'Accept-Encoding': encoding} if encoding else {}
+    client.get(path, headers=headers)  # warm up templates and caches
+    sizes = []
+    started = time.process_time()
+    for _ in range(count):
+        sizes.append(len(client.get(path, headers=headers).data))
+    return max(sizes), (time.process_time() - started) / count
+
+
+def run(args):
+    from app.extensions import db
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, encoding, level in SETTINGS:
+            flask_app = build_app(workdir, encoding, level)
+            with flask_app.app_context():
+                if not results:
+                    seed(db, args.websites)
+                client = flask_app.test_client()
+                client.post('/auth/login', data={'email': 'admin@example.com', 'password': 'password'})
+                results[name] = {path: measure(client, path, encoding, args.requests)
+                                 for path in ('/auth/admin', '/api/v1/websites')}
+                db.session.remove()
+    return results
+
+
+def static_sizes(static_folder):
+    raw = gzipped = brotlied = 0
+    for root, _, files in os.walk(static_folder):
+        for filename in files:
+            if not filename.endswith(('.css', '.js')):
+                continue
+            with open(os.path.join(root, filename), 'rb') as asset:
+                data = asset.read()
+            raw += len(data)
+            gzipped += len(gzip.compress(data, compresslevel=9))
+            brotlied += len(brotli.compress(data, quality=11)) if brotli is not None else 0
+    return raw, gzipped, brotlied
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--websites', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+
+    results = run(args)
+    print(f"{'setting':<10} {'path':<18} {'bytes':>10} {'CPU ms/req':>11} {'added ms':>9}")
+    for name, paths in results.items():
+        for path, (size, cpu) in paths.items():
+            added = (cpu - results['identity'][path][1]) * 1e3
+            print(f"{name:<10} {path:<18} {size:>10} {cpu * 1e3:>11.2f} {added:>9.2f}")
+
+    raw, gzipped, brotlied = static_sizes(os.path.join(os.path.dirname(__file__), '..', 'app', 'static'))
+    print(f"\nstatic css+js: {raw} bytes raw, {gzipped} gzip-9, {brotlied or '-'} brotli-11 (precompressed, 0 CPU/req)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+Scripted load scenarios against a running FlaskWatchdog instance.
+
+Virtual users log in as accounts created by ``flask seed-scale`` and loop over a weighted mix of scenarios:
+
+    login       GET the login form and POST the credentials (fresh session every time)
+    dashboard   GET / as a logged-in user
+    add_delete  add a website from the dashboard form, then delete it again
+    admin       GET /auth/admin as the seeded admin
+
+Throughput and tail latency are reported per request step. Typical run against a local Gunicorn:
+
+    flask seed-scale --users 1000 --websites 50000
+    RATELIMIT_ENABLED=false gunicorn --config gunicorn.py run:app
+    python -m benchmarks.loadtest --base-url http://localhost:5000 --concurrency 20 --duration 60
+
+Rate limiting must be disabled on the target, otherwise every virtual user shares one client IP and the run
+measures 429 responses (they are counted separately).
+"""
+import argparse
+import random
+import re
+import statistics
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import requests
+
+CSRF_RE = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+SEED_EMAIL = 'seed-user-{}@example.com'
+SEED_ADMIN_EMAIL = 'seed-admin@example.com'
+
+
+class Recorder:
+    """
+    Thread-safe collection of (step -> latencies, status counts).
+    """
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.throttled = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def request(self, session, step, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = session.request(method, url, timeout=30, **kwargs)
+        except requests.RequestException:
+            with self.lock:
+                self.errors[step] += 1
+            return None
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            if response.status_code == 429:
+                self.throttled[step] += 1
+            elif response.status_code >= 400:
+                self.errors[step] += 1
+            else:
+                self.latencies[step].append(elapsed)
+        return response
+
+
+def csrf_token(response):
+    match = CSRF_RE.search(response.text) if response is not None else None
+    return match.group(1) if match else None
+
+
+class VirtualUser:
+    def __init__(self, base_url, email, password, recorder):
+        self.base_url = base_url.rstrip('/')
+        self.email = email
+        self.password = password
+        self.recorder = recorder
+        self.session = None
+
+    def url(self, path):
+        return self.base_url + path
+
+    def login(self, step='login'):
+        self.session = requests.Session()
+        form = self.recorder.request(self.session, f'{step} GET /auth/login', 'GET', self.url('/auth/login'))
+        self.recorder.request(self.session, f'{step} POST /auth/login', 'POST', self.url('/auth/login'),
+                              data={'email': self.email, 'password': self.password, 'csrf_token': csrf_token(form)},
+                              allow_redirects=False)
+
+    def ensure_session(self):
+        if self.session is None:
+            self.login(step='setup')
+
+    def dashboard(self):
+        self.ensure_session()
+        self.recorder.request(self.session, 'dashboard GET /', 'GET', self.url('/'))
+
+    def add_delete(self):
+        self.ensure_session()
+        page = self.recorder.request(self.session, 'add_delete GET /', 'GET', self.url('/'))
+        host = f"loadtest-{uuid.uuid4().hex[:12]}.example.com"
+        self.recorder.request(self.session, 'add_delete POST /', 'POST', self.url('/'),
+                              data={'url': f'https://{host}/', 'csrf_token': csrf_token(page)},
+                              allow_redirects=False)
+        page = self.recorder.request(self.session, 'add_delete GET / (after add)', 'GET', self.url('/'))
+        match = page is not None and re.search(
+            re.escape(f'<td>{host}</td>') + r'.*?action="/delete/(\d+)"', page.text, re.DOTALL)
+        if match:
+            self.recorder.request(self.session, 'add_delete POST /delete', 'POST',
+                                  self.url(f'/delete/{match.group(1)}'),
+                                  data={'csrf_token': csrf_token(page)}, allow_redirects=False)
+
+    def admin(self):
+        self.ensure_session()
+        self.recorder.request(self.session, 'admin GET /auth/admin', 'GET', self.url('/auth/admin'))
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {'login', 'dashboard', 'add_delete', 'admin'}
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def worker(args, mix, recorder, deadline, worker_id):
+    rng = random.Random(worker_id)
+    scenarios, weights = zip(*mix.items())
+    user = VirtualUser(args.base_url, SEED_EMAIL.format(rng.randrange(args.accounts)), args.password, recorder)
+    admin = VirtualUser(args.base_url, SEED_ADMIN_EMAIL, args.password, recorder)
+    while time.monotonic() < deadline:
+        scenario = rng.choices(scenarios, weights)[0]
+        if scenario == 'login':
+            user.login()
+        elif scenario == 'admin':
+            admin.admin()
+        else:
+            getattr(user, scenario)()
+
+
+def percentile(samples, pct):
+    if len(samples) < 2:
+        return samples[0] if samples else 0.0
+    return statistics.quantiles(samples, n=100, method='inclusive')[pct - 1]
+
+
+def report(recorder, elapsed):
+    print(f"{'step':<32} {'ok':>7} {'err':>5} {'429':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    steps = sorted(set(recorder.latencies) | set(recorder.errors) | set(recorder.throttled))
+    for step in steps:
+        samples = recorder.latencies[step]
+        print(f"{step:<32} {len(samples):>7} {recorder.errors[step]:>5} {recorder.throttled[step]:>5} "
+              f"{len(samples) / elapsed:>8.1f} {percentile(samples, 50) * 1000:>8.1f} "
+              f"{percentile(samples, 95) * 1000:>8.1f} {percentile(samples, 99) * 1000:>8.1f}")
+    total = sum(len(samples) for samples in recorder.latencies.values())
+    print(f"total: {total} successful requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://localhost:5000')
+    parser.add_argument('--concurrency', type=int, default=10, help='Number of virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('login=1,dashboard=6,add_delete=2,admin=1'))
+    parser.add_argument('--accounts', type=int, default=100,
+                        help='Pick virtual users from the first N seeded accounts (the first ones are power users)')
+    parser.add_argument('--password', default='seed-password')
+    args = parser.parse_args()
+
+    recorder = Recorder()
+    started = time.monotonic()
+    deadline = started + args.duration
+    threads = [threading.Thread(target=worker, args=(args, args.mix, recorder, deadline, n), daemon=True)
+               for n in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report(recorder, time.monotonic() - started)
+
+
+if __name__ == '__main__':
+    main()
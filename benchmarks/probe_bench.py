@@ -0,0 +1,201 @@
+"""
+End-to-end benchmark of the website status sweep.
+
+Starts a local site farm (see benchmarks/sitefarm.py), seeds a scratch SQLite database with one Website per virtual
+site, runs ``check_website_status`` in process and reports:
+
+    sites/s, p50/p99 probe latency, SQL statements issued and peak RSS.
+
+Every run is appended to ``benchmarks/results/probe_bench.jsonl`` together with the git commit, and compared with
+the previous run that used the same parameters so regressions show up between commits.
+
+Usage:
+
+    python -m benchmarks.probe_bench --sites 2000 --latency lognormal:3.5,0.8 --probe-timeout 2
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from unittest import mock
+
+from sqlalchemy import event
+
+from benchmarks.sitefarm import FarmProfile, SiteFarm, install_resolver, uninstall_resolver
+
+RESULTS_FILE = os.path.join(os.path.dirname(__file__), 'results', 'probe_bench.jsonl')
+
+# Metrics where a higher value is a regression (everything except throughput).
+LOWER_IS_BETTER = ('p50_probe_ms', 'p99_probe_ms', 'sql_statements', 'peak_rss_mb')
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def percentile(samples, pct):
+    if len(samples) < 2:
+        return samples[0] if samples else 0.0
+    return statistics.quantiles(samples, n=100, method='inclusive')[pct - 1]
+
+
+def build_app(workdir, probe_timeout, concurrency=1, global_rate=0):
+    from app import create_app
+    from config import TestingConfig
+
+    bench_config = type('BenchConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'PROBE_TIMEOUT': probe_timeout,
+        'PROBE_CONCURRENCY': concurrency,
+        # Every virtual site is served by the one farm server, so per-host limits would serialise the run.
+        'PROBE_HOST_RATE': 0,
+        'PROBE_GLOBAL_RATE': global_rate,
+        # Status publishes and the sweep heartbeat fail fast (connection refused) instead of waiting on DNS.
+        'REDIS_URL': 'redis://127.0.0.1:1/0',
+        'MAIL_SUPPRESS_SEND': True,
+        'LOG_DIR': os.path.join(workdir, 'logs'),
+        'LOG_TO_STDERR': False,
+        'SECRET_KEY': 'bench',
+    })
+    flask_app, _ = create_app(bench_config)
+    return flask_app
+
+
+def seed(db, urls, subscribe_every):
+    from app.models.user import User
+    from app.models.userwebsite import UserWebsite
+    from app.models.website import Website
+
+    db.create_all()
+    user = User(email='bench@example.com')
+    user.set_password('bench-password')
+    user.remaining_notifications = len(urls)
+    db.session.add(user)
+    db.session.commit()
+
+    db.session.execute(Website.__table__.insert(), [{'url': url, 'status': False} for url in urls])
+    website_ids = [website_id for website_id, in db.session.query(Website.id).order_by(Website.id)]
+    if subscribe_every:
+        db.session.execute(UserWebsite.__table__.insert(), [
+            {'user_id': user.id, 'website_id': website_id, 'created_at': datetime.utcnow()}
+            for website_id in website_ids[::subscribe_every]
+        ])
+    db.session.commit()
+
+
+def run(args):
+    from app.extensions import db
+    from app.main import probes, routes
+
+    profile = FarmProfile(latency=args.latency, error_rate=args.error_rate, redirect_rate=args.redirect_rate,
+                          large_rate=args.large_rate, reset_rate=args.reset_rate, hang_rate=args.hang_rate,
+                          hang_seconds=args.probe_timeout * 2)
+    install_resolver()
+    with SiteFarm(args.sites, profile, seed=args.seed) as farm, tempfile.TemporaryDirectory() as workdir:
+        flask_app = build_app(workdir, args.probe_timeout, args.concurrency, args.global_rate)
+        with flask_app.app_context():
+            seed(db, farm.urls(), args.subscribe_every)
+
+            statements = []
+            event.listen(db.engine, 'before_cursor_execute', lambda *a, **k: statements.append(1))
+
+            latencies = []
+            check_url_status = probes.check_url_status
+
+            def timed_check_url_status(*a, **k):
+                started = time.perf_counter()
+                try:
+                    return check_url_status(*a, **k)
+                finally:
+                    latencies.append(time.perf_counter() - started)
+
+            with mock.patch.object(probes, 'check_url_status', timed_check_url_status):
+                started = time.perf_counter()
+                routes.check_website_status()
+                elapsed = time.perf_counter() - started
+        hits = dict(farm.hits)
+    uninstall_resolver()
+
+    return {
+        'sites_per_s': round(args.sites / elapsed, 2),
+        'elapsed_s': round(elapsed, 3),
+        'p50_probe_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99_probe_ms': round(percentile(latencies, 99) * 1000, 2),
+        'sql_statements': len(statements),
+        # ru_maxrss is in kilobytes on Linux.
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'farm_hits': hits,
+    }
+
+
+def previous_result(params):
+    if not os.path.exists(RESULTS_FILE):
+        return None
+    previous = None
+    with open(RESULTS_FILE) as results:
+        for line in results:
+            entry = json.loads(line)
+            if entry['params'] == params:
+                previous = entry
+    return previous
+
+
+def store_result(entry):
+    os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+    with open(RESULTS_FILE, 'a') as results:
+        results.write(json.dumps(entry) + '\n')
+
+
+def report(result, previous):
+    print(f"{'metric':<16} {'value':>12} {'previous':>12} {'change':>9}")
+    for metric in ('sites_per_s', 'p50_probe_ms', 'p99_probe_ms', 'sql_statements', 'peak_rss_mb'):
+        value = result[metric]
+        line = f"{metric:<16} {value:>12}"
+        if previous:
+            before = previous['result'][metric]
+            change = (value - before) / before * 100 if before else 0.0
+            worse = change > 0 if metric in LOWER_IS_BETTER else change < 0
+            flag = ' !' if worse and abs(change) >= 10 else ''
+            line += f" {before:>12} {change:>+8.1f}%{flag}"
+        print(line)
+    if previous:
+        print(f"(compared with {previous['commit']} from {previous['timestamp']}; '!' marks a >=10% regression)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sites', type=int, default=1000)
+    parser.add_argument('--latency', default='lognormal:3.5,0.8', help='fixed:MS, uniform:MIN,MAX or lognormal:MU,SIGMA')
+    parser.add_argument('--error-rate', type=float, default=0.03)
+    parser.add_argument('--redirect-rate', type=float, default=0.05)
+    parser.add_argument('--large-rate', type=float, default=0.02)
+    parser.add_argument('--reset-rate', type=float, default=0.01)
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='Sites that hang past the probe timeout')
+    parser.add_argument('--probe-timeout', type=float, default=2.0)
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent probes (PROBE_CONCURRENCY)')
+    parser.add_argument('--global-rate', type=float, default=0, help='Probes per second cap, 0 for none')
+    parser.add_argument('--subscribe-every', type=int, default=10, help='Subscribe the bench user to every Nth site')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-store', action='store_true', help='Do not append the result to the results file')
+    args = parser.parse_args()
+
+    params = {key: value for key, value in vars(args).items() if key != 'no_store'}
+    result = run(args)
+    previous = previous_result(params)
+    report(result, previous)
+    if not args.no_store:
+        store_result({'commit': git_commit(), 'timestamp': datetime.utcnow().isoformat(), 'params': params,
+                      'result': result})
+
+
+if __name__ == '__main__':
+    main()
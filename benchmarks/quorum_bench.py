@@ -0,0 +1,115 @@
+"""
+Measure false status flips of single-location probing against quorum probing from several locations.
+
+Starts a local site farm whose requests fail transiently at ``--flap-rate`` (see benchmarks/sitefarm.py), seeds
+a scratch SQLite database with every site already in its true state, and runs ``check_website_status`` once per
+configuration:
+
+    local       the sweep probes every site itself with --probe-timeout
+    quorum      --locations in-process Celery workers (memory broker), one per probe location, each probing with
+                --location-timeout; a status needs a majority of the locations
+
+Every status that differs from the farm's truth after the sweep is a false flip (a false alarm in production).
+
+Usage:
+
+    python -m benchmarks.quorum_bench --sites 500 --flap-rate 0.05 --locations 3
+"""
+import argparse
+import os
+import tempfile
+import time
+from contextlib import ExitStack
+
+from benchmarks.sitefarm import FarmProfile, SiteFarm, install_resolver, uninstall_resolver
+
+
+def build_app(workdir, args, locations):
+    from app import create_app
+    from config import TestingConfig
+
+    bench_config = type('BenchConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'PROBE_TIMEOUT': args.probe_timeout,
+        'PROBE_LOCATIONS': locations,
+        'PROBE_LOCATION_TIMEOUT': args.location_timeout,
+        'PROBE_LOCATION_BUDGET': args.budget,
+        'CELERY_BROKER_URL': 'memory://',
+        'CELERY_RESULT_BACKEND': 'cache+memory://',
+        'MAIL_SUPPRESS_SEND': True,
+        'LOG_DIR': os.path.join(workdir, 'logs'),
+        'LOG_TO_STDERR': False,
+        'SECRET_KEY': 'bench',
+    })
+    return create_app(bench_config)
+
+
+def seed(db, farm):
+    from app.models.website import Website
+
+    db.create_all()
+    db.session.execute(Website.__table__.insert(), [
+        {'url': farm.url_for(site), 'status': farm.expected_up(site)} for site in range(farm.sites)
+    ])
+    db.session.commit()
+
+
+def run(args, farm, locations):
+    from celery.contrib.testing.worker import start_worker
+
+    from app.extensions import db
+    from app.main import routes
+    from app.main.probes import probe_queue
+    from app.models.website import Website
+
+    with tempfile.TemporaryDirectory() as workdir, ExitStack() as workers:
+        flask_app, celery = build_app(workdir, args, locations)
+        celery.conf.worker_hijack_root_logger = False
+        with flask_app.app_context():
+            seed(db, farm)
+            for location in locations:
+                workers.enter_context(start_worker(celery, pool='solo', perform_ping_check=False,
+                                                   queues=[probe_queue(location)], hostname=f'probe-{location}@bench'))
+            started = time.perf_counter()
+            routes.check_website_status()
+            elapsed = time.perf_counter() - started
+            statuses = dict(db.session.query(Website.url, Website.status))
+            db.session.remove()
+
+    false_downs = sum(1 for site in range(farm.sites)
+                      if farm.expected_up(site) and not statuses[farm.url_for(site)])
+    false_ups = sum(1 for site in range(farm.sites)
+                    if not farm.expected_up(site) and statuses[farm.url_for(site)])
+    return {'elapsed_s': elapsed, 'false_downs': false_downs, 'false_ups': false_ups}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sites', type=int, default=500)
+    parser.add_argument('--latency', default='lognormal:3.5,0.8', help='fixed:MS, uniform:MIN,MAX or lognormal:MU,SIGMA')
+    parser.add_argument('--flap-rate', type=float, default=0.05, help='Fraction of requests reset at random')
+    parser.add_argument('--locations', type=int, default=3)
+    parser.add_argument('--probe-timeout', type=float, default=10.0, help='Timeout of single-location probing')
+    parser.add_argument('--location-timeout', type=float, default=1.0, help='Timeout of each location in quorum mode')
+    parser.add_argument('--budget', type=float, default=300.0, help='Per-batch budget of a location')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    profile = FarmProfile(latency=args.latency, hang_rate=0.0, flap_rate=args.flap_rate)
+    install_resolver()
+    try:
+        with SiteFarm(args.sites, profile, seed=args.seed) as farm:
+            results = {
+                'local': run(args, farm, []),
+                'quorum': run(args, farm, [f'loc{n}' for n in range(args.locations)]),
+            }
+    finally:
+        uninstall_resolver()
+
+    print(f"{'mode':<8} {'elapsed s':>10} {'false downs':>12} {'false ups':>10}")
+    for mode, result in results.items():
+        print(f"{mode:<8} {result['elapsed_s']:>10.2f} {result['false_downs']:>12} {result['false_ups']:>10}")
+
+
+if __name__ == '__main__':
+    main()
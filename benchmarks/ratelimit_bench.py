@@ -0,0 +1,92 @@
+"""
+Compare the Redis cost of the rate limiter storages.
+
+For every storage URI the script serves N requests through a minimal Flask app guarded by ``@limiter.limit`` and
+reports the added latency per request (against an unlimited route) and the number of Redis commands issued per
+request, read from ``INFO stats`` before and after the run.
+
+Usage (needs a reachable Redis):
+
+    python -m benchmarks.ratelimit_bench --redis redis://localhost:6379/15 --requests 5000
+"""
+import argparse
+import statistics
+import time
+
+import redis
+from flask import Flask
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+
+import app.ratelimit  # noqa: F401 -- registers hybrid+redis://
+
+
+def build_app(storage_uri):
+    flask_app = Flask(__name__)
+    limiter = Limiter(get_remote_address, app=flask_app, storage_uri=storage_uri, headers_enabled=False)
+
+    @flask_app.route('/limited')
+    @limiter.limit('1000000 per minute')
+    def limited():
+        return 'ok'
+
+    @flask_app.route('/unlimited')
+    @limiter.exempt
+    def unlimited():
+        return 'ok'
+
+    return flask_app, limiter
+
+
+def time_requests(client, path, count):
+    samples = []
+    for _ in range(count):
+        started = time.perf_counter()
+        client.get(path)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def commands_processed(connection):
+    return connection.info('stats')['total_commands_processed']
+
+
+def run(storage_uri, redis_url, count):
+    connection = redis.Redis.from_url(redis_url)
+    connection.flushdb()
+    flask_app, limiter = build_app(storage_uri)
+    client = flask_app.test_client()
+
+    baseline = time_requests(client, '/unlimited', count)
+    before = commands_processed(connection)
+    limited = time_requests(client, '/limited', count)
+    storage = limiter.storage
+    if hasattr(storage, 'sync'):
+        storage.sync()  # flush what the background thread has not pushed yet, so the count is complete
+    # INFO itself counts as one command.
+    redis_ops = commands_processed(connection) - before - 1
+
+    return {
+        'storage': storage_uri,
+        'p50_added_us': (statistics.median(limited) - statistics.median(baseline)) * 1e6,
+        'p99_added_us': (statistics.quantiles(limited, n=100)[98] - statistics.quantiles(baseline, n=100)[98]) * 1e6,
+        'redis_ops_per_request': redis_ops / count,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--redis', default='redis://localhost:6379/15', help='Scratch Redis database (flushed)')
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    storages = [args.redis, args.redis.replace('redis://', 'hybrid+redis://', 1)]
+    print(f"{'storage':<45} {'p50 added':>12} {'p99 added':>12} {'redis ops/req':>14}")
+    for storage_uri in storages:
+        result = run(storage_uri, args.redis, args.requests)
+        print(f"{result['storage']:<45} {result['p50_added_us']:>10.1f}us {result['p99_added_us']:>10.1f}us "
+              f"{result['redis_ops_per_request']:>14.3f}")
+
+
+if __name__ == '__main__':
+    main()
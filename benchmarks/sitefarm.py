@@ -0,0 +1,209 @@
+"""
+A local "simulated internet" for probe benchmarks and tests.
+
+One threaded HTTP server on 127.0.0.1 answers for any number of virtual sites named ``site-<n>.<domain>``. Each site
+gets a fixed behaviour drawn from a seeded profile: healthy, server error, redirect, large body, connection reset or
+hang past the probe timeout. Response latency is sampled per request from a configurable distribution, and a
+``flap_rate`` fraction of all requests is reset regardless of the site, to simulate transient network trouble.
+
+``install_resolver()`` patches ``socket.getaddrinfo`` so that every ``*.bench.test`` hostname resolves to the farm,
+which lets the real probe code run unmodified against URLs such as ``http://site-42.bench.test:8123/``.
+"""
+import random
+import socket
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DOMAIN = 'bench.test'
+
+BEHAVIOURS = ('ok', 'error', 'redirect', 'large', 'reset', 'hang')
+
+
+def parse_latency(spec):
+    """
+    Turn a latency spec (milliseconds) into a sampler returning seconds.
+
+    ``fixed:20``, ``uniform:5,200`` or ``lognormal:3.5,0.8`` (mu and sigma of the underlying normal, so the median
+    of ``lognormal:3.5,0.8`` is e^3.5 = 33 ms).
+    """
+    kind, _, params = spec.partition(':')
+    values = [float(value) for value in params.split(',') if value]
+    if kind == 'fixed':
+        return lambda rng: values[0] / 1000.0
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(values[0], values[1]) / 1000.0
+    if kind == 'lognormal':
+        return lambda rng: rng.lognormvariate(values[0], values[1]) / 1000.0
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class FarmProfile:
+    """
+    Behaviour mix of the farm. Rates are fractions of the sites; the remainder answers 200 OK.
+    """
+
+    def __init__(self, latency='lognormal:3.5,0.8', error_rate=0.03, redirect_rate=0.05, large_rate=0.02,
+                 reset_rate=0.01, hang_rate=0.01, large_body_bytes=1 << 20, hang_seconds=30.0, flap_rate=0.0):
+        self.latency = latency
+        self.flap_rate = flap_rate
+        self.rates = {
+            'error': error_rate,
+            'redirect': redirect_rate,
+            'large': large_rate,
+            'reset': reset_rate,
+            'hang': hang_rate,
+        }
+        self.large_body_bytes = large_body_bytes
+        self.hang_seconds = hang_seconds
+
+    def behaviour_for(self, site, seed):
+        roll = random.Random(f"{seed}:{site}").random()
+        for behaviour, rate in self.rates.items():
+            if roll < rate:
+                return behaviour
+            roll -= rate
+        return 'ok'
+
+
+class _FarmHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        farm = self.server.farm
+        site = farm.site_from_host(self.headers.get('Host', ''))
+        behaviour = farm.behaviour(site) if site is not None else 'error'
+        if farm.flaps():
+            behaviour = 'reset'
+        farm.count(behaviour)
+
+        time.sleep(farm.sample_latency())
+
+        if behaviour == 'hang':
+            time.sleep(farm.profile.hang_seconds)
+            self.close_connection = True
+            return
+        if behaviour == 'reset':
+            # SO_LINGER with a zero timeout makes close() send a RST instead of a FIN.
+            self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            self.close_connection = True
+            return
+        if behaviour == 'redirect' and self.path != '/landing':
+            self._respond(301, b'', location='/landing')
+            return
+        if behaviour == 'error':
+            self._respond(503, b'unavailable')
+            return
+        if behaviour == 'large':
+            self._respond(200, farm.large_body)
+            return
+        self._respond(200, b'ok')
+
+    def _respond(self, status, body, location=None):
+        self.send_response(status)
+        if location:
+            self.send_header('Location', location)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class SiteFarm:
+    """
+    Serve ``sites`` virtual hosts from one local server. Use as a context manager or call start()/stop().
+    """
+
+    def __init__(self, sites, profile=None, seed=0, host='127.0.0.1', port=0):
+        self.sites = sites
+        self.profile = profile or FarmProfile()
+        self.seed = seed
+        self._sampler = parse_latency(self.profile.latency)
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.large_body = b'x' * self.profile.large_body_bytes
+        self.hits = dict.fromkeys(BEHAVIOURS, 0)
+        self._hits_lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), _FarmHandler)
+        self.server.daemon_threads = True
+        self.server.request_queue_size = 1024
+        self.server.farm = self
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def url_for(self, site):
+        return f"http://site-{site}.{DOMAIN}:{self.port}/"
+
+    def urls(self):
+        return [self.url_for(site) for site in range(self.sites)]
+
+    def site_from_host(self, host):
+        name = host.split(':', 1)[0]
+        if not name.startswith('site-') or not name.endswith('.' + DOMAIN):
+            return None
+        try:
+            return int(name[len('site-'):-len(DOMAIN) - 1])
+        except ValueError:
+            return None
+
+    def behaviour(self, site):
+        return self.profile.behaviour_for(site, self.seed)
+
+    def expected_up(self, site):
+        return self.behaviour(site) in ('ok', 'redirect', 'large')
+
+    def sample_latency(self):
+        with self._rng_lock:
+            return self._sampler(self._rng)
+
+    def flaps(self):
+        if not self.profile.flap_rate:
+            return False
+        with self._rng_lock:
+            return self._rng.random() < self.profile.flap_rate
+
+    def count(self, behaviour):
+        with self._hits_lock:
+            self.hits[behaviour] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='sitefarm', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+_original_getaddrinfo = socket.getaddrinfo
+
+
+def install_resolver(address='127.0.0.1'):
+    """
+    Resolve every ``*.bench.test`` hostname to ``address`` in this process.
+    """
+
+    def getaddrinfo(host, *args, **kwargs):
+        if isinstance(host, str) and (host == DOMAIN or host.endswith('.' + DOMAIN)):
+            host = address
+        return _original_getaddrinfo(host, *args, **kwargs)
+
+    socket.getaddrinfo = getaddrinfo
+
+
+def uninstall_resolver():
+    socket.getaddrinfo = _original_getaddrinfo
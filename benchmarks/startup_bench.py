@@ -0,0 +1,159 @@
+"""
+Compare Gunicorn workers built per process with workers forked from a preloaded, warmed-up master.
+
+Starts gunicorn.py (``run:app``) on a scratch SQLite database twice, with GUNICORN_PRELOAD=false and =true, and with
+``--max-requests`` small enough that the workers recycle during the run. It then requests the login page
+``--requests`` times over keep-alive-less connections and reports:
+
+    latency     median and p99 per request, and the mean of the first request served by each new worker
+    dropped     connections a recycling worker accepted and closed unanswered (retried, and timed as one request)
+    memory      RSS, PSS (RSS with shared pages split between the processes sharing them) and private dirty
+                memory of the live workers, per worker, from /proc/<pid>/smaps_rollup (Linux only)
+
+Usage:
+
+    python -m benchmarks.startup_bench --workers 4 --requests 400 --max-requests 50
+"""
+import argparse
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workdir, preload, args):
+    port = free_port()
+    env = dict(os.environ,
+               GUNICORN_PRELOAD='true' if preload else 'false',
+               GUNICORN_WORKERS=str(args.workers),
+               GUNICORN_LOG_LEVEL='warning',
+               PROMETHEUS_MULTIPROC_DIR=os.path.join(workdir, f'metrics-{preload}'),
+               FLASK_CONFIG='production',
+               PROD_DATABASE_URI=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+               SECRET_KEY='bench',
+               REDIS_URL='redis://127.0.0.1:1/0',  # fail fast; nothing on the login page needs Redis
+               LIMITER_STORAGE_URL='memory://',
+               LOG_DIR=os.path.join(workdir, 'logs'),
+               LOG_TO_STDERR='false')
+    server = subprocess.Popen(
+        # The console script, not ``python -m gunicorn``: that would import gunicorn.py (the config) from ROOT
+        [os.path.join(os.path.dirname(sys.executable), 'gunicorn'), '--config', 'gunicorn.py',
+         '--bind', f'127.0.0.1:{port}', '--max-requests', str(args.max_requests), '--max-requests-jitter', '0',
+         '--access-logfile', '/dev/null',
+         'run:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}/auth/login'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url).read()
+            return server, url
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError('gunicorn did not start')
+
+
+def worker_pids(master_pid):
+    with open(f'/proc/{master_pid}/task/{master_pid}/children') as children:
+        return [int(pid) for pid in children.read().split()]
+
+
+def memory_kb(pid):
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as rollup:
+        for line in rollup:
+            key, _, rest = line.partition(':')
+            if key in ('Rss', 'Pss', 'Private_Dirty'):
+                values[key] = int(rest.split()[0])
+    return values
+
+
+def fetch(url):
+    """
+    GET ``url`` and return the seconds it took and the number of failed attempts. A connection that a recycling
+    worker accepted but dropped is retried; the time lost counts against the request.
+    """
+    started = time.perf_counter()
+    attempt = 0
+    while True:
+        try:
+            urllib.request.urlopen(url, timeout=30).read()
+            return time.perf_counter() - started, attempt
+        except OSError:
+            attempt += 1
+            if time.perf_counter() - started > 30:
+                raise
+            time.sleep(0.01)
+
+
+def run(preload, workdir, args):
+    server, url = start_server(workdir, preload, args)
+    try:
+        latencies = []
+        first = []
+        dropped = 0
+        seen = set(worker_pids(server.pid))
+        for _ in range(args.requests):
+            latency, failures = fetch(url)
+            latencies.append(latency)
+            dropped += failures
+            workers = set(worker_pids(server.pid))
+            # A worker that appeared since the last request has just served (or is about to serve) its first one
+            if workers - seen:
+                first.append(latency)
+            seen |= workers
+        memory = [memory_kb(pid) for pid in worker_pids(server.pid)]
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+    latencies.sort()
+    return {
+        'median_ms': statistics.median(latencies) * 1e3,
+        'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1e3,
+        'max_ms': latencies[-1] * 1e3,
+        'recycled_first_ms': statistics.mean(first) * 1e3 if first else float('nan'),
+        'rss_mb': statistics.mean(m['Rss'] for m in memory) / 1024,
+        'pss_mb': statistics.mean(m['Pss'] for m in memory) / 1024,
+        'private_mb': statistics.mean(m['Private_Dirty'] for m in memory) / 1024,
+        'dropped': dropped,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--max-requests', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        subprocess.run([sys.executable, '-c', 'from app import create_app; from app.extensions import db; '
+                        'create_app()[0].app_context().push(); db.create_all()'],
+                       cwd=ROOT, check=True,
+                       env=dict(os.environ, FLASK_CONFIG='production', SECRET_KEY='bench',
+                                PROD_DATABASE_URI=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+                                LOG_DIR=os.path.join(workdir, 'logs'), LOG_TO_STDERR='false'))
+        results = {name: run(preload, workdir, args) for name, preload in (('per-worker', False), ('preload', True))}
+
+    columns = ('median_ms', 'p99_ms', 'max_ms', 'recycled_first_ms', 'rss_mb', 'pss_mb', 'private_mb', 'dropped')
+    print(f"{'mode':<11}" + ''.join(f'{column:>18}' for column in columns))
+    for name, result in results.items():
+        print(f'{name:<11}' + ''.join(f'{result[column]:>18.2f}' for column in columns))
+
+
+if __name__ == '__main__':
+    main()
@@ -21,6 +21,15 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "")))
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Read replicas (app/dbrouting.py): comma-separated URIs, bound as "replica0", "replica1", ... The read-only views
+    # and list commands read from a replica that is at most DB_REPLICA_MAX_LAG seconds behind the primary (measured
+    # every DB_REPLICA_LAG_CHECK_INTERVAL seconds, with DB_REPLICA_LAG_QUERY if set), from the primary otherwise.
+    # A user who has just written something reads from the primary until the replicas have caught up.
+    DATABASE_REPLICA_URIS = [uri for uri in os.environ.get('DATABASE_REPLICA_URIS', '').split(',') if uri]
+    SQLALCHEMY_BINDS = {f'replica{n}': uri for n, uri in enumerate(DATABASE_REPLICA_URIS)}
+    DB_REPLICA_MAX_LAG = float(os.environ.get('DB_REPLICA_MAX_LAG', 10))
+    DB_REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get('DB_REPLICA_LAG_CHECK_INTERVAL', 5))
+    DB_REPLICA_LAG_QUERY = os.environ.get('DB_REPLICA_LAG_QUERY')
     MAIL_SERVER = os.environ.get('MAIL_SERVER')
     MAIL_PORT = int(os.environ.get('MAIL_PORT', 465))
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
@@ -29,11 +38,128 @@ class Config:
     MAIL_USE_SSL = True
     MAIL_DEBUG = False
     RATELIMIT_MESSAGE = 'Chill out, man!'
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
     TESTING = False
-    LIMITER_STORAGE_URL = os.environ.get('LIMITER_STORAGE_URL', 'redis://redis:6379')
+    # hybrid+redis:// counts in process and reconciles with Redis in background batches (see app/ratelimit.py);
+    # use plain redis:// for exact, one-round-trip-per-request accounting.
+    LIMITER_STORAGE_URL = os.environ.get('LIMITER_STORAGE_URL', 'hybrid+redis://redis:6379')
     CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "redis://redis:6379")
     CELERY_RESULT_BACKEND = os.environ.get("CELERY_RESULT_BACKEND", "redis://redis:6379")
+    # Task topology: the sweep and per-location probes ("probe" and "probe.<location>"), notifications ("notify")
+    # and housekeeping ("maintenance") run on separate queues with their own workers (see docker-compose.yml), so a
+    # long sweep cannot hold up other work. Prefetch is 1 by default because sweeps and probe batches are long;
+    # notify workers raise it with --prefetch-multiplier.
+    CELERY_TASK_DEFAULT_QUEUE = 'maintenance'
+    CELERY_TASK_ROUTES = {
+        'app.main.routes.check_website_status': {'queue': 'probe'},
+        'app.main.routes.check_website': {'queue': 'checks'},
+        'app.main.webhooks.deliver_webhook': {'queue': 'notify'},
+        'app.games.routes.restore_leaderboards': {'queue': 'maintenance'},
+    }
+    # "Check now" probes go to the "checks" queue, which probe workers list first (-Q checks,probe); with the
+    # priority strategy a worker always drains the queues in that order, so a check never waits for the next sweep.
+    # The Redis broker redelivers a task not acknowledged within visibility_timeout, which includes tasks waiting for
+    # their ETA (webhook retries): it must exceed WEBHOOK_RETRY_BACKOFF_MAX and the longest task time limit, or
+    # acks_late tasks run twice.
+    CELERY_BROKER_TRANSPORT_OPTIONS = {
+        'queue_order_strategy': 'priority',
+        'visibility_timeout': int(os.environ.get('CELERY_VISIBILITY_TIMEOUT', 2 * 3600)),
+    }
+    CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.environ.get('CELERY_WORKER_PREFETCH_MULTIPLIER', 1))
+    # With acks_late, a task whose worker process was killed is redelivered instead of acknowledged as failed.
+    CELERY_TASK_REJECT_ON_WORKER_LOST = True
+    # A sweep must finish before the next one is scheduled (every 10 minutes); the soft limit lets it log and stop.
+    SWEEP_TIME_LIMIT = int(os.environ.get('SWEEP_TIME_LIMIT', 9 * 60))
+    CELERY_TASK_ANNOTATIONS = {
+        'app.main.routes.check_website_status': {'soft_time_limit': SWEEP_TIME_LIMIT,
+                                                 'time_limit': SWEEP_TIME_LIMIT + 30},
+        'app.main.routes.check_website': {'soft_time_limit': 60, 'time_limit': 90},
+        'app.main.webhooks.deliver_webhook': {'soft_time_limit': 30, 'time_limit': 45},
+        'app.games.routes.restore_leaderboards': {'soft_time_limit': 120, 'time_limit': 150},
+    }
+    # "Check now": a website checked less than CHECK_NOW_REUSE seconds ago is not probed again, and concurrent
+    # requests share one probe. CHECK_NOW_LOCK_TTL only bounds how long a lost check task blocks new ones.
+    CHECK_NOW_REUSE = int(os.environ.get('CHECK_NOW_REUSE', 60))
+    CHECK_NOW_LOCK_TTL = int(os.environ.get('CHECK_NOW_LOCK_TTL', 120))
+    # Only the per-location probe results are read, right after they are stored; do not keep them for a day.
+    CELERY_RESULT_EXPIRES = int(os.environ.get('CELERY_RESULT_EXPIRES', 3600))
+    REDIS_URL = os.environ.get('REDIS_URL', CELERY_BROKER_URL)
+    REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 2))
     DEBUG = os.environ.get('FLASK_ENV')
+    PROBE_TIMEOUT = float(os.environ.get('PROBE_TIMEOUT', 10))
+    # Treat www.example.com and example.com as one website when normalising new URLs.
+    WEBSITE_FOLD_WWW = os.environ.get('WEBSITE_FOLD_WWW', 'false').lower() in ('1', 'true', 'yes')
+    # Concurrent probes per sweep (or per probe location worker). Whatever the concurrency, each resolved IP and each
+    # registrable domain is probed at most PROBE_HOST_RATE times per second (bursts of PROBE_HOST_BURST) and the
+    # process sends at most PROBE_GLOBAL_RATE probes per second; a rate of 0 disables that limit.
+    PROBE_CONCURRENCY = int(os.environ.get('PROBE_CONCURRENCY', 8))
+    PROBE_HOST_RATE = float(os.environ.get('PROBE_HOST_RATE', 2))
+    PROBE_HOST_BURST = int(os.environ.get('PROBE_HOST_BURST', 4))
+    PROBE_GLOBAL_RATE = float(os.environ.get('PROBE_GLOBAL_RATE', 50))
+    # Probe locations: each name is a Celery queue "probe.<name>" served by workers in that location. When set, a
+    # status needs PROBE_QUORUM agreeing locations (0 = majority), each probing with the short
+    # PROBE_LOCATION_TIMEOUT and answering for a whole batch within PROBE_LOCATION_BUDGET seconds.
+    PROBE_LOCATIONS = [location for location in os.environ.get('PROBE_LOCATIONS', '').split(',') if location]
+    PROBE_QUORUM = int(os.environ.get('PROBE_QUORUM', 0))
+    PROBE_LOCATION_TIMEOUT = float(os.environ.get('PROBE_LOCATION_TIMEOUT', 3))
+    PROBE_LOCATION_BUDGET = float(os.environ.get('PROBE_LOCATION_BUDGET', 300))
+    # Websites read (and their check times written) per round trip during a sweep; bounds the sweep's memory.
+    SWEEP_BATCH_SIZE = int(os.environ.get('SWEEP_BATCH_SIZE', 500))
+    # A sweep checkpoint left untouched this long is dropped and the next sweep starts a new lap from the first site.
+    SWEEP_CHECKPOINT_TTL = int(os.environ.get('SWEEP_CHECKPOINT_TTL', 24 * 3600))
+    HEALTH_CACHE_TTL = float(os.environ.get('HEALTH_CACHE_TTL', 10))
+    # A sweep is scheduled every 10 minutes; report "stale" once two runs in a row have been missed.
+    HEALTH_SWEEP_MAX_AGE = int(os.environ.get('HEALTH_SWEEP_MAX_AGE', 30 * 60))
+    # Live dashboard updates. Each open stream holds a Gunicorn thread (gthread) or greenlet (gevent) for at most
+    # SSE_MAX_DURATION seconds; SSE_MAX_STREAMS caps them per process so page requests always find a free thread.
+    SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', 8))
+    SSE_MAX_DURATION = int(os.environ.get('SSE_MAX_DURATION', 300))
+    SSE_HEARTBEAT = int(os.environ.get('SSE_HEARTBEAT', 15))
+    # How long API clients may reuse a response before revalidating it with If-None-Match.
+    API_CACHE_MAX_AGE = int(os.environ.get('API_CACHE_MAX_AGE', 30))
+    # Response compression (app/compression.py). Static assets are precompressed at build time at maximum level, so
+    # these only apply to dynamic responses, where a low brotli quality keeps the CPU cost per request small.
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+    COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+    COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))
+    # Full-page cache of the static-ish views (app/viewcache.py): 'lru' (per process), 'redis' (shared) or 'none'.
+    VIEW_CACHE_TYPE = os.environ.get('VIEW_CACHE_TYPE', 'lru')
+    VIEW_CACHE_TTL = int(os.environ.get('VIEW_CACHE_TTL', 300))
+    VIEW_CACHE_MAX_ENTRIES = int(os.environ.get('VIEW_CACHE_MAX_ENTRIES', 256))
+    # Webhooks: batches of up to WEBHOOK_BATCH_SIZE events per endpoint, posted with WEBHOOK_CONNECT_TIMEOUT and
+    # WEBHOOK_TIMEOUT over WEBHOOK_POOL_SIZE kept-alive connections per worker process. A failed batch is retried
+    # WEBHOOK_MAX_RETRIES times, backing off from WEBHOOK_RETRY_BACKOFF up to WEBHOOK_RETRY_BACKOFF_MAX seconds
+    # (8 retries span about an hour and a half), then dead-lettered; the dead-letter list keeps WEBHOOK_DEAD_LETTER_MAX.
+    # A receiver's Retry-After is capped at WEBHOOK_RETRY_BACKOFF_MAX too, which must stay below the broker's
+    # visibility_timeout (CELERY_VISIBILITY_TIMEOUT).
+    # Webhook URLs must resolve to public addresses; set this to also allow loopback (local receivers, tests).
+    WEBHOOK_ALLOW_LOOPBACK = os.environ.get('WEBHOOK_ALLOW_LOOPBACK', 'false').lower() in ('1', 'true', 'yes')
+    WEBHOOK_MAX_PER_USER = int(os.environ.get('WEBHOOK_MAX_PER_USER', 5))
+    WEBHOOK_BATCH_SIZE = int(os.environ.get('WEBHOOK_BATCH_SIZE', 100))
+    WEBHOOK_CONNECT_TIMEOUT = float(os.environ.get('WEBHOOK_CONNECT_TIMEOUT', 3))
+    WEBHOOK_TIMEOUT = float(os.environ.get('WEBHOOK_TIMEOUT', 10))
+    WEBHOOK_POOL_SIZE = int(os.environ.get('WEBHOOK_POOL_SIZE', 10))
+    WEBHOOK_MAX_RETRIES = int(os.environ.get('WEBHOOK_MAX_RETRIES', 8))
+    WEBHOOK_RETRY_BACKOFF = float(os.environ.get('WEBHOOK_RETRY_BACKOFF', 30))
+    WEBHOOK_RETRY_BACKOFF_MAX = float(os.environ.get('WEBHOOK_RETRY_BACKOFF_MAX', 3600))
+    WEBHOOK_DEAD_LETTER_MAX = int(os.environ.get('WEBHOOK_DEAD_LETTER_MAX', 10000))
+    # Opt-in SQL profiling (app/profiling.py): statement counts and time per request and Celery task, logged to
+    # "app.profile" for units slower than PROFILE_SLOW_MS or running one statement PROFILE_REPEATED_THRESHOLD times
+    # or more (N+1). With PROFILE_CPROFILE_DIR set, every unit also runs under cProfile and the slow ones are dumped.
+    PROFILE_SQL = os.environ.get('PROFILE_SQL', 'false').lower() in ('1', 'true', 'yes')
+    PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', 500))
+    PROFILE_REPEATED_THRESHOLD = int(os.environ.get('PROFILE_REPEATED_THRESHOLD', 5))
+    PROFILE_CPROFILE_DIR = os.environ.get('PROFILE_CPROFILE_DIR')
+    LEADERBOARD_CACHE_TTL = float(os.environ.get('LEADERBOARD_CACHE_TTL', 5))
+    LEADERBOARD_CACHE_MAX_PAGES = int(os.environ.get('LEADERBOARD_CACHE_MAX_PAGES', 64))
+    METRICS_BROKER_QUEUES = os.environ.get('METRICS_BROKER_QUEUES', 'checks,probe,notify,maintenance').split(',')
+    LOG_DIR = os.environ.get('LOG_DIR', 'logs')
+    LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024))
+    LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 10))
+    LOG_TO_STDERR = os.environ.get('LOG_TO_STDERR', 'true').lower() in ('1', 'true', 'yes')
+    # Fraction of INFO records kept per logger, e.g. "app.probe=0.1". The per-site probe chatter is the bulk of it.
+    LOG_SAMPLE_RATES = os.environ.get('LOG_SAMPLE_RATES', 'app.probe=0.1')
 
     @staticmethod
     def init_app(app):
@@ -4,19 +4,45 @@ Gunicorn WSGI Server Configuration
 Updated for Gunicorn 23.0.0
 """
 
+import gc
+import glob
 import multiprocessing
 import os
 
+# Prometheus multiprocess mode: every worker writes its samples to per-process files in this directory and /metrics
+# aggregates them. Must be set before the app (and prometheus_client) is imported. The directory is this server's
+# alone: Celery workers use their own and serve their metrics themselves (see docker-compose.yml).
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/flaskwatchdog_metrics')
+# Emptied of the files of earlier runs here rather than in on_starting: with preload_app the app, and its metrics,
+# load before that hook runs. A HUP reloads this file in the same master, whose workers' files must survive.
+if os.environ.get('_FLASKWATCHDOG_METRICS_MASTER') != str(os.getpid()):
+    os.environ['_FLASKWATCHDOG_METRICS_MASTER'] = str(os.getpid())
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+    for _filename in glob.glob(os.path.join(os.environ['PROMETHEUS_MULTIPROC_DIR'], '*.db')):
+        os.remove(_filename)
+
 # Server socket
 bind = '0.0.0.0:5000'
 backlog = 2048
 
 # Worker processes
 workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
-worker_class = 'sync'
+# gthread keeps a long-lived /stream (Server-Sent Events) connection from occupying a whole worker process, and
+# the worker timeout does not apply to individual requests. Use GUNICORN_WORKER_CLASS=gevent (pip install gevent)
+# and raise SSE_MAX_STREAMS to hold thousands of streams per worker.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', 16))
 worker_connections = 1000
 max_requests = 1000
 max_requests_jitter = 50
+# Build the app once in the master and fork the workers from it (see the server hooks below): a recycled worker
+# starts serving at once instead of importing the app and compiling templates again, and the workers share the
+# master's memory pages. Code changes then need a full restart; a HUP only re-forks the preloaded app.
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+if preload_app:
+    # Collections in the master would free objects between the long-lived ones and leave holes that the workers
+    # copy on write; the objects are frozen before every fork instead (pre_fork) and collection resumes in workers.
+    gc.disable()
 timeout = 30
 keepalive = 2
 
@@ -37,6 +63,43 @@ user = None
 group = None
 tmp_upload_dir = None
 
+
+# Server hooks
+def when_ready(server):
+    if preload_app:
+        from app.warmup import warm_up
+        server.log.info("Warmed up the preloaded app in %.2fs", warm_up(server.app.wsgi()))
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        # Move everything allocated so far out of the collector's reach: the workers' collections never write to
+        # these objects' headers, so their pages stay shared.
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        gc.enable()
+        from app.warmup import reset_connections
+        reset_connections(server.app.wsgi())
+
+
+def post_worker_init(worker):
+    from app.warmup import prime_connections, warm_up
+    app = worker.wsgi
+    if not preload_app:
+        warm_up(app)
+    prime_connections(app)
+
+
+def child_exit(server, worker):
+    # prometheus_client directly, not app.metrics: without preload_app the master never imports the app, and doing
+    # so from this SIGCHLD handler can interrupt (and break) an import already in progress.
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
 # SSL (if needed)
 # keyfile = None
 # certfile = None
@@ -4,10 +4,12 @@ from click.testing import CliRunner
 import pytest
 import os
 import sys
+from contextlib import contextmanager
 from app import db, ext_celery, create_app
 from app.models.user import User
 from app.models.website import Website
 from app.models.userwebsite import UserWebsite
+from app.profiling import capture_queries
 import datetime
 
 """The app fixture creates a Flask application instance that is used by other test functions. Similarly, the client 
@@ -90,3 +92,20 @@ def init_test_db(app):
 @pytest.fixture
 def runner():
     return CliRunner()
+
+
+# Query budgets: fail a test when a block (typically one request to an endpoint) runs more SQL statements than
+# allowed, listing them so an N+1 is easy to spot, e.g.
+#
+#     with query_budget(5):
+#         client.get('/')
+@pytest.fixture
+def query_budget():
+    @contextmanager
+    def budget(max_queries):
+        with capture_queries() as stats:
+            yield stats
+        assert stats.count <= max_queries, \
+            f"{stats.count} SQL statements, budget is {max_queries}:\n" + \
+            "\n".join(f"{count} x {statement}" for statement, count in stats.statements.most_common())
+    return budget
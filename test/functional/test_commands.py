@@ -1,6 +1,13 @@
+import os
+from unittest.mock import patch
+
 import pytest
 from click.testing import CliRunner
 from app.cli import cli
+from app.extensions import db
+from app.models.user import User
+from app.models.userwebsite import UserWebsite
+from app.models.website import Website
 
 
 @pytest.fixture
@@ -64,3 +71,65 @@ def test_create_website(runner, init_test_db):
     url = "https://example.com"
     result = runner.invoke(cli, ["create-website", "--url", url], input="1\n")
     assert result.exit_code == 0
+
+
+def test_seed_scale(runner, init_test_db):
+    # Test that seed-scale creates the requested volume with power users on top
+    result = runner.invoke(cli, ["seed-scale", "--users", "20", "--websites", "200", "--power-users", "2",
+                                 "--power-user-sites", "100"])
+    assert result.exit_code == 0
+    assert 'Created 20 users and 200 websites' in result.output
+
+    # A second run refuses to duplicate the data unless asked to reset it
+    result = runner.invoke(cli, ["seed-scale", "--users", "20", "--websites", "200"])
+    assert 'Seed data already present' in result.output
+
+
+def test_merge_duplicate_websites(runner, init_test_db):
+    # Test that spellings of one website are merged into a single row keeping every subscriber once
+    user1, user2 = User.query.order_by(User.id).all()
+    first, second = Website(url='Dup.example.com'), Website(url='dup.example.com:443')
+    db.session.add_all([first, second])
+    db.session.commit()
+    db.session.add_all([UserWebsite(user_id=user1.id, website_id=first.id),
+                        UserWebsite(user_id=user1.id, website_id=second.id),
+                        UserWebsite(user_id=user2.id, website_id=second.id)])
+    db.session.commit()
+
+    result = runner.invoke(cli, ["merge-duplicate-websites"])
+    assert result.exit_code == 0
+
+    website = Website.query.filter_by(url='dup.example.com').one()
+    assert Website.query.filter(Website.url.like('%dup.example.com%')).count() == 1
+    assert sorted(link.user_id for link in UserWebsite.query.filter_by(website_id=website.id)) == [user1.id, user2.id]
+    assert Website.query.filter_by(url='example1.com').count() == 1
+
+
+def test_check_status_local(runner, init_test_db):
+    # Test that a local sweep probes every website in process and reports a summary
+    with patch('app.main.probes.check_url_status', return_value=True), patch('app.main.routes.send_email'):
+        result = runner.invoke(cli, ["check-status", "--local", "--threads", "2"])
+    assert result.exit_code == 0, result.output
+    assert 'Checked 2 websites' in result.output
+    assert 'Probe latency p50' in result.output
+    assert Website.query.filter_by(status=True).count() == 2
+
+
+def test_check_status_local_processes(runner, init_test_db):
+    # Test that a sharded local sweep records the sweep as completed once every shard has finished
+    with patch('app.main.probes.check_url_status', return_value=True), patch('app.main.routes.send_email'), \
+            patch('app.cli.record_sweep_completed') as completed:
+        result = runner.invoke(cli, ["check-status", "--local", "--processes", "2"])
+    assert result.exit_code == 0, result.output
+    assert 'Checked 2 websites' in result.output
+    completed.assert_called_once()
+
+
+def test_check_status_local_survives_a_dead_shard(runner, init_test_db):
+    # Test that a shard process dying without reporting fails the sweep instead of hanging it
+    with patch('app.cli.run_sweep', side_effect=lambda **kwargs: os._exit(1)), \
+            patch('app.cli.record_sweep_completed') as completed:
+        result = runner.invoke(cli, ["check-status", "--local", "--processes", "2"])
+    assert result.exit_code != 0
+    assert 'exited with code 1' in result.output
+    completed.assert_not_called()
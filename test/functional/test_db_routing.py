@@ -0,0 +1,75 @@
+from unittest.mock import patch
+
+import pytest
+
+from app import create_app
+from app.dbrouting import STICKY_SESSION_KEY, use_replica
+from app.extensions import db
+from app.models.user import User
+from app.models.website import Website
+from config import TestingConfig
+
+
+class ReplicaConfig(TestingConfig):
+    # A second SQLite file stands in for the replica; nothing replicates to it, so the tests can tell them apart
+    SQLALCHEMY_BINDS = {'replica0': 'sqlite:///flaskwatchdog_test_replica.db'}
+    DB_REPLICA_LAG_CHECK_INTERVAL = 0
+    WTF_CSRF_ENABLED = False
+
+
+@pytest.fixture
+def replica_app():
+    app, _ = create_app(ReplicaConfig)
+    with app.app_context():
+        for engine in (db.engines[None], db.engines['replica0']):
+            db.metadata.drop_all(engine)
+            db.metadata.create_all(engine)
+        user = User(email='user1@example.com')
+        user.set_password('password1')
+        db.session.add(user)
+        db.session.commit()
+        users = [dict(row._mapping) for row in db.session.query(User.__table__)]
+        with db.engines['replica0'].begin() as connection:
+            connection.execute(User.__table__.insert(), users)
+            connection.execute(Website.__table__.insert(), [{'url': 'https://replica.example.com'}])
+        db.session.remove()
+        yield app
+        db.session.remove()
+    # db is shared by every app the tests create: drop the bind's metadata, or their create_all() would look for it
+    db.metadatas.pop('replica0', None)
+
+
+def website_urls():
+    return [url for url, in db.session.query(Website.url)]
+
+
+def test_reads_go_to_a_fresh_replica_until_the_session_writes(replica_app, monkeypatch):
+    # Test that SELECTs only leave the primary inside use_replica, while the replica keeps up and the session has
+    # not written anything
+    assert website_urls() == []
+    with use_replica():
+        assert website_urls() == ['https://replica.example.com']
+
+        monkeypatch.setattr(replica_app.extensions['db_routing'], 'lag_query', 'SELECT 60')
+        assert website_urls() == []
+        monkeypatch.undo()
+
+        db.session.add(Website(url='https://primary.example.com'))
+        assert website_urls() == ['https://primary.example.com']
+
+
+def test_users_read_their_own_writes(replica_app):
+    # Test that the dashboard reads from the replica, but from the primary right after the user added a website
+    client = replica_app.test_client()
+    client.post('/auth/login', data={'email': 'user1@example.com', 'password': 'password1'})
+
+    with patch('app.main.routes.request_check'):
+        response = client.post('/', data={'url': 'https://new.example.com'}, follow_redirects=True)
+    assert b'<td>new.example.com</td>' in response.data
+    with client.session_transaction() as session:
+        assert session[STICKY_SESSION_KEY]
+        del session[STICKY_SESSION_KEY]
+    # The primary has the user's subscription, the replica has not caught up
+    response = client.get('/')
+    assert b'Logged in as: user1@example.com' in response.data
+    assert b'<td>new.example.com</td>' not in response.data
@@ -0,0 +1,26 @@
+import json
+import logging
+
+from app.logging_config import JsonFormatter, SamplingFilter
+
+
+def make_record(name, level=logging.INFO, msg='Website status for %s is %s', args=('example.com', True), **extra):
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_renders_message_and_extra_fields():
+    # Test that records are rendered as one JSON document with the %-args interpolated
+    document = json.loads(JsonFormatter().format(make_record('app.probe', website_id=7)))
+    assert document['message'] == 'Website status for example.com is True'
+    assert document['logger'] == 'app.probe'
+    assert document['website_id'] == 7
+
+
+def test_sampling_filter_drops_info_but_keeps_warnings():
+    # Test that a zero rate drops INFO records of the logger and its children, but never warnings
+    sampling = SamplingFilter({'app.probe': 0.0})
+    assert not sampling.filter(make_record('app.probe.http'))
+    assert sampling.filter(make_record('app.probe', level=logging.WARNING))
+    assert sampling.filter(make_record('app'))
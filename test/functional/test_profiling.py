@@ -0,0 +1,46 @@
+from unittest.mock import Mock, patch
+
+from celery.signals import task_postrun, task_prerun
+
+from app.models.userwebsite import UserWebsite
+from app.profiling import capture_queries, init_profiling, report
+
+
+def test_repeated_statements_are_reported_as_n_plus_one(app, init_test_db):
+    # Test that lazy loading a relationship per row shows up as one statement repeated per row
+    with capture_queries() as stats:
+        for user_website in UserWebsite.query.all():
+            user_website.website.url
+    assert stats.count == 3
+    assert stats.repeated(2)[0][1] == 2
+
+    with patch('app.profiling.profile_logger') as logger:
+        report('request', 'GET main.dashboard', stats, 0.01, dict(app.config, PROFILE_REPEATED_THRESHOLD=2))
+        logger.warning.assert_called_once()
+        report('request', 'GET main.dashboard', stats, 0.01, app.config)
+        logger.warning.assert_called_once()
+        logger.info.assert_not_called()
+
+
+def test_profiled_requests_report_their_queries(app):
+    # Test that with PROFILE_SQL every response tells how many statements it ran and how long they took
+    app.config['PROFILE_SQL'] = True
+    init_profiling(app)
+    response = app.test_client().get('/health')
+    assert 'db;dur=' in response.headers['Server-Timing']
+    assert 'queries"' in response.headers['Server-Timing']
+
+
+def test_tasks_are_profiled_when_the_app_says_so(app):
+    # Test that the Celery signal handlers follow the PROFILE_SQL setting of the app the task runs in
+    task = Mock()
+    task.name = 'app.main.routes.check_website_status'
+    with patch('app.profiling.report') as report_mock:
+        task_prerun.send(sender=task, task_id='unprofiled', task=task)
+        task_postrun.send(sender=task, task_id='unprofiled', task=task)
+        report_mock.assert_not_called()
+
+        app.config['PROFILE_SQL'] = True
+        task_prerun.send(sender=task, task_id='profiled', task=task)
+        task_postrun.send(sender=task, task_id='profiled', task=task)
+        report_mock.assert_called_once()
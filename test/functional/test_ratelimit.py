@@ -0,0 +1,26 @@
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+
+from app.ratelimit import HybridRedisStorage
+
+
+def test_hybrid_storage_enforces_limits_locally_when_redis_is_down():
+    # Test that the hybrid storage keeps enforcing limits from local counts when Redis cannot be reached
+    storage = storage_from_string('hybrid+redis://127.0.0.1:1/0?sync_interval=60&retry_interval=60')
+    assert isinstance(storage, HybridRedisStorage)
+    limiter = FixedWindowRateLimiter(storage)
+    item = parse('3 per minute')
+
+    assert [limiter.hit(item, 'client') for _ in range(4)] == [True, True, True, False]
+
+    # A failed sync keeps the pending hits and backs off instead of raising
+    assert storage.sync() == 0
+    assert storage.get(item.key_for('client')) == 4
+
+
+def test_hybrid_storage_accepts_the_incr_call_of_older_limits():
+    # Test that incr takes elastic_expiry, as limits 3.x (pinned in requirements.txt) calls it
+    storage = storage_from_string('hybrid+redis://127.0.0.1:1/0?sync_interval=60&retry_interval=60')
+    assert storage.incr('key', 60, elastic_expiry=False, amount=2) == 2
+    assert storage.incr('key', 60, True, 1) == 3
@@ -0,0 +1,161 @@
+import threading
+from unittest.mock import patch
+
+from app.extensions import db, ext_celery
+from app.games.routes import restore_leaderboards
+from app.main.egress import EgressLimiter, registrable_domain
+from app.main.probes import collect_statuses, quorum_vote
+from app.main.routes import check_website_status
+from app.main.targets import SweepCheckpoint, iter_probe_targets
+from app.models.user import User
+from app.models.userwebsite import UserWebsite
+from app.models.website import Website
+
+
+def test_iter_probe_targets_pages_by_id(init_test_db):
+    # Test that the targets are streamed in id order, in batches of the requested size
+    for n in range(3):
+        db.session.add(Website(url=f'https://batch{n}.example.com'))
+    db.session.commit()
+
+    batches = list(iter_probe_targets(2))
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    ids = [target.id for batch in batches for target in batch]
+    assert ids == sorted(ids)
+
+
+def test_sweep_checkpoint_resumes_and_rotates(init_test_db):
+    # Test that a lap cut short resumes after the last processed batch and that the next lap starts a batch later
+    for n in range(4):
+        db.session.add(Website(url=f'https://lap{n}.example.com'))
+    db.session.commit()
+    ids = [id for id, in db.session.query(Website.id).order_by(Website.id)]
+    store = {}
+
+    class FakeRedis:
+        def get(self, key):
+            return store.get(key)
+
+        def set(self, key, value, ex=None):
+            store[key] = value
+
+    with patch('app.main.targets.redis_store', FakeRedis()):
+        batches = iter_probe_targets(2, checkpoint=SweepCheckpoint.load())
+        next(batches)
+        next(batches)  # interrupted while processing the second batch
+        batches.close()
+
+        checkpoint = SweepCheckpoint.load()
+        assert checkpoint.resumed
+        assert [target.id for batch in iter_probe_targets(2, checkpoint=checkpoint) for target in batch] == ids[2:]
+        checkpoint.finish(2)
+
+        checkpoint = SweepCheckpoint.load()
+        assert not checkpoint.resumed
+        lap = [target.id for batch in iter_probe_targets(2, checkpoint=checkpoint) for target in batch]
+        assert lap == ids[2:] + ids[:2]
+
+
+def test_sweep_updates_changed_websites_and_notifies(init_test_db):
+    # Test that the sweep records every check, but only e-mails the subscribers of websites whose status changed
+    db.session.query(Website).filter_by(url='https://example2.com').update({'status': True})
+    db.session.commit()
+
+    with patch('app.main.probes.check_url_status', return_value=True), \
+            patch('app.main.routes.send_email') as send_email_mock:
+        check_website_status()
+
+    send_email_mock.assert_called_once_with('https://example1.com', True, 'user1@example.com')
+    assert db.session.query(Website).filter(Website.last_checked.is_(None)).count() == 0
+    assert db.session.query(Website).filter_by(status=True).count() == 2
+    user1 = User.query.filter_by(email='user1@example.com').one()
+    assert user1.remaining_notifications == 29
+    assert UserWebsite.query.filter_by(user_id=user1.id).one().last_notified is not None
+
+
+def test_emails_are_sent_outside_the_status_transaction(init_test_db):
+    # Test that the status change and the reservation are committed before the e-mail goes out, and that the
+    # notification of a failed e-mail is handed back
+    in_transaction = []
+
+    def send(website, status, email):
+        in_transaction.append(db.session().in_transaction())
+        raise OSError('SMTP down')
+
+    with patch('app.main.probes.check_url_status', return_value=True), \
+            patch('app.main.routes.send_email', side_effect=send):
+        check_website_status()
+
+    assert in_transaction == [False, False]
+    user1 = User.query.filter_by(email='user1@example.com').one()
+    assert user1.remaining_notifications == 30
+    assert UserWebsite.query.filter_by(user_id=user1.id).one().last_notified is None
+    assert Website.query.filter_by(url='https://example1.com').one().status is True
+
+
+def test_notification_reservations_never_overspend(init_test_db):
+    # Test that quota reservations are all or nothing and stop at zero
+    user = User.query.filter_by(email='user1@example.com').one()
+    user.remaining_notifications = 3
+    db.session.commit()
+
+    assert not User.reserve_notifications(user.id, 5)
+    assert User.reserve_notifications(user.id, 2)
+    assert user.decrement_notifications()
+    assert not user.decrement_notifications()
+    assert user.remaining_notifications == 0
+
+    User.release_notifications(user.id, 2)
+    db.session.expire(user)
+    assert user.remaining_notifications == 2
+
+
+def test_quorum_vote():
+    # Test that a status needs a quorum of agreeing locations and that missing votes count for neither side
+    assert quorum_vote([True, True, False], 2) is True
+    assert quorum_vote([False, None, False], 2) is False
+    assert quorum_vote([True, False, None], 2) is None
+
+
+def test_collect_statuses_across_probe_locations(app, monkeypatch):
+    # Test that the batch is probed from every location and decided by majority
+    monkeypatch.setitem(app.config, 'PROBE_LOCATIONS', ['a', 'b', 'c'])
+    monkeypatch.setitem(app.config, 'PROBE_CONCURRENCY', 1)
+    monkeypatch.setattr(ext_celery.celery.conf, 'task_always_eager', True)
+    # Location a sees both sites up, b sees the first one up, c sees both down
+    with patch('app.main.probes.check_url_status', side_effect=[True, True, True, False, False, False]):
+        assert collect_statuses(['https://one.example.com', 'https://two.example.com']) == [True, False]
+
+
+def test_egress_limiter_throttles_per_domain():
+    # Test that probes of one registrable domain share a bucket while other domains are not held up
+    assert registrable_domain('www.shop.example.co.uk') == 'example.co.uk'
+    limiter = EgressLimiter(host_rate=10, host_burst=2, global_rate=0)
+
+    assert limiter.acquire('https://a.example.com') == 0
+    assert limiter.acquire('https://b.example.com') == 0
+    assert limiter.acquire('https://other.example.org') == 0
+    assert limiter.acquire('https://c.example.com') >= 0.05
+    # Waiting past the deadline is refused instead
+    assert limiter.acquire('https://d.example.com', deadline=0) is None
+
+
+def test_egress_limiter_caches_addresses_under_its_lock():
+    # Test that probe threads wait for the lock (held while pruning) before adding to the address cache
+    limiter = EgressLimiter()
+    with patch('socket.getaddrinfo', return_value=[(None, None, None, '', ('93.184.216.34', 443))]):
+        with limiter._lock:
+            resolver = threading.Thread(target=limiter._resolve, args=('example.com', 443))
+            resolver.start()
+            resolver.join(0.2)
+            assert resolver.is_alive() and 'example.com' not in limiter._addresses
+        resolver.join()
+    assert limiter._addresses['example.com'][0] == '93.184.216.34'
+
+
+def test_tasks_are_routed_to_their_queues(app):
+    # Test that the sweep goes to the probe queue, without a stored result, and housekeeping to maintenance
+    router = ext_celery.celery.amqp.router
+    assert router.route({}, check_website_status.name)['queue'].name == 'probe'
+    assert router.route({}, restore_leaderboards.name)['queue'].name == 'maintenance'
+    assert check_website_status.ignore_result
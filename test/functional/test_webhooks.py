@@ -0,0 +1,134 @@
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import pytest
+
+from app.extensions import db, ext_celery
+from app.main.routes import check_website_status
+from app.main.webhooks import SIGNATURE_HEADER, TIMESTAMP_HEADER, DeliveryFailed, UnsafeDestination, \
+    check_destination, deliver_webhook, sign
+from app.models.user import User
+from app.models.webhook import WebhookEndpoint
+
+
+@pytest.fixture
+def receiver():
+    """
+    Local webhook receiver answering with the queued status codes (200 once they run out) and recording requests.
+    """
+    received = []
+    statuses = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            received.append((dict(self.headers), body))
+            self.send_response(statuses.pop(0) if statuses else 200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.received, server.statuses = received, statuses
+    server.url = f'http://127.0.0.1:{server.server_port}/hook'
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def endpoint(app, init_test_db, receiver, monkeypatch):
+    monkeypatch.setattr(ext_celery.celery.conf, 'task_always_eager', True)
+    monkeypatch.setitem(app.config, 'WEBHOOK_ALLOW_LOOPBACK', True)  # the receiver listens on 127.0.0.1
+    user = User.query.filter_by(email='user1@example.com').one()
+    endpoint = WebhookEndpoint(user_id=user.id, url=receiver.url)
+    db.session.add(endpoint)
+    db.session.commit()
+    return endpoint
+
+
+def sweep_with_all_sites_up():
+    with patch('app.main.probes.check_url_status', return_value=True), patch('app.main.routes.send_email'):
+        check_website_status()
+
+
+def test_status_changes_are_delivered_signed(endpoint, receiver):
+    # Test that a sweep posts the subscriber's status changes as one batch, signed with the endpoint's secret
+    sweep_with_all_sites_up()
+
+    assert len(receiver.received) == 1
+    headers, body = receiver.received[0]
+    assert headers[SIGNATURE_HEADER] == 'sha256=' + sign(endpoint.secret, headers[TIMESTAMP_HEADER], body)
+    events = json.loads(body)['events']
+    assert [(event['url'], event['status']) for event in events] == [('https://example1.com', 'up')]
+
+
+def test_failed_deliveries_are_retried_then_dead_lettered(app, endpoint, receiver, monkeypatch):
+    # Test that 5xx answers are retried with the same delivery id and the batch is dead-lettered after the last retry
+    monkeypatch.setitem(app.config, 'WEBHOOK_MAX_RETRIES', 2)
+    monkeypatch.setitem(app.config, 'WEBHOOK_RETRY_BACKOFF', 0)
+    receiver.statuses.extend([500, 503, 500])
+
+    with patch('app.main.webhooks.dead_letter') as dead_letter:
+        sweep_with_all_sites_up()
+
+    assert len(receiver.received) == 3
+    assert len({json.loads(body)['delivery_id'] for _, body in receiver.received}) == 1
+    dead_letter.assert_called_once()
+    assert dead_letter.call_args.args[3] == 'HTTP 500'
+
+
+@pytest.mark.parametrize('url', ['http://127.0.0.1:6379/', 'http://169.254.169.254/latest/meta-data/',
+                                 'http://10.0.0.5/hook', 'http://[::1]/hook', 'http://[::ffff:192.168.1.1]/hook'])
+def test_webhooks_to_internal_addresses_are_refused(app, url):
+    # Test that webhook URLs resolving into loopback, link-local or private ranges are refused
+    with pytest.raises(UnsafeDestination):
+        check_destination(url)
+
+
+def test_deliveries_recheck_the_destination(endpoint, receiver, app, monkeypatch):
+    # Test that a delivery to an endpoint that now resolves to an internal address is dropped without a request
+    monkeypatch.setitem(app.config, 'WEBHOOK_ALLOW_LOOPBACK', False)
+    with patch('app.main.webhooks.dead_letter') as dead_letter:
+        sweep_with_all_sites_up()
+
+    assert receiver.received == []
+    assert 'non-public address' in dead_letter.call_args.args[3]
+
+
+def test_deliveries_check_the_address_they_connect_to(endpoint, receiver, app, monkeypatch):
+    # Test that a host answering the check with a public address and the connection with loopback (DNS rebinding)
+    # gets nothing delivered
+    monkeypatch.setitem(app.config, 'WEBHOOK_ALLOW_LOOPBACK', False)
+    endpoint.url = receiver.url.replace('127.0.0.1', 'rebind.example.com')
+    db.session.commit()
+    answers = iter(['93.184.216.34'])
+    real_getaddrinfo = socket.getaddrinfo
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        if host != 'rebind.example.com':
+            return real_getaddrinfo(host, port, *args, **kwargs)
+        address = next(answers, '127.0.0.1')
+        return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', (address, port))]
+
+    with patch('socket.getaddrinfo', getaddrinfo), patch('app.main.webhooks.dead_letter') as dead_letter:
+        sweep_with_all_sites_up()
+
+    assert receiver.received == []
+    assert 'non-public address 127.0.0.1' in dead_letter.call_args.args[3]
+
+
+def test_retry_after_is_capped(app, endpoint):
+    # Test that a receiver cannot push a retry past WEBHOOK_RETRY_BACKOFF_MAX (and the broker's visibility timeout)
+    with patch('app.main.webhooks.post_batch', side_effect=DeliveryFailed('HTTP 503', retry_after=10 ** 6)), \
+            patch.object(deliver_webhook, 'retry', return_value=RuntimeError('retry')) as retry:
+        with pytest.raises(RuntimeError):
+            deliver_webhook.run(endpoint.id, 'delivery', [])
+
+    assert retry.call_args.kwargs['countdown'] == app.config['WEBHOOK_RETRY_BACKOFF_MAX']
+    assert app.config['WEBHOOK_RETRY_BACKOFF_MAX'] < app.config['CELERY_BROKER_TRANSPORT_OPTIONS']['visibility_timeout']
@@ -1,7 +1,25 @@
+import gzip
+import re
+from unittest.mock import patch
+
 import pytest
 from click.testing import CliRunner
 from bs4 import BeautifulSoup
+from celery.signals import worker_init
 from flask_login import current_user
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+
+from app import viewcache
+from app.assets import fingerprints
+from app.compression import CompressionMiddleware
+from app.main.health import bump_status_version
+from app.main.routes import check_website
+from app.extensions import db
+from app.models.user import User
+from app.models.userwebsite import UserWebsite
+from app.models.website import Website
+from app.warmup import warm_up
 
 # app_context helps to isolate the tests from each other and prevent the side effects from affecting the other tests.
 
@@ -148,3 +166,260 @@ def test_protected_route_logged_in(client, init_test_db):
     # Check if the user cannot access the protected route
     assert response.status_code == 403
     assert b"Forbidden" in response.data
+
+
+def test_metrics_endpoint(client):
+    # Requests are timed per endpoint and exported in the Prometheus text format
+    client.get('/auth/login')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert b'watchdog_http_request_duration_seconds_count{endpoint="auth.login"' in response.data
+
+
+def test_celery_workers_start_with_an_empty_metrics_dir(tmp_path, monkeypatch):
+    # Sample files left by a previous run are deleted when a Celery worker starts, before its pool processes do
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmp_path / 'celery'))
+    (tmp_path / 'celery').mkdir()
+    (tmp_path / 'celery' / 'counter_123.db').write_bytes(b'stale')
+    (tmp_path / 'celery' / 'README').write_text('kept')
+    worker_init.send(sender=None)
+    assert [path.name for path in (tmp_path / 'celery').iterdir()] == ['README']
+
+
+def test_health_check(client, init_test_db):
+    # The liveness path answers without touching any backing service
+    response = client.get('/health')
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'alive'
+
+    # The deep check reports every component and stays 200 while the database is reachable
+    response = client.get('/health?deep=1')
+    assert response.status_code == 200
+    assert response.get_json()['components']['database']['status'] == 'ok'
+
+
+def test_status_stream(client, init_test_db):
+    # The stream requires a login and answers with an event stream that starts with the reconnect delay
+    assert client.get('/stream').status_code == 302
+
+    csrf_token = get_csrf_token(client.get('/auth/login'))
+    client.post('/auth/login', data=dict(email='user1@example.com', password='password1', csrf_token=csrf_token),
+                content_type='application/x-www-form-urlencoded', follow_redirects=True)
+    client.application.config['SSE_MAX_DURATION'] = 0
+
+    response = client.get('/stream')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert response.get_data(as_text=True).startswith('retry:')
+
+
+def test_websites_api(client, init_test_db):
+    # The API answers 401 instead of redirecting to the login form
+    assert client.get('/api/v1/websites').status_code == 401
+
+    csrf_token = get_csrf_token(client.get('/auth/login'))
+    client.post('/auth/login', data=dict(email='user1@example.com', password='password1', csrf_token=csrf_token),
+                content_type='application/x-www-form-urlencoded', follow_redirects=True)
+
+    response = client.get('/api/v1/websites')
+    assert response.status_code == 200
+    assert [website['url'] for website in response.get_json()['websites']] == ['https://example1.com']
+    assert response.headers['Cache-Control'].startswith('private')
+    etag = response.headers['ETag']
+
+    # Revalidating with the ETag skips the payload
+    response = client.get('/api/v1/websites', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+
+
+def test_websites_api_etag_survives_eviction(client, init_test_db):
+    # ETags change with every bump of the status version, and never match again once Redis evicted the version
+    store = {}
+
+    class FakeRedis:
+        def set(self, key, value, nx=False):
+            if not (nx and key in store):
+                store[key] = value.encode()
+
+        def get(self, key):
+            return store.get(key)
+
+        def pipeline(self, transaction=True):
+            return FakePipeline()
+
+    class FakePipeline:
+        def __init__(self):
+            self.calls = []
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            pass
+
+        def __getattr__(self, name):
+            return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+        def execute(self):
+            return [getattr(FakeRedis(), name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+    csrf_token = get_csrf_token(client.get('/auth/login'))
+    client.post('/auth/login', data=dict(email='user1@example.com', password='password1', csrf_token=csrf_token),
+                content_type='application/x-www-form-urlencoded', follow_redirects=True)
+    with patch('app.api.routes.redis_store', FakeRedis()), patch('app.main.health.redis_store', FakeRedis()):
+        etag = client.get('/api/v1/websites').headers['ETag']
+        assert client.get('/api/v1/websites', headers={'If-None-Match': etag}).status_code == 304
+
+        bump_status_version()
+        response = client.get('/api/v1/websites', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        etag = response.headers['ETag']
+
+        store.clear()
+        assert client.get('/api/v1/websites', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_fingerprinted_assets(client, init_test_db):
+    # Pages link their scripts by content hash, and those URLs are served as immutable
+    csrf_token = get_csrf_token(client.get('/auth/login'))
+    client.post('/auth/login', data=dict(email='user1@example.com', password='password1', csrf_token=csrf_token),
+                content_type='application/x-www-form-urlencoded', follow_redirects=True)
+    page = client.get('/').get_data(as_text=True)
+    match = re.search(r'src="(/assets/js/dashboard\.[0-9a-f]{12}\.js)"', page)
+    assert match
+
+    response = client.get(match.group(1))
+    assert response.status_code == 200
+    assert 'immutable' in response.headers['Cache-Control']
+
+    # A hash from an older deploy still resolves, but is not cached for good
+    response = client.get('/assets/js/dashboard.000000000000.js')
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert client.get('/assets/js/dashboard.js').status_code == 404
+
+
+def test_dashboard_query_budget(client, init_test_db, query_budget):
+    # Test that the dashboard runs the same few statements however many websites the user watches (no N+1)
+    user = User.query.filter_by(email='user1@example.com').one()
+    for n in range(20):
+        website = Website(url=f'https://budget{n}.example.com')
+        db.session.add(website)
+        db.session.flush()
+        db.session.add(UserWebsite(user_id=user.id, website_id=website.id))
+    db.session.commit()
+    csrf_token = get_csrf_token(client.get('/auth/login'))
+    client.post('/auth/login', data=dict(email='user1@example.com', password='password1', csrf_token=csrf_token),
+                content_type='application/x-www-form-urlencoded')
+
+    with query_budget(2):
+        response = client.get('/')
+    assert response.data.count(b'budget') == 20
+
+
+def test_warm_up_compiles_templates(app):
+    # Test that the warm-up leaves every page template compiled and the asset hashes computed
+    warm_up(app)
+    compiled = {name for _, name in app.jinja_env.cache.keys()}
+    assert {'dashboard.html', 'auth/login.html', 'auth/admin.html'} <= compiled
+    assert 'js/dashboard.js' in fingerprints._digests
+
+
+def test_response_compression(client, init_test_db):
+    # Pages are gzipped for clients that accept it, and the ETag-validated API still answers 304
+    response = client.get('/auth/login', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert b'csrf_token' in gzip.decompress(response.data)
+    assert 'Content-Encoding' not in client.get('/auth/login').headers
+
+    # HEAD is negotiated like GET, so caches see the same representation headers
+    head = client.head('/auth/login', headers={'Accept-Encoding': 'gzip'})
+    assert head.headers['Content-Encoding'] == 'gzip' and head.headers['Vary'] == response.headers['Vary']
+    assert head.data == b''
+
+    # Streamed bodies are compressed chunk by chunk; bodies under the threshold are left alone
+    def app(environ, start_response):
+        if environ['PATH_INFO'] == '/small':
+            return Response('tiny', mimetype='text/plain')(environ, start_response)
+        return Response((f'line {n}\n' for n in range(1000)), mimetype='text/plain')(environ, start_response)
+
+    compressed = Client(CompressionMiddleware(app, min_size=100))
+    response = compressed.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == ''.join(f'line {n}\n' for n in range(1000)).encode()
+    response = compressed.get('/small', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers and response.data == b'tiny'
+
+
+def test_view_cache(app, client, init_test_db):
+    # The second visitor gets the cached login page, with a CSRF token of their own that logs them in
+    first = get_csrf_token(client.get('/auth/login'))
+    with patch('app.auth.routes.render_template') as render:
+        with app.test_client() as other:
+            response = other.get('/auth/login')
+            token = get_csrf_token(response)
+            assert token != first and viewcache.CSRF_HOLE not in response.get_data(as_text=True)
+            response = other.post('/auth/login', data=dict(email='user1@example.com', password='password1',
+                                                           csrf_token=token))
+            assert response.status_code == 302
+    render.assert_not_called()
+
+    # Invalidation drops the page
+    viewcache.invalidate('auth.login')
+    with patch('app.auth.routes.render_template', return_value='fresh') as render:
+        assert client.get('/auth/login').data == b'fresh'
+    render.assert_called_once()
+
+
+def test_view_cache_ignores_unexpected_query_strings(app, client, init_test_db):
+    # Made-up query strings are rendered, not cached, so they cannot grow the cache
+    backend = app.extensions['view_cache']
+    client.get('/auth/login')
+    with patch('app.auth.routes.render_template', return_value='uncached') as render:
+        assert client.get('/auth/login?cache-buster=1').data == b'uncached'
+        assert client.get('/auth/login').data != b'uncached'
+    render.assert_called_once()
+    assert [key for key in backend._entries if key.startswith('auth.login:')] == ['auth.login:anon:/auth/login?']
+
+
+def test_view_cache_survives_redis_errors(app):
+    # A Redis outage is logged and counted by every operation of the Redis backend, never raised
+    backend = viewcache.RedisBackend()
+    with app.app_context(), patch('app.viewcache.redis_store') as redis_mock, \
+            patch('app.viewcache.ERRORS') as errors:
+        redis_mock.get.side_effect = redis_mock.pipeline.side_effect = redis_mock.smembers.side_effect = \
+            ConnectionError('down')
+        assert backend.get('auth.login:anon:/auth/login?') is None
+        backend.set('auth.login:anon:/auth/login?', 'auth.login', (200, [], 'page'), 60)
+        backend.invalidate('auth.login')
+    assert errors.labels.return_value.inc.call_count == 3
+
+
+def test_check_now_coalesces_requests(client, init_test_db):
+    # Concurrent "check now" requests for one website enqueue a single probe; a fresh result is reused
+    csrf_token = get_csrf_token(client.get('/auth/login'))
+    client.post('/auth/login', data=dict(email='user1@example.com', password='password1', csrf_token=csrf_token),
+                content_type='application/x-www-form-urlencoded', follow_redirects=True)
+    website = Website.query.filter_by(url='https://example1.com').one()
+    csrf_token = get_csrf_token(client.get('/'))
+
+    with patch('app.main.checks.redis_store') as redis_mock, patch('app.main.routes.check_website.delay') as delay:
+        redis_mock.set.side_effect = [True, None, None]  # SET NX: only the first request takes the key
+        responses = [client.post(f'/api/v1/websites/{website.id}/check', data={'csrf_token': csrf_token})
+                     for _ in range(3)]
+    assert [response.get_json()['state'] for response in responses] == ['queued', 'in_progress', 'in_progress']
+    assert responses[0].status_code == 202
+    delay.assert_called_once_with(website.id)
+
+    # The probe task stores the result and releases the key; the result is then served without probing
+    with patch('app.main.checks.redis_store') as redis_mock, \
+            patch('app.main.probes.check_url_status', return_value=True), \
+            patch('app.main.routes.send_email'), patch('app.main.routes.publish_status_change'):
+        check_website(website.id)
+        redis_mock.delete.assert_called_once()
+        response = client.post(f'/api/v1/websites/{website.id}/check', data={'csrf_token': csrf_token})
+    assert response.status_code == 200
+    assert response.get_json()['state'] == 'fresh' and response.get_json()['status'] == 'up'
+    assert client.post('/api/v1/websites/9999/check', data={'csrf_token': csrf_token}).status_code == 404
@@ -0,0 +1,75 @@
+from unittest.mock import patch
+
+from bs4 import BeautifulSoup
+
+from app.games import leaderboard
+from app.models.user import User
+
+
+def get_csrf_token(response):
+    soup = BeautifulSoup(response.data, 'html.parser')
+    return soup.find("input", {"name": "csrf_token"})['value']
+
+
+def login(client, email='user1@example.com', password='password1'):
+    csrf_token = get_csrf_token(client.get('/auth/login'))
+    client.post('/auth/login', data=dict(email=email, password=password, csrf_token=csrf_token),
+                content_type='application/x-www-form-urlencoded', follow_redirects=True)
+    return csrf_token
+
+
+def test_save_score_keeps_best_score(client, init_test_db):
+    # Test that a lower or repeated submission never lowers the persisted high score
+    csrf_token = login(client)
+    headers = {'X-CSRFToken': csrf_token}
+
+    response = client.post('/games/api/save-score', json={'score': 50}, headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['high_score'] == 50
+
+    for score in (30, 50):
+        response = client.post('/games/api/save-score', json={'score': score}, headers=headers)
+        assert response.get_json()['high_score'] == 50
+        assert response.get_json()['message'] == 'Score recorded'
+
+    # The game page shows the persisted high score
+    assert b'data-high-score="50"' in client.get('/games/dino-runner').data
+
+
+def test_save_score_rejects_invalid_scores(client, init_test_db):
+    csrf_token = login(client)
+    response = client.post('/games/api/save-score', json={'score': 'lots'}, headers={'X-CSRFToken': csrf_token})
+    assert response.status_code == 400
+
+
+def test_leaderboard_page_cache_is_bounded(app):
+    # Test that pages past the end are not cached and that the cache evicts its least recently used pages
+    app.config['LEADERBOARD_CACHE_MAX_PAGES'] = 2
+    leaderboard._page_cache.clear()
+    with app.app_context(), patch('app.games.leaderboard.redis_store') as redis_mock:
+        redis_mock.zrevrange.return_value = []
+        for page in range(1, 100):
+            assert leaderboard.top('dino', page) == []
+        assert not leaderboard._page_cache
+
+        redis_mock.zrevrange.return_value = [(b'1', 50.0)]
+        redis_mock.hmget.return_value = [b'us***@example.com']
+        for page in (1, 2, 3):
+            leaderboard.top('dino', page)
+        assert list(leaderboard._page_cache) == [('dino', 2, 10), ('dino', 3, 10)]
+    leaderboard._page_cache.clear()
+
+
+def test_leaderboard_does_not_touch_the_database(client, init_test_db, query_budget):
+    # Test that a logged-in player gets the leaderboard and their rank from Redis alone
+    login(client)
+    user_id = User.query.filter_by(email='user1@example.com').one().id
+    leaderboard._page_cache.clear()
+    with patch('app.games.leaderboard.redis_store') as redis_mock, query_budget(0):
+        redis_mock.zrevrange.return_value = [(str(user_id).encode(), 50.0)]
+        redis_mock.hmget.return_value = [b'us***@example.com']
+        redis_mock.zrevrank.return_value = 0
+        response = client.get('/games/api/leaderboard')
+    assert response.get_json()['your_rank'] == 1
+    redis_mock.zrevrank.assert_called_once_with('leaderboard:dino-runner', user_id)
+    leaderboard._page_cache.clear()